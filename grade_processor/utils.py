@@ -75,22 +75,34 @@ def ans_matrix(img):
         matrix.append(col)
     return matrix
 
+def bubble_fill_ratios(img, num_rows=20, num_cols=5):
+    """
+    Fraction of white pixels in every cell of a thresholded answer grid.
+
+    The whole grid is split into num_rows x num_cols cells along evenly
+    spaced edges (cells differ by at most one pixel when the size does not
+    divide evenly). Cell counts come from one integral image, four lookups
+    per cell, instead of one countNonZero per cell.
+
+    Returns:
+        float32 array of shape (rows, cols)
+    """
+    img = np.asarray(img)
+    height, width = img.shape
+    row_edges = np.linspace(0, height, num_rows + 1).astype(int)
+    col_edges = np.linspace(0, width, num_cols + 1).astype(int)
+
+    integral = cv2.integral((img != 0).view(np.uint8))
+    corners = integral[np.ix_(row_edges, col_edges)]
+    counts = corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+    areas = np.outer(np.diff(row_edges), np.diff(col_edges))
+
+    return (counts / areas).astype(np.float32)
+
+
 def ans_matrix_val(img):
-    return_mat = []
-    matrix = ans_matrix(img)
-    for row in matrix:
-        temp_col_values = []
-        for col in row:
-            white_pixels = cv2.countNonZero(col)
-            total_pixels = col.size
-            if(white_pixels > ((20/100)*total_pixels)):
-                temp_col_values.append(1)
-            else:
-                temp_col_values.append(0)
-            # print(f"{white_pixels},{total_pixels}", end=" ")
-        # print()
-        return_mat.append(temp_col_values)
-    return return_mat
+    # 1 where more than 20% of the cell is filled
+    return (bubble_fill_ratios(img, 20, 5) > 0.2).astype(int).tolist()
 
 def qr_decoder(img):
     detector = cv2.QRCodeDetector()
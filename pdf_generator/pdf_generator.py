@@ -177,6 +177,132 @@ def generate_test_pdf(json_file, output_pdf):
     print(f"PDF generat cu succes: {output_pdf}")
 
 
+# Version of the answer-sheet layout emitted by generate_test_pdf_from_db.
+# Bump it whenever the answer page geometry changes, so sheets printed with
+# an older layout can still be decoded with the template they were printed from.
+#   2: coordinates relative to the answer grid rectangle
+#   3: corner fiducial markers, coordinates relative to the marker centers
+LAYOUT_VERSION = 3
+
+# Width (in pixels) the OMR pipeline warps the sheet to before sampling;
+# the height follows the aspect ratio of the layout frame
+LAYOUT_SAMPLE_WIDTH = 550
+
+# Solid square fiducial markers printed in the page corners
+FIDUCIAL_SIZE = 0.8 * cm
+FIDUCIAL_INSET = 1 * cm  # Distance from the page edges to the marker centers
+
+# Prefix of the answer-sheet QR payload "SG:<test id>:<layout version>".
+# Sheets printed before the prefix existed carry only the test id.
+SHEET_QR_PREFIX = 'SG'
+
+
+def answer_sheet_geometry(num_questions, num_options):
+    """
+    Compute where everything on the answer page is drawn.
+
+    All values are in PDF points with the origin at the bottom-left corner
+    of an A4 page, exactly as passed to the canvas drawing calls.
+    """
+    width, height = A4
+    margin = 2 * cm
+
+    y_title = height - margin
+    y_name = y_title - 1.5 * cm
+    y_surname = y_name - 1.8 * cm
+    y_grid = y_surname - 1.5 * cm
+
+    row_height = 1 * cm
+    x_start = margin + 2 * cm
+    circle_spacing = 1.2 * cm
+    box_height = num_questions * row_height + 0.3 * cm
+    rect_width = num_options * circle_spacing + 0.2 * cm
+
+    return {
+        'page': (width, height),
+        'margin': margin,
+        'y_title': y_title,
+        'y_name': y_name,
+        'y_surname': y_surname,
+        'y_grid': y_grid,
+        # Name boxes sized to not overlap the QR code: (x, y, width, height)
+        'qr_box': (350, 650, 150, 150),
+        'name_box': (margin + 2.5 * cm, y_name - 0.4 * cm, 7 * cm, 1.2 * cm),
+        'surname_box': (margin + 2.5 * cm, y_surname - 0.4 * cm, 7 * cm, 1.2 * cm),
+        # Answer grid rectangle: (x, y, width, height)
+        'grid_box': (x_start - 0.7 * cm, y_grid - box_height - 0.3 * cm, rect_width, box_height),
+        'option_x': [x_start + j * circle_spacing for j in range(num_options)],
+        'question_y': [y_grid - 0.8 * cm - i * row_height for i in range(num_questions)],
+        'bubble_radius': 0.3 * cm,
+        # Fiducial marker centers: top-left, top-right, bottom-right, bottom-left
+        'fiducials': [
+            (FIDUCIAL_INSET, height - FIDUCIAL_INSET),
+            (width - FIDUCIAL_INSET, height - FIDUCIAL_INSET),
+            (width - FIDUCIAL_INSET, FIDUCIAL_INSET),
+            (FIDUCIAL_INSET, FIDUCIAL_INSET),
+        ],
+        'fiducial_size': FIDUCIAL_SIZE,
+    }
+
+
+def sheet_qr_payload(test_id):
+    """Text encoded in the QR code of a test's answer sheet"""
+    return f"{SHEET_QR_PREFIX}:{test_id}:{LAYOUT_VERSION}"
+
+
+def answer_sheet_layout(num_questions, num_options):
+    """
+    Build the versioned layout template for an answer page.
+
+    Coordinates are normalized to the frame spanned by the fiducial marker
+    centers: (0, 0) is the top-left marker and (1, 1) the bottom-right one,
+    with y growing downwards like image rows. The answer grid rectangle is
+    included so sheets can still be located by their grid when the markers
+    are not visible.
+
+    Returns:
+        JSON-serializable dict with the bubble centers and radius, the
+        name/surname box ROIs, the grid rectangle and the marker size
+    """
+    geometry = answer_sheet_geometry(num_questions, num_options)
+    (left, top), _, (right, bottom), _ = geometry['fiducials']
+    frame_w = right - left
+    frame_h = top - bottom
+
+    def point(x, y):
+        return [round((x - left) / frame_w, 5), round((top - y) / frame_h, 5)]
+
+    def roi(rect):
+        x, y, w, h = rect
+        return point(x, y + h) + point(x + w, y)
+
+    return {
+        'version': LAYOUT_VERSION,
+        'num_questions': num_questions,
+        'num_options': num_options,
+        'frame': {'width': round(frame_w, 2), 'height': round(frame_h, 2)},
+        'sample_size': [LAYOUT_SAMPLE_WIDTH, int(round(LAYOUT_SAMPLE_WIDTH * frame_h / frame_w))],
+        'fiducials': {
+            'size': [
+                round(geometry['fiducial_size'] / frame_w, 5),
+                round(geometry['fiducial_size'] / frame_h, 5),
+            ],
+        },
+        'grid_box': roi(geometry['grid_box']),
+        'bubbles': {
+            'centers': [[point(x, y) for x in geometry['option_x']] for y in geometry['question_y']],
+            'radius': [
+                round(geometry['bubble_radius'] / frame_w, 5),
+                round(geometry['bubble_radius'] / frame_h, 5),
+            ],
+        },
+        'name_boxes': {
+            'first_name': roi(geometry['name_box']),
+            'last_name': roi(geometry['surname_box']),
+        },
+    }
+
+
 def generate_test_pdf_from_db(test_obj, output_pdf):
     """
     Generate a PDF from a Test database object.
@@ -184,6 +310,10 @@ def generate_test_pdf_from_db(test_obj, output_pdf):
     Args:
         test_obj: Test model instance with questions in JSON format
         output_pdf: Path where the PDF will be saved
+
+    Returns:
+        The answer-sheet layout template (see answer_sheet_layout), to be
+        stored with the Test so the OMR pipeline can decode these sheets
     """
     # Get font paths relative to this file
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -200,79 +330,62 @@ def generate_test_pdf_from_db(test_obj, output_pdf):
     width, height = A4
     margin = 2 * cm
 
+    num_questions = test_obj.num_questions
+    num_answers = test_obj.num_options
+    geometry = answer_sheet_geometry(num_questions, num_answers)
+
     # First page - Answer grid
-    y_position = height - margin
+    y_position = geometry['y_title']
 
     # Title
     c.setFont(font_bold, 18)
     c.drawString(margin, y_position, test_obj.title)
 
     # QR code
-    qr = qrcode.make(str(test_obj.id))
+    qr = qrcode.make(sheet_qr_payload(test_obj.id))
     qr_path = f"qr_{test_obj.id}.png"
     qr.save(qr_path)
-    c.drawImage(qr_path, 350, 650, width=150, height=150)
+    qr_x, qr_y, qr_w, qr_h = geometry['qr_box']
+    c.drawImage(qr_path, qr_x, qr_y, width=qr_w, height=qr_h)
     os.remove(qr_path)
 
-    y_position -= 1.5 * cm
+    # Corner fiducials used by the OMR pipeline to locate the page
+    marker = geometry['fiducial_size']
+    for x, y in geometry['fiducials']:
+        c.rect(x - marker / 2, y - marker / 2, marker, marker, stroke=0, fill=1)
 
     # Student name fields with boxes (sized to not overlap QR code)
     c.setFont(font_bold, 11)
 
     # Name field
-    c.drawString(margin, y_position, "Name:")
-    name_box_x = margin + 2.5 * cm
-    name_box_y = y_position - 0.4 * cm
-    name_box_width = 7 * cm  # Reduced to avoid QR code overlap
-    name_box_height = 1.2 * cm  # Increased height for better handwriting space
-    c.rect(name_box_x, name_box_y, name_box_width, name_box_height)
-
-    y_position -= 1.8 * cm
+    c.drawString(margin, geometry['y_name'], "Name:")
+    c.rect(*geometry['name_box'])
 
     # Surname field
-    c.drawString(margin, y_position, "Surname:")
-    surname_box_x = margin + 2.5 * cm
-    surname_box_y = y_position - 0.4 * cm
-    surname_box_width = 7 * cm  # Reduced to avoid QR code overlap
-    surname_box_height = 1.2 * cm  # Increased height for better handwriting space
-    c.rect(surname_box_x, surname_box_y, surname_box_width, surname_box_height)
-
-    y_position -= 1.5 * cm
+    c.drawString(margin, geometry['y_surname'], "Surname:")
+    c.rect(*geometry['surname_box'])
 
     # Answer grid
-    row_height = 1 * cm
-    num_questions = test_obj.num_questions
-    num_answers = test_obj.num_options
-    box_height = (num_questions * row_height + 0.3 * cm)
-
-    x_start = margin + 2 * cm
-    circle_spacing = 1.2 * cm
-    rect_width = (num_answers * circle_spacing) + 0.2 * cm
+    y_position = geometry['y_grid']
 
     # Draw rectangle
-    c.rect(x_start - 0.7 * cm, y_position - box_height - 0.3 * cm, rect_width, box_height)
+    c.rect(*geometry['grid_box'])
 
     # Draw option letters above grid
     c.setFont(font_bold, 10)
-    for i in range(num_answers):
+    for i, x_pos in enumerate(geometry['option_x']):
         letter = chr(65 + i)
-        x_pos = x_start + (i * circle_spacing)
         text_width = c.stringWidth(letter, font_bold, 10)
         c.drawString(x_pos - text_width / 2, y_position + 0.1 * cm, letter)
 
-    y_position -= 0.8 * cm
-
     # Draw question numbers and answer circles
-    for i in range(num_questions):
+    for i, y_position in enumerate(geometry['question_y']):
         q_num = i + 1
         c.setFont(font_regular, 10)
         c.drawString(margin + 0.5 * cm, y_position - 0.1 * cm, f"{q_num}.")
 
-        for j in range(num_answers):
-            x_pos = x_start + (j * circle_spacing)
-            c.circle(x_pos, y_position, 0.3 * cm, stroke=1, fill=0)
-
-        y_position -= row_height
+        for x_pos in geometry['option_x']:
+            c.circle(x_pos, y_position, geometry['bubble_radius'], stroke=1, fill=0)
 
     # New page - Questions
     c.showPage()
@@ -343,7 +456,7 @@ def generate_test_pdf_from_db(test_obj, output_pdf):
         y_position -= 0.5 * cm
 
     c.save()
-    return output_pdf
+    return answer_sheet_layout(num_questions, num_answers)
 
 
 # Example usage with JSON file (original function)
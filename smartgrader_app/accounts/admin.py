@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Profile, Test
+from .models import CustomUser, Profile, Test, GradingJob
 
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
@@ -32,3 +32,11 @@ class TestAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at')
 
 admin.site.register(Test, TestAdmin)
+
+
+class GradingJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'created_by', 'test', 'status', 'processed_sheets', 'total_sheets', 'attempts', 'created_at')
+    list_filter = ('status', 'created_at')
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'lease_owner', 'lease_expires_at')
+
+admin.site.register(GradingJob, GradingJobAdmin)
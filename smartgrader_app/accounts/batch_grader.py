@@ -0,0 +1,189 @@
+"""
+Batch OMR grading engine.
+
+Runs the per-sheet OMR pipeline (decode, localize, threshold, detect, OCR)
+for many answer sheets at once using a pool of workers. Results are always
+returned in the same order as the input sheets.
+
+Mixed stacks of sheets for several tests are first routed by the QR code
+printed on each sheet (route_sheets / group_sheets_by_route).
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import cv2
+
+from .omr_processor import process_omr_image, read_sheet_qr
+
+POOL_MODES = ('process', 'thread')
+
+# Seconds between heartbeat calls while waiting on a sheet
+HEARTBEAT_SECONDS = 5.0
+
+
+def default_worker_count():
+    """Number of workers to use when none is configured (one per CPU core)"""
+    return os.cpu_count() or 1
+
+
+def _init_worker(cv_threads):
+    """Pool initializer: limit OpenCV's own threads inside each worker"""
+    cv2.setNumThreads(cv_threads)
+
+
+def _process_sheet(task):
+    """Run the OMR pipeline for one (source, num_questions, num_options, layout, reduction) task"""
+    source, num_questions, num_options, layout, reduction = task
+    return process_omr_image(source, num_questions, num_options, layout=layout, reduction=reduction)
+
+
+def _sendable(source, mode):
+    """
+    Image sources handed to worker processes must be picklable: in-memory
+    buffers (memoryview) are copied to bytes once for the pipe, while threads
+    and inline runs decode them in place
+    """
+    if mode == 'process' and isinstance(source, memoryview):
+        return source.tobytes()
+    return source
+
+
+def _wait(future, heartbeat):
+    """Result of a future, calling heartbeat() every HEARTBEAT_SECONDS until it is ready"""
+    if heartbeat is None:
+        return future.result()
+    while True:
+        try:
+            return future.result(timeout=HEARTBEAT_SECONDS)
+        except FutureTimeout:
+            heartbeat()
+
+
+def _iter_pool(fn, tasks, workers, mode, cv_threads, max_pending, heartbeat=None):
+    """
+    Run fn over tasks in a worker pool, yielding results in task order
+
+    heartbeat, if given, is called before each inline task and while
+    waiting on the pool; an exception it raises stops the batch.
+    """
+    if mode not in POOL_MODES:
+        raise ValueError(f"Unknown pool mode '{mode}', expected one of {POOL_MODES}")
+
+    workers = workers or default_worker_count()
+
+    if workers <= 1:
+        for task in tasks:
+            if heartbeat is not None:
+                heartbeat()
+            yield fn(task)
+        return
+
+    max_pending = max_pending or workers * 2
+
+    if mode == 'process':
+        executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(cv_threads,)
+        )
+        previous_cv_threads = None
+    else:
+        # Threads share one OpenCV runtime, so limit it for the whole process
+        # while the batch runs and restore it afterwards
+        executor = ThreadPoolExecutor(max_workers=workers)
+        previous_cv_threads = cv2.getNumThreads()
+        cv2.setNumThreads(cv_threads)
+
+    try:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(fn, task))
+            if len(pending) >= max_pending:
+                yield _wait(pending.popleft(), heartbeat)
+
+        while pending:
+            yield _wait(pending.popleft(), heartbeat)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if previous_cv_threads is not None:
+            cv2.setNumThreads(previous_cv_threads)
+
+
+def iter_omr_batch(sources, num_questions=20, num_options=5, layout=None, workers=None,
+                   mode='process', cv_threads=1, max_pending=None, reduction=1, heartbeat=None):
+    """
+    Process answer sheets in parallel, yielding results in input order.
+
+    Args:
+        sources: Iterable of image sources accepted by process_omr_image
+        num_questions: Number of questions on the test
+        num_options: Number of options per question
+        layout: Answer-sheet layout template the sheets were printed with
+            (None for sheets printed before layouts existed)
+        workers: Pool size (None or 0 = one per CPU core, 1 = run inline)
+        mode: 'process' for a process pool, 'thread' for a thread pool
+        cv_threads: OpenCV thread count per worker, so workers x cv_threads
+            does not oversubscribe the cores
+        max_pending: Maximum number of sheets in flight at once
+            (defaults to 2 x workers), which bounds memory for long inputs
+        reduction: Decode images at 1/reduction resolution (1, 2, 4 or 8)
+        heartbeat: Optional function called regularly while sheets are read
+            (e.g. to renew a job lease); an exception it raises stops the batch
+
+    Yields:
+        The process_omr_image result dict for each source, in order
+    """
+    tasks = (
+        (_sendable(source, mode), num_questions, num_options, layout, reduction)
+        for source in sources
+    )
+    yield from _iter_pool(_process_sheet, tasks, workers, mode, cv_threads, max_pending, heartbeat)
+
+
+def process_omr_batch(sources, num_questions=20, num_options=5, layout=None, workers=None,
+                      mode='process', cv_threads=1, reduction=1):
+    """
+    Process a batch of answer sheets in parallel.
+
+    Returns:
+        List of process_omr_image result dicts, in the same order as sources
+    """
+    return list(iter_omr_batch(
+        sources, num_questions, num_options, layout=layout,
+        workers=workers, mode=mode, cv_threads=cv_threads, reduction=reduction
+    ))
+
+
+def route_sheets(sources, workers=None, mode='process', cv_threads=1, heartbeat=None):
+    """
+    Read the QR code of every sheet in parallel.
+
+    heartbeat is called regularly while the codes are read (see iter_omr_batch).
+
+    Returns:
+        List of (test_id, layout_version) tuples, or None for sheets without
+        a readable SmartGrader QR code, in the same order as sources
+    """
+    sources = (_sendable(source, mode) for source in sources)
+    return list(_iter_pool(read_sheet_qr, sources, workers, mode, cv_threads, None, heartbeat))
+
+
+def group_sheets_by_route(sheets, routes):
+    """
+    Group sheets by the (test_id, layout_version) read from their QR code.
+
+    Args:
+        sheets: List of sheets (any items, e.g. (path, filename) tuples)
+        routes: route_sheets() result for the same sheets
+
+    Returns:
+        (groups, unrouted): dict of (test_id, layout_version) -> list of
+        sheets in input order, and the list of sheets with no route
+    """
+    groups = {}
+    unrouted = []
+    for sheet, route in zip(sheets, routes):
+        if route is None:
+            unrouted.append(sheet)
+        else:
+            groups.setdefault(route, []).append(sheet)
+    return groups, unrouted
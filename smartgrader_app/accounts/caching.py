@@ -0,0 +1,134 @@
+"""
+Versioned cache of derived pages and data.
+
+Cached values are keyed by the versions of the entities they are built
+from, e.g. a test's analytics by ('test', 12), a teacher's test list by
+('teacher', 3). Changing an entity only bumps its version (one cache
+operation); entries built from the old version are never read again and
+expire on their own. The versions are bumped by model signals on Test,
+Submission and TestEnrollment (see accounts.signals) once the change is
+committed, and by bulk updates that bypass the signals (rescoring).
+
+Entities:
+    test      a test, its submissions and their statistics
+    teacher   everything on a teacher's test list
+    student   a student's enrollments
+
+The backend is settings.CACHES['default'] (CACHE_BACKEND: locmem, file or
+redis). Hits and misses of every kind of value are counted in the cache
+itself, so with a shared backend cache_stats() covers all processes.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+
+# Kinds of cached values
+CACHE_KINDS = ('test-analytics', 'item-analysis', 'test-list', 'student-result', 'test-pdf')
+
+_MISSING = object()
+
+
+def _version_key(entity, entity_id):
+    return f"version:{entity}:{entity_id}"
+
+
+def _counter_key(kind, outcome):
+    return f"cache-stats:{kind}:{outcome}"
+
+
+def _new_version():
+    # Versions count up from the time they were first needed, so a counter
+    # that was evicted restarts above every version it handed out
+    return time.time_ns()
+
+
+def entity_versions(entities):
+    """Current version of each (entity, id), in one cache round trip"""
+    keys = [_version_key(entity, entity_id) for entity, entity_id in entities]
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, None)
+        versions.update(cache.get_many(list(missing)))
+    return [versions.get(key, missing.get(key)) for key in keys]
+
+
+def bump_entity(entity, entity_id):
+    """Invalidate every cached value built from an entity, once the current transaction commits"""
+    def bump():
+        key = _version_key(entity, entity_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+    transaction.on_commit(bump)
+
+
+def invalidate_test(test_id, teacher_id):
+    """Invalidate a test's cached values and its teacher's test list"""
+    bump_entity('test', test_id)
+    bump_entity('teacher', teacher_id)
+
+
+def versioned_key(kind, entities, *parts):
+    """Cache key of a value of `kind` built from `entities`, further told apart by `parts`"""
+    versions = entity_versions(entities)
+    key = ':'.join([kind] + [f"{entity}{entity_id}v{version}"
+                             for (entity, entity_id), version in zip(entities, versions)])
+    if parts:
+        key += ':' + hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+    return key
+
+
+def _count(kind, outcome):
+    key = _counter_key(kind, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def cached(kind, entities, compute, *parts, timeout=DEFAULT_TIMEOUT):
+    """
+    Cached value of compute(), rebuilt when any of `entities` changes
+
+    Args:
+        kind: Kind of value (one of CACHE_KINDS), for the key and counters
+        entities: (entity, id) pairs the value is built from
+        compute: Builds the value on a miss
+        parts: Further key parts (e.g. request parameters)
+        timeout: Seconds to keep the value (default: the cache's TIMEOUT)
+
+    Returns:
+        The value
+    """
+    key = versioned_key(kind, entities, *parts)
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _count(kind, 'hits')
+        return value
+
+    _count(kind, 'misses')
+    value = compute()
+    cache.set(key, value, timeout)
+    return value
+
+
+def cache_stats():
+    """Hits, misses and hit rate of every kind of cached value"""
+    counters = cache.get_many([_counter_key(kind, outcome) for kind in CACHE_KINDS for outcome in ('hits', 'misses')])
+    stats = {}
+    for kind in CACHE_KINDS:
+        hits = counters.get(_counter_key(kind, 'hits'), 0)
+        misses = counters.get(_counter_key(kind, 'misses'), 0)
+        stats[kind] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+    return stats
@@ -1,7 +1,6 @@
 from django.shortcuts import redirect
 from django.http import JsonResponse
 from functools import wraps
-from .models import Profile
 
 
 def teacher_required(view_func):
@@ -17,15 +16,9 @@ def teacher_required(view_func):
                 return JsonResponse({'error': 'Authentication required'}, status=401)
             return redirect('login')
 
-        # Get or create profile
-        try:
-            profile = Profile.objects.get(user=request.user)
-        except Profile.DoesNotExist:
-            # Create default student profile if doesn't exist
-            profile = Profile.objects.create(user=request.user, role='student')
-
-        # Check if user is a teacher
-        if profile.role != 'teacher':
+        # Check if user is a teacher (role resolved once per request, a
+        # student profile is created if missing, see accounts.middleware)
+        if request.profile_role != 'teacher':
             # For AJAX requests, return JSON error
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.content_type == 'application/json':
                 return JsonResponse({
@@ -53,15 +46,9 @@ def student_required(view_func):
                 return JsonResponse({'error': 'Authentication required'}, status=401)
             return redirect('login')
 
-        # Get or create profile
-        try:
-            profile = Profile.objects.get(user=request.user)
-        except Profile.DoesNotExist:
-            # Create default student profile if doesn't exist
-            profile = Profile.objects.create(user=request.user, role='student')
-
-        # Check if user is a student
-        if profile.role == 'teacher':
+        # Check if user is a student (role resolved once per request, see
+        # accounts.middleware)
+        if request.profile_role == 'teacher':
             # Redirect teachers to their test list
             return redirect('test-list')
 
@@ -0,0 +1,292 @@
+"""
+Streamed result exports.
+
+Exports are generated row by row while the response is being sent: the
+submissions are read in chunks with values_list (no model instances, and
+answers from their packed bytes rather than JSON), so memory stays flat
+and the first bytes go out immediately for classes of any size.
+
+The gradebook of several tests is one zip archive written on the fly
+(zipfile on a write-only stream, with data descriptors instead of seeking
+back), holding each test's results CSV, a student-by-test matrix and
+optionally the graded sheet images.
+"""
+import csv
+import os
+import time
+import zipfile
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.db.models import Case, CharField, Value, When
+from django.db.models.functions import Cast, Coalesce, Concat, Lower
+from django.utils.text import slugify
+
+from .models import PACKED_BLANK, PASS_PERCENTAGE, Submission, letter_grade, pack_answers, student_display_name
+
+# Rows fetched from the database per round trip
+EXPORT_CHUNK_SIZE = 2000
+
+# Archive bytes collected before they are sent on
+ZIP_STREAM_BUFFER_SIZE = 64 * 1024
+
+# Bytes of a sheet image copied into the archive at a time
+IMAGE_COPY_CHUNK_SIZE = 1024 * 1024
+
+OPTION_LETTERS = 'ABCDE'
+
+
+class Echo:
+    """File-like object whose write() returns the line, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def option_letters():
+    """Cell text of every packed answer byte (option letter, '-' for blank)"""
+    cells = [OPTION_LETTERS[i] if i < len(OPTION_LETTERS) else str(i) for i in range(256)]
+    cells[PACKED_BLANK] = '-'
+    return cells
+
+
+def iter_result_rows(test, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    A test's graded submissions, best first, as (values of `fields`,
+    packed answers) pairs
+    """
+    submissions = (
+        Submission.objects.filter(test=test, processed=True)
+        .order_by('-percentage', 'id')
+        .values_list('id', 'packed_answers', *fields)
+        .iterator(chunk_size=chunk_size)
+    )
+    while True:
+        chunk = list(islice(submissions, chunk_size))
+        if not chunk:
+            return
+        # Submissions not packed by the background backfill yet: one query
+        # per chunk for their JSON answers
+        unpacked = [row[0] for row in chunk if row[1] is None]
+        legacy = dict(Submission.objects.filter(id__in=unpacked).values_list('id', 'answers')) if unpacked else {}
+        for submission_id, packed, *values in chunk:
+            if packed is None:
+                packed = pack_answers(legacy.get(submission_id) or [])
+            yield values, packed
+
+
+def iter_results_csv(test, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    CSV lines of a test's results: one row per submission with its answers,
+    then summary statistics computed in the same pass
+
+    Yields:
+        Encoded CSV lines (str)
+    """
+    writer = csv.writer(Echo())
+    num_questions = test.num_questions
+    letters = option_letters()
+
+    yield writer.writerow(
+        ['Rank', 'First Name', 'Last Name', 'Score', 'Total', 'Percentage', 'Grade', 'Submitted At']
+        + [f'Q{i + 1}' for i in range(num_questions)]
+    )
+
+    count = score_sum = passed = 0
+    percentage_sum = 0.0
+    highest = lowest = None
+    fields = ('first_name', 'last_name', 'score', 'total_questions', 'percentage', 'submitted_at')
+    rows = iter_result_rows(test, fields, chunk_size)
+    for rank, ((first_name, last_name, score, total, percentage, submitted_at), packed) in enumerate(rows, start=1):
+        answers = [letters[answer] for answer in bytes(packed[:num_questions])]
+        answers += ['-'] * (num_questions - len(answers))
+        yield writer.writerow([
+            rank,
+            first_name or '',
+            last_name or '',
+            score,
+            total,
+            f'{percentage}%',
+            letter_grade(percentage),
+            submitted_at.strftime('%Y-%m-%d %H:%M'),
+        ] + answers)
+
+        count += 1
+        score_sum += score
+        percentage_sum += percentage
+        highest = score if highest is None else max(highest, score)
+        lowest = score if lowest is None else min(lowest, score)
+        passed += percentage >= PASS_PERCENTAGE
+
+    # Summary statistics, from the pass above
+    yield writer.writerow([])
+    yield writer.writerow(['SUMMARY STATISTICS'])
+    yield writer.writerow(['Total Submissions', count])
+    if count:
+        yield writer.writerow(['Average Score', f'{score_sum / count:.2f}/{num_questions}'])
+        yield writer.writerow(['Average Percentage', f'{percentage_sum / count:.2f}%'])
+        yield writer.writerow(['Highest Score', highest])
+        yield writer.writerow(['Lowest Score', lowest])
+        yield writer.writerow(['Pass Rate (≥60%)', f'{passed}/{count} ({passed / count * 100:.1f}%)'])
+
+
+def student_key():
+    """
+    Expression identifying a submission's student: the linked account, or
+    the name read from the sheet
+    """
+    return Case(
+        When(student_user__isnull=False, then=Concat(Value('user:'), Cast('student_user_id', CharField()))),
+        default=Concat(
+            Value('name:'),
+            Lower(Coalesce('first_name', Value(''))), Value('|'), Lower(Coalesce('last_name', Value(''))),
+            output_field=CharField(),
+        ),
+    )
+
+
+def iter_gradebook_csv(tests, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    CSV lines of a student-by-test matrix: one row per student with their
+    best percentage on every test, and their average
+
+    Submissions are read ordered by student, so only one student's row is
+    held at a time.
+
+    Yields:
+        Encoded CSV lines (str)
+    """
+    writer = csv.writer(Echo())
+    columns = {test.id: i for i, test in enumerate(tests)}
+    yield writer.writerow(['Student', 'Email'] + [test.title for test in tests] + ['Average'])
+
+    submissions = (
+        Submission.objects.filter(test_id__in=list(columns), processed=True)
+        .annotate(student=student_key())
+        .order_by('student', 'test_id')
+        .values_list(
+            'student', 'test_id', 'percentage', 'first_name', 'last_name',
+            'student_user__first_name', 'student_user__last_name', 'student_user__email',
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+
+    def student_row(name, email, cells):
+        taken = [cell for cell in cells if cell is not None]
+        average = f'{sum(taken) / len(taken):.2f}' if taken else ''
+        return writer.writerow([name, email] + ['' if cell is None else cell for cell in cells] + [average])
+
+    current = None
+    for student, test_id, percentage, first_name, last_name, user_first, user_last, email in submissions:
+        if student != current:
+            if current is not None:
+                yield student_row(name, student_email, cells)
+            current = student
+            name = student_display_name(first_name, last_name, user_first, user_last, email)
+            student_email = email or ''
+            cells = [None] * len(columns)
+        column = columns[test_id]
+        if cells[column] is None or percentage > cells[column]:
+            cells[column] = percentage
+    if current is not None:
+        yield student_row(name, student_email, cells)
+
+
+class ZipStream:
+    """Write-only file object collecting zipfile output until it is sent"""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def test_file_name(test):
+    """Archive-safe base name of a test's files"""
+    return f"{test.id}_{slugify(test.title) or 'test'}"
+
+
+def _sheet_images(test, chunk_size):
+    """(archive name, storage name) of a test's graded sheet images"""
+    images = (
+        Submission.objects.filter(test=test, processed=True)
+        .exclude(image='')
+        .order_by('id')
+        .values_list('id', 'image')
+        .iterator(chunk_size=chunk_size)
+    )
+    for submission_id, image in images:
+        extension = os.path.splitext(image)[1].lower()
+        yield f"images/{test_file_name(test)}/{submission_id}{extension}", image
+
+
+def _image_chunks(name):
+    with default_storage.open(name, 'rb') as image:
+        while True:
+            data = image.read(IMAGE_COPY_CHUNK_SIZE)
+            if not data:
+                return
+            yield data
+
+
+def iter_gradebook_zip(tests, include_images=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Zip archive of several tests' results, generated as it is sent
+
+    Contains gradebook.csv (student-by-test matrix), one results CSV per
+    test (as export_results_csv) and, with include_images, every graded
+    sheet image.
+
+    Args:
+        tests: Tests to export, in column order
+        include_images: Add the graded sheet images
+        chunk_size: Rows read from the database per round trip
+
+    Yields:
+        Archive bytes
+    """
+    tests = list(tests)
+    stream = ZipStream()
+    modified = time.localtime()[:6]
+
+    def members():
+        yield 'gradebook.csv', zipfile.ZIP_DEFLATED, (
+            line.encode() for line in iter_gradebook_csv(tests, chunk_size)
+        )
+        for test in tests:
+            yield f"tests/{test_file_name(test)}.csv", zipfile.ZIP_DEFLATED, (
+                line.encode() for line in iter_results_csv(test, chunk_size)
+            )
+        if include_images:
+            for test in tests:
+                for name, image in _sheet_images(test, chunk_size):
+                    if not default_storage.exists(image):
+                        continue
+                    # Images are compressed already
+                    yield name, zipfile.ZIP_STORED, _image_chunks(image)
+
+    with zipfile.ZipFile(stream, 'w') as archive:
+        for name, compression, chunks in members():
+            info = zipfile.ZipInfo(name, date_time=modified)
+            info.compress_type = compression
+            with archive.open(info, 'w', force_zip64=True) as member:
+                for data in chunks:
+                    member.write(data)
+                    if stream.size >= ZIP_STREAM_BUFFER_SIZE:
+                        yield stream.drain()
+            if stream.size >= ZIP_STREAM_BUFFER_SIZE:
+                yield stream.drain()
+    yield stream.drain()
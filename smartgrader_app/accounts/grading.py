@@ -0,0 +1,215 @@
+"""
+Grading helpers shared by the upload views and the grading job workers.
+
+Runs uploaded sheets through the batch OMR engine and turns each result
+into a saved Submission.
+"""
+import itertools
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .batch_grader import iter_omr_batch
+from .ingestion import sheet_source, release_sheet_source
+from .models import Submission, TestEnrollment
+from .omr_processor import grade_submission
+
+
+def match_submission_to_student(submission, test, first_name, last_name):
+    """
+    Try to match a submission to an enrolled student based on name.
+    Returns the matched user or None.
+    """
+    # Ensure first_name and last_name are strings, not None
+    first_name = first_name or ''
+    last_name = last_name or ''
+
+    if not first_name and not last_name:
+        return None
+
+    # Get all enrolled students for this test
+    enrollments = TestEnrollment.objects.filter(test=test).select_related('student')
+
+    for enrollment in enrollments:
+        user = enrollment.student
+        # Try exact match (case-insensitive) - handle None values
+        user_first = (user.first_name or '').strip().lower()
+        user_last = (user.last_name or '').strip().lower()
+        ocr_first = first_name.strip().lower()
+        ocr_last = last_name.strip().lower()
+
+        # Match: first and last name
+        if user_first and user_last and ocr_first and ocr_last:
+            if user_first == ocr_first and user_last == ocr_last:
+                return user
+            # Try swapped (in case OCR detected them backwards)
+            if user_first == ocr_last and user_last == ocr_first:
+                return user
+        # Match: only last name (more unique)
+        elif user_last and ocr_last and user_last == ocr_last:
+            return user
+
+    return None
+
+
+def store_sheet_image(test, filename, upload):
+    """
+    Store a submission image exactly once
+
+    Upload temp files are moved into storage by the storage backend,
+    in-memory uploads and images read from a zip are written from memory.
+
+    Returns:
+        The stored file name
+    """
+    submission_image_path = f"submissions/test_{test.id}_{filename}"
+    if isinstance(upload, bytes):
+        return default_storage.save(submission_image_path, ContentFile(upload))
+    if isinstance(upload, str):
+        with open(upload, 'rb') as f:
+            return default_storage.save(submission_image_path, File(f))
+    return default_storage.save(submission_image_path, upload)
+
+
+def iter_omr_results(test, sheets, layout=None, skip=None, heartbeat=None):
+    """
+    Run sheets through the batch OMR engine, yielding results in order.
+
+    Args:
+        test: Test the sheets belong to
+        sheets: Iterable of tuples whose first item is the upload (an
+            uploaded file, a path or the image bytes, see accounts.ingestion);
+            it is consumed lazily, only as far ahead as the grading pool
+            has room for
+        layout: Layout template the sheets were printed with
+            (defaults to the test's newest layout)
+        skip: Optional function called with each sheet tuple before it is
+            sent to the pool; sheets it returns True for are not read
+            (e.g. already graded, see accounts.sheet_cache)
+        heartbeat: Optional function called regularly while the pool reads
+            sheets (see batch_grader.iter_omr_batch)
+
+    Yields:
+        (sheet, omr_result) for each sheet tuple, in input order, with
+        omr_result None for skipped sheets
+    """
+    if layout is None:
+        layout = test.get_sheet_layout()
+
+    opened = []
+
+    def staged_sheets():
+        for sheet in sheets:
+            source = sheet_source(sheet[0])
+            if isinstance(source, memoryview):
+                opened.append(source)
+            yield source, sheet, bool(skip and skip(sheet))
+
+    # One copy of the stream feeds the pool, the other is yielded in order;
+    # tee only buffers the sheets in flight between the two
+    for_pool, for_results = itertools.tee(staged_sheets())
+    omr_results = iter_omr_batch(
+        (source for source, _, skipped in for_pool if not skipped),
+        test.num_questions,
+        test.num_options,
+        layout=layout,
+        workers=settings.OMR_WORKERS,
+        mode=settings.OMR_POOL_MODE,
+        cv_threads=settings.OMR_CV_THREADS,
+        reduction=settings.OMR_DECODE_REDUCTION,
+        heartbeat=heartbeat,
+    )
+    try:
+        for _, sheet, skipped in for_results:
+            yield sheet, None if skipped else next(omr_results)
+    finally:
+        omr_results.close()
+        # Let Django close the in-memory uploads
+        for source in opened:
+            release_sheet_source(source)
+
+
+def save_graded_submission(test, upload, filename, correct_answers, omr_result, image_name=None,
+                           cache=None, content_hash=None):
+    """
+    Grade an OMR result and save it as a Submission
+
+    Args:
+        image_name: Storage name of the sheet image if it is already stored;
+            otherwise the upload (or the page the OMR worker rendered from a
+            scan) is stored now
+        cache: Optional SheetResultCache; a file identical to a graded one
+            returns that submission instead of a new one, and a possible
+            rescan is saved and flagged with 'possible_rescan_of'
+        content_hash: Content hash of the upload, for the cache
+    """
+    try:
+        if not omr_result['success']:
+            return {
+                'filename': filename,
+                'success': False,
+                'error': omr_result['error']
+            }
+
+        rescan_of = None
+        if cache is not None:
+            duplicate = cache.find_duplicate(content_hash)
+            if duplicate is not None:
+                return cache.cached_result(duplicate, filename)
+            rescan_of = cache.possible_rescan(omr_result)
+
+        detected_answers = omr_result['answers']
+        student_info = omr_result.get('student_info', {})
+
+        # Grade the submission
+        grading = grade_submission(detected_answers, correct_answers)
+
+        # Save to database
+        # First, save the image permanently
+        saved_path = image_name or store_sheet_image(test, filename, omr_result.get('sheet_image') or upload)
+
+        # Extract student info from OCR (handle None values)
+        first_name = (student_info.get('first_name') or '').strip()
+        last_name = (student_info.get('last_name') or '').strip()
+
+        # Try to match with enrolled student
+        student_user = match_submission_to_student(None, test, first_name, last_name)
+
+        submission = Submission.objects.create(
+            test=test,
+            student_user=student_user,  # Link to enrolled student if matched
+            first_name=first_name,
+            last_name=last_name,
+            image=saved_path,
+            answers=detected_answers,
+            fill_matrix=omr_result.get('fill_matrix'),
+            score=grading['score'],
+            total_questions=grading['total'],
+            percentage=grading['percentage'],
+            processed=True,
+            layout_version=omr_result.get('layout_version'),
+            answer_key_version=test.answer_key_version(),
+        )
+        if cache is not None:
+            cache.add(submission, content_hash, omr_result.get('sheet_hash'))
+
+        result = {
+            'filename': filename,
+            'success': True,
+            'submission_id': submission.id,
+            'score': grading['score'],
+            'total': grading['total'],
+            'percentage': grading['percentage']
+        }
+        if rescan_of is not None:
+            result['possible_rescan_of'] = rescan_of.id
+        return result
+
+    except Exception as e:
+        return {
+            'filename': filename,
+            'success': False,
+            'error': str(e)
+        }
@@ -0,0 +1,461 @@
+"""
+Database-backed grading job queue.
+
+Uploads are stored and queued as a GradingJob with one GradingJobSheet per
+answer sheet; worker processes (manage.py run_grading_workers) drain the
+queue. No broker is needed: the queue is the database, so it works the same
+on SQLite and PostgreSQL.
+
+- Claiming: a worker takes a job with a conditional UPDATE that only
+  succeeds if the job is still queued or its lease has expired, so two
+  workers can never hold the same job.
+- Leases: the claiming worker owns the job until lease_expires_at and
+  renews the lease with every checkpoint, and with a heartbeat while it
+  routes sheets or waits on the grading pool. If it dies, the lease runs
+  out and another worker picks the job up.
+- Checkpoints: each sheet's Submission and its 'done'/'failed' status are
+  committed together, so a resumed job only grades the sheets still pending.
+  Each checkpoint numbers its sheet (finish_seq); pollers and event streams
+  follow a job by that number, since a mixed job finishes its sheets one
+  test at a time rather than in upload order.
+
+Multi-page PDF/TIFF scans are stored as uploaded and queued as one sheet
+per page; the grading pool rasterizes each page when it grades it.
+"""
+import logging
+import os
+import socket
+import time
+import uuid
+import zipfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .batch_grader import route_sheets
+from .grading import iter_omr_results, save_graded_submission
+from .ingestion import select_zip_members
+from .models import GradingJob, GradingJobSheet, Submission, Test
+from .scan_pages import ScanPage, count_scan_pages, scan_kind, scan_page_filename
+from .sheet_cache import SheetResultCache
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """The worker's lease on a job expired and another worker took it over"""
+
+
+def new_worker_id():
+    """Identifier for one worker process, unique across nodes"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _lease_deadline():
+    return timezone.now() + timedelta(seconds=settings.GRADING_JOB_LEASE_SECONDS)
+
+
+def enqueue_grading_job(user, uploaded_files, zip_file, test=None):
+    """
+    Store an upload and queue it for grading
+
+    The images (or the zip) are written to storage once; workers read them
+    from there and graded sheets keep pointing at the stored images.
+
+    Args:
+        user: Teacher who uploaded the sheets
+        uploaded_files: List of uploaded image files
+        zip_file: Uploaded zip of images (used instead of uploaded_files if given)
+        test: Test the sheets belong to, or None to route them by QR code
+
+    Returns:
+        The queued GradingJob
+
+    Raises:
+        zipfile.BadZipFile: if zip_file is not a zip archive (nothing is queued)
+    """
+    stored = []
+    try:
+        return _create_grading_job(user, uploaded_files, zip_file, test, stored)
+    except Exception:
+        # The job rows were rolled back; drop the files stored for them
+        for name in stored:
+            default_storage.delete(name)
+        raise
+
+
+def _create_grading_job(user, uploaded_files, zip_file, test, stored):
+    with transaction.atomic():
+        job = GradingJob.objects.create(created_by=user, test=test)
+        sheets = []
+
+        if zip_file:
+            job.archive = default_storage.save(f"grading_jobs/job_{job.id}.zip", zip_file)
+            stored.append(job.archive)
+            with _open_archive(job) as archive:
+                members, job.errors = select_zip_members(archive, settings.OMR_MAX_SHEET_BYTES)
+                for info, filename in members:
+                    if scan_kind(filename):
+                        # Scans are read page by page, so they get a file of their own
+                        with archive.open(info) as member:
+                            name = default_storage.save(f"grading_jobs/job_{job.id}/{filename}", File(member))
+                        stored.append(name)
+                        sheets.extend(_scan_sheets(job, name, filename))
+                    else:
+                        sheets.append((info.filename, filename, None))
+        else:
+            for uploaded_file in uploaded_files:
+                if scan_kind(uploaded_file.name):
+                    name = default_storage.save(f"grading_jobs/job_{job.id}/{uploaded_file.name}", uploaded_file)
+                    stored.append(name)
+                    sheets.extend(_scan_sheets(job, name, uploaded_file.name))
+                else:
+                    name = default_storage.save(f"submissions/job_{job.id}/{uploaded_file.name}", uploaded_file)
+                    stored.append(name)
+                    sheets.append((name, uploaded_file.name, None))
+
+        GradingJobSheet.objects.bulk_create([
+            GradingJobSheet(job=job, index=index, filename=filename, source=source, page=page,
+                            test=test, routed=test is not None)
+            for index, (source, filename, page) in enumerate(sheets)
+        ])
+        job.total_sheets = len(sheets)
+        job.save(update_fields=['archive', 'errors', 'total_sheets'])
+
+    return job
+
+
+def _stored_source(name):
+    """Path of a stored file, or its bytes for storages without local paths"""
+    try:
+        return default_storage.path(name)
+    except NotImplementedError:
+        with default_storage.open(name, 'rb') as f:
+            return f.read()
+
+
+def _scan_sheets(job, name, filename):
+    """(source, filename, page) for every page of a stored scan"""
+    try:
+        pages = count_scan_pages(_stored_source(name), scan_kind(name))
+    except Exception as e:
+        default_storage.delete(name)
+        job.errors.append(f"Skipped {filename}: could not read scan ({e})")
+        return []
+    return [(name, scan_page_filename(filename, page), page) for page in range(pages)]
+
+
+def claim_grading_job(worker_id, job_id=None):
+    """
+    Claim the oldest job that is queued or whose lease has expired
+
+    Args:
+        worker_id: Lease owner name
+        job_id: Only try to claim this job
+
+    Returns:
+        The claimed GradingJob, or None if there is nothing to do
+    """
+    now = timezone.now()
+    claimable = Q(status=GradingJob.STATUS_QUEUED) | Q(status=GradingJob.STATUS_RUNNING, lease_expires_at__lt=now)
+
+    if job_id is not None:
+        candidates = [job_id]
+    else:
+        candidates = GradingJob.objects.filter(claimable).order_by('created_at').values_list('id', flat=True)[:10]
+
+    for candidate in candidates:
+        # Compare-and-set: only one worker's UPDATE can match the row
+        claimed = GradingJob.objects.filter(claimable, id=candidate).update(
+            status=GradingJob.STATUS_RUNNING,
+            lease_owner=worker_id,
+            lease_expires_at=_lease_deadline(),
+            attempts=F('attempts') + 1,
+            started_at=Coalesce('started_at', now),
+        )
+        if claimed:
+            return GradingJob.objects.get(id=candidate)
+    return None
+
+
+def _renew_lease(job, worker_id, **counters):
+    """Extend the lease (and bump job counters) or raise LeaseLost"""
+    updated = GradingJob.objects.filter(id=job.id, lease_owner=worker_id).update(
+        lease_expires_at=_lease_deadline(), **counters
+    )
+    if not updated:
+        raise LeaseLost(f"Lost lease on grading job {job.id}")
+
+
+class _LeaseHeartbeat:
+    """
+    Renews a job's lease when called, at most every quarter of the lease
+    time, so long stretches without checkpoints do not let it run out
+
+    Raises:
+        LeaseLost: if another worker took the job over meanwhile
+    """
+
+    def __init__(self, job, worker_id):
+        self.job = job
+        self.worker_id = worker_id
+        self.interval = settings.GRADING_JOB_LEASE_SECONDS / 4
+        self.renewed_at = time.monotonic()
+
+    def __call__(self):
+        if time.monotonic() - self.renewed_at >= self.interval:
+            _renew_lease(self.job, self.worker_id)
+            self.renewed_at = time.monotonic()
+
+
+def _stored_image(job, sheet):
+    """Storage name of a sheet's own stored image (not a zip member or a scan page), or None"""
+    if job.archive or sheet.page is not None:
+        return None
+    return sheet.source
+
+
+def _finish(job, worker_id, status, error=None):
+    errors = job.errors + [error] if error else job.errors
+    GradingJob.objects.filter(id=job.id, lease_owner=worker_id).update(
+        status=status, finished_at=timezone.now(), lease_expires_at=None, errors=errors
+    )
+    # The archive and scans go, and so do stored images no submission kept
+    # (sheets that failed or were never graded)
+    scans = job.sheets.filter(page__isnull=False).values_list('source', flat=True).distinct()
+    images = []
+    if not job.archive:
+        images = set(job.sheets.filter(page__isnull=True).values_list('source', flat=True))
+        images -= set(Submission.objects.filter(image__in=images).values_list('image', flat=True))
+    for name in [job.archive, *scans, *images]:
+        if name and default_storage.exists(name):
+            default_storage.delete(name)
+
+
+def _open_archive(job):
+    return zipfile.ZipFile(default_storage.open(job.archive, 'rb'))
+
+
+def _load_sheets(sheets, archive):
+    """
+    Yield (upload, filename, sheet, image_name) for each job sheet, reading
+    zip members only as the grading pool asks for them
+    """
+    scan_sources = {}
+    for sheet in sheets:
+        if sheet.page is not None:
+            # Page reference only; the grading worker renders the page
+            if sheet.source not in scan_sources:
+                scan_sources = {sheet.source: _stored_source(sheet.source)}
+            scan_page = ScanPage(scan_sources[sheet.source], scan_kind(sheet.source), sheet.page, None)
+            yield scan_page, sheet.filename, sheet, None
+        elif archive is not None:
+            with archive.open(sheet.source) as member:
+                yield member.read(), sheet.filename, sheet, None
+        else:
+            yield _stored_source(sheet.source), sheet.filename, sheet, sheet.source
+
+
+def _checkpoint(job, worker_id, sheet, result):
+    """Record one graded sheet; the Submission is saved in the same transaction"""
+    failed = not result['success']
+    _renew_lease(job, worker_id, processed_sheets=F('processed_sheets') + 1,
+                 failed_sheets=F('failed_sheets') + int(failed))
+    # Only the lease owner checkpoints, so the counter numbers the sheets
+    # in the order they finished
+    sheet.finish_seq = GradingJob.objects.values_list('processed_sheets', flat=True).get(id=job.id)
+    sheet.status = GradingJobSheet.STATUS_FAILED if failed else GradingJobSheet.STATUS_DONE
+    sheet.result = result
+    sheet.submission_id = result.get('submission_id')
+    sheet.save(update_fields=['status', 'result', 'submission', 'finish_seq'])
+    image_name = _stored_image(job, sheet)
+    if failed and image_name:
+        # No submission refers to a failed sheet's image
+        transaction.on_commit(lambda: default_storage.delete(image_name))
+
+
+def _fail_sheet(job, worker_id, sheet, error):
+    with transaction.atomic():
+        _checkpoint(job, worker_id, sheet, {'filename': sheet.filename, 'success': False, 'error': error})
+
+
+def _route_pending_sheets(job, worker_id, archive, heartbeat):
+    """Read the QR code of every sheet of a mixed job not routed yet"""
+    sheets = list(job.sheets.filter(status=GradingJobSheet.STATUS_PENDING, routed=False))
+    if not sheets:
+        return
+
+    sources = (upload for upload, _, _, _ in _load_sheets(sheets, archive))
+    routes = route_sheets(
+        sources,
+        workers=settings.OMR_WORKERS,
+        mode=settings.OMR_POOL_MODE,
+        cv_threads=settings.OMR_CV_THREADS,
+        heartbeat=heartbeat,
+    )
+    _renew_lease(job, worker_id)
+
+    # Only the uploading teacher's tests
+    test_ids = {route[0] for route in routes if route}
+    owned = set(Test.objects.filter(id__in=test_ids, created_by=job.created_by).values_list('id', flat=True))
+
+    routed = []
+    for sheet, route in zip(sheets, routes):
+        heartbeat()
+        if route is None:
+            _fail_sheet(job, worker_id, sheet, 'No test QR code found on sheet')
+        elif route[0] not in owned:
+            _fail_sheet(job, worker_id, sheet, f'Test {route[0]} not found')
+        else:
+            sheet.test_id, sheet.layout_version = route
+            sheet.routed = True
+            routed.append(sheet)
+    GradingJobSheet.objects.bulk_update(routed, ['test', 'layout_version', 'routed'])
+
+
+def run_grading_job(job, worker_id):
+    """
+    Grade every pending sheet of a claimed job, checkpointing each sheet
+
+    Raises:
+        LeaseLost: if another worker took the job over meanwhile
+    """
+    if job.attempts > settings.GRADING_JOB_MAX_ATTEMPTS:
+        _finish(job, worker_id, GradingJob.STATUS_FAILED,
+                f"Gave up after {job.attempts - 1} interrupted attempts")
+        return
+
+    archive = _open_archive(job) if job.archive else None
+    heartbeat = _LeaseHeartbeat(job, worker_id)
+    try:
+        if job.test_id is None:
+            _route_pending_sheets(job, worker_id, archive, heartbeat)
+
+        pending = job.sheets.filter(status=GradingJobSheet.STATUS_PENDING, routed=True).order_by('index')
+        groups = {}
+        for sheet in pending:
+            groups.setdefault((sheet.test_id, sheet.layout_version), []).append(sheet)
+
+        tests = Test.objects.in_bulk({test_id for test_id, _ in groups if test_id is not None})
+        for (test_id, layout_version), sheets in groups.items():
+            test = tests.get(test_id)
+            if test is None:
+                # Deleted after the sheets were routed to it
+                for sheet in sheets:
+                    _fail_sheet(job, worker_id, sheet, 'Test was deleted')
+                continue
+
+            # Answer key and template loaded once per group
+            correct_answers = test.correct_answers()
+            layout = test.get_sheet_layout(layout_version) if layout_version else None
+            layout = layout or test.get_sheet_layout()
+
+            # Sheets graded before (re-uploads) are answered from the cache
+            cache = SheetResultCache(test, layout['version'] if layout else None)
+
+            def already_graded(sheet_tuple):
+                upload, _, sheet, _ = sheet_tuple
+                sheet.content_hash = cache.content_hash(upload, sheet.source)
+                return cache.find_duplicate(sheet.content_hash) is not None
+
+            results = iter_omr_results(test, _load_sheets(sheets, archive), layout, skip=already_graded,
+                                       heartbeat=heartbeat)
+            try:
+                for (upload, filename, sheet, image_name), omr_result in results:
+                    with transaction.atomic():
+                        if omr_result is None:
+                            result = cache.cached_result(cache.find_duplicate(sheet.content_hash), filename)
+                        else:
+                            result = save_graded_submission(
+                                test, upload, filename, correct_answers, omr_result, image_name=image_name,
+                                cache=cache, content_hash=sheet.content_hash,
+                            )
+                        if result.get('duplicate') and image_name:
+                            # Stored at upload; the submission keeps its own image
+                            default_storage.delete(image_name)
+                        if job.test_id is None:
+                            result['test_id'] = test.id
+                        _checkpoint(job, worker_id, sheet, result)
+            finally:
+                results.close()
+    except LeaseLost:
+        raise
+    except Exception as e:
+        _finish(job, worker_id, GradingJob.STATUS_FAILED, f"Grading failed: {e}")
+        return
+    finally:
+        if archive is not None:
+            archive.close()
+
+    _finish(job, worker_id, GradingJob.STATUS_COMPLETED)
+
+
+def run_grading_worker(worker_id=None, poll_interval=2.0, once=False):
+    """
+    Claim and run grading jobs until stopped
+
+    Args:
+        worker_id: Lease owner name (generated if None)
+        poll_interval: Seconds to wait when the queue is empty
+        once: Return as soon as the queue is empty instead of polling
+
+    Returns:
+        Number of jobs this worker ran
+    """
+    worker_id = worker_id or new_worker_id()
+    jobs_run = 0
+    while True:
+        job = claim_grading_job(worker_id)
+        if job is None:
+            # Idle workers pack answers stored before packed answers existed
+            if Submission.objects.pack_stored_answers():
+                continue
+            if once:
+                return jobs_run
+            time.sleep(poll_interval)
+            continue
+
+        logger.info("[%s] Grading job %s (%s sheets, attempt %s)", worker_id, job.id, job.total_sheets, job.attempts)
+        try:
+            run_grading_job(job, worker_id)
+        except LeaseLost as e:
+            logger.warning("[%s] %s", worker_id, e)
+        jobs_run += 1
+
+
+def grading_job_status(job, after=0):
+    """
+    Progress of a job plus the results of sheets finished since `after`
+
+    Args:
+        job: GradingJob
+        after: Only include sheets finished after this one (its finish_seq,
+            for incremental polling)
+
+    Returns:
+        JSON-serializable dict
+    """
+    finished = (
+        job.sheets.filter(finish_seq__gt=after)
+        .order_by('finish_seq')
+        .values_list('index', 'finish_seq', 'result')
+    )
+    results = [dict(result, index=index, seq=seq) for index, seq, result in finished]
+    return {
+        'job_id': job.id,
+        'test_id': job.test_id,
+        'status': job.status,
+        'total': job.total_sheets,
+        'processed': job.processed_sheets,
+        'failed': job.failed_sheets,
+        'errors': job.errors,
+        'results': results,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,246 @@
+"""
+Live grading progress as Server-Sent Events.
+
+A grading job is streamed as small, self-contained JSON events instead of
+one response holding every result:
+
+    event: sheet     one graded (or failed) sheet; its id is the sheet's
+                     finish_seq (the order sheets finished in)
+    event: stats     running class statistics of the sheet's test
+    event: progress  job status and counters
+    event: done      final job status, then the stream ends
+
+Browsers reconnect with the Last-Event-ID header and only receive the
+sheets they have not seen yet. The stream follows the job's checkpoints in
+the database, so it works whichever worker process grades the job.
+
+Under ASGI (smartgrader_app/asgi.py) the stream is the async generator
+grading_job_events and does not hold a worker thread while it waits. WSGI
+servers consume an async iterator only once it is exhausted, which would
+hold back every event until the job ends, so under WSGI the stream is the
+blocking generator iter_grading_job_events (one thread per open stream).
+"""
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max, Min, Q, Sum
+
+from .models import EXCELLENT_PERCENTAGE, PASS_PERCENTAGE, GradingJob, GradingJobSheet, Submission
+
+SSE_POLL_SECONDS = 1.0
+SSE_KEEPALIVE_SECONDS = 15.0
+
+
+def sse_event(event, data, event_id=None):
+    """Encode one Server-Sent Event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+class RunningClassStats:
+    """
+    Class statistics of one test, updated one submission at a time
+
+    Starts from a single aggregate query over the test's existing
+    submissions and then folds in each new score, so the stream never
+    re-reads the whole class. The output matches test_analytics_api.
+    """
+
+    def __init__(self, test_id, exclude_ids=()):
+        totals = (
+            Submission.objects.filter(test_id=test_id, processed=True)
+            .exclude(id__in=exclude_ids)
+            .aggregate(
+                count=Count('id'),
+                score_sum=Sum('score'),
+                percentage_sum=Sum('percentage'),
+                highest=Max('score'),
+                lowest=Min('score'),
+                passed=Count('id', filter=Q(percentage__gte=PASS_PERCENTAGE)),
+                excellent=Count('id', filter=Q(percentage__gte=EXCELLENT_PERCENTAGE)),
+            )
+        )
+        self.test_id = test_id
+        self.count = totals['count']
+        self.score_sum = totals['score_sum'] or 0
+        self.percentage_sum = totals['percentage_sum'] or 0.0
+        self.highest = totals['highest']
+        self.lowest = totals['lowest']
+        self.passed = totals['passed']
+        self.excellent = totals['excellent']
+
+    def add(self, score, percentage):
+        self.count += 1
+        self.score_sum += score
+        self.percentage_sum += percentage
+        self.highest = score if self.highest is None else max(self.highest, score)
+        self.lowest = score if self.lowest is None else min(self.lowest, score)
+        self.passed += percentage >= PASS_PERCENTAGE
+        self.excellent += percentage >= EXCELLENT_PERCENTAGE
+
+    def as_dict(self):
+        if not self.count:
+            return {'test_id': self.test_id, 'total_submissions': 0}
+        return {
+            'test_id': self.test_id,
+            'total_submissions': self.count,
+            'average_score': round(self.score_sum / self.count, 2),
+            'average_percentage': round(self.percentage_sum / self.count, 2),
+            'highest_score': self.highest,
+            'lowest_score': self.lowest,
+            'pass_rate': round(self.passed / self.count * 100, 2),
+            'score_distribution': {
+                'excellent': self.excellent,
+                'good': self.passed - self.excellent,
+                'needs_improvement': self.count - self.passed,
+            },
+        }
+
+
+def _job_snapshot(job_id):
+    job = GradingJob.objects.get(id=job_id)
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'total': job.total_sheets,
+        'processed': job.processed_sheets,
+        'failed': job.failed_sheets,
+        'errors': job.errors,
+    }
+
+
+def _finished_sheets(job_id, after):
+    return list(
+        GradingJobSheet.objects.filter(job_id=job_id, finish_seq__gt=after)
+        .order_by('finish_seq')
+        .values_list('index', 'finish_seq', 'test_id', 'result')
+    )
+
+
+def _class_stats(test_id, job_id):
+    # This job's submissions are folded in as its sheets are streamed
+    job_submissions = GradingJobSheet.objects.filter(job_id=job_id, submission__isnull=False).values('submission')
+    return RunningClassStats(test_id, exclude_ids=job_submissions)
+
+
+class _JobEvents:
+    """
+    What one event stream has sent so far; shared by the sync and async
+    generators, which only differ in how they wait between polls
+    """
+
+    def __init__(self, job_id, last_event_id):
+        self.job_id = job_id
+        self.last_event_id = last_event_id
+        self.stats = {}
+        self.counted = set()
+        self.seen = 0
+        self.snapshot = None
+        self.done = False
+
+    def start(self):
+        """Events opening the stream"""
+        self.snapshot = _job_snapshot(self.job_id)
+        return ["retry: 3000\n\n", sse_event('progress', self.snapshot)]
+
+    def poll(self):
+        """Events for what changed since the last poll (empty if nothing did)"""
+        # Sheets are checkpointed before the job is marked finished, so once
+        # the job was seen finished the next read returns every last sheet
+        was_finished = self.snapshot['status'] in (GradingJob.STATUS_COMPLETED, GradingJob.STATUS_FAILED)
+
+        events = []
+        sheets = _finished_sheets(self.job_id, self.seen)
+        for index, seq, test_id, result in sheets:
+            self.seen = seq
+            if test_id is not None and test_id not in self.stats:
+                self.stats[test_id] = _class_stats(test_id, self.job_id)
+            # Sheets the client already has still count towards the stats;
+            # re-uploads of one submission count once
+            if result.get('success') and result['submission_id'] not in self.counted:
+                self.counted.add(result['submission_id'])
+                self.stats[test_id].add(result['score'], result['percentage'])
+            if seq <= self.last_event_id:
+                continue
+
+            events.append(sse_event('sheet', dict(result, index=index, seq=seq), event_id=seq))
+            if result.get('success'):
+                events.append(sse_event('stats', self.stats[test_id].as_dict(), event_id=seq))
+
+        if was_finished:
+            events.append(sse_event('done', self.snapshot))
+            self.done = True
+            return events
+
+        self.snapshot = _job_snapshot(self.job_id)
+        if sheets:
+            events.append(sse_event('progress', self.snapshot))
+        return events
+
+
+# Comment line: keeps proxies from closing a quiet stream
+KEEPALIVE = ": keepalive\n\n"
+
+
+async def grading_job_events(job_id, last_event_id=0):
+    """
+    Async generator of SSE messages for a grading job (ASGI)
+
+    Args:
+        job_id: GradingJob to follow
+        last_event_id: finish_seq of the last sheet the client already has
+
+    Yields:
+        Encoded events until the job is finished
+    """
+    stream = _JobEvents(job_id, last_event_id)
+    for event in await sync_to_async(stream.start)():
+        yield event
+
+    idle = 0.0
+    while True:
+        events = await sync_to_async(stream.poll)()
+        for event in events:
+            yield event
+        if stream.done:
+            return
+        if events:
+            idle = 0.0
+            continue
+
+        await asyncio.sleep(SSE_POLL_SECONDS)
+        idle += SSE_POLL_SECONDS
+        if idle >= SSE_KEEPALIVE_SECONDS:
+            idle = 0.0
+            yield KEEPALIVE
+
+
+def iter_grading_job_events(job_id, last_event_id=0):
+    """
+    Generator of SSE messages for a grading job (WSGI); same events as
+    grading_job_events, polling with a blocking sleep
+    """
+    stream = _JobEvents(job_id, last_event_id)
+    yield from stream.start()
+
+    idle = 0.0
+    while True:
+        events = stream.poll()
+        yield from events
+        if stream.done:
+            return
+        if events:
+            idle = 0.0
+            continue
+
+        time.sleep(SSE_POLL_SECONDS)
+        idle += SSE_POLL_SECONDS
+        if idle >= SSE_KEEPALIVE_SECONDS:
+            idle = 0.0
+            yield KEEPALIVE
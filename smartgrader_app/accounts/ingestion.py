@@ -0,0 +1,91 @@
+"""
+Sheet ingestion.
+
+Turns uploads into image sources for the OMR pipeline without extracting
+or copying them to disk:
+
+- individual image uploads are decoded from Django's upload buffer or
+  upload temp file (sheet_source)
+- multi-page PDF/TIFF scans are split into pages (accounts.scan_pages)
+- zip archives are stored with their grading job, their members filtered
+  by name, extension and size (select_zip_members), and read one member at
+  a time with ZipFile.open as the grading worker reaches them
+  (accounts.grading_jobs)
+
+Sheets travel through the grading pipeline (accounts.grading) as
+(upload, filename) tuples, where upload is an uploaded file, a path on
+disk, the image bytes or a scan page.
+"""
+import os
+
+from .scan_pages import SCAN_EXTENSIONS, ScanPage
+
+SHEET_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def sheet_source(upload):
+    """
+    Image source for the OMR pipeline without copying the upload
+
+    Returns:
+        The bytes, path or scan page as given, the path of Django's upload
+        temp file, or a memoryview over an in-memory upload
+    """
+    if isinstance(upload, (str, bytes, ScanPage)):
+        return upload
+    if hasattr(upload, 'temporary_file_path'):
+        return upload.temporary_file_path()
+    return upload.file.getbuffer()
+
+
+def release_sheet_source(source):
+    """Release a memoryview from sheet_source so Django can close the upload"""
+    if isinstance(source, memoryview):
+        try:
+            source.release()
+        except BufferError:
+            # Still being decoded by an abandoned worker; it is released
+            # when that decode finishes and the view is garbage collected
+            pass
+
+
+def is_sheet_image(filename):
+    """
+    True for image files and multi-page scans, ignoring hidden files and
+    macOS resource forks
+    """
+    name = os.path.basename(filename)
+    return (
+        name.lower().endswith(SHEET_IMAGE_EXTENSIONS + SCAN_EXTENSIONS)
+        and not name.startswith('.')
+        and '__MACOSX/' not in filename
+    )
+
+
+def select_zip_members(archive, max_bytes):
+    """
+    Pick the sheet images out of a zip archive without decompressing anything
+
+    Args:
+        archive: Open zipfile.ZipFile
+        max_bytes: Largest uncompressed member size accepted
+
+    Returns:
+        (members, skipped): list of (ZipInfo, filename) tuples in archive
+        order, and a list of messages for image members that were skipped
+    """
+    members = []
+    skipped = []
+    for info in archive.infolist():
+        if info.is_dir() or not is_sheet_image(info.filename):
+            continue
+
+        filename = os.path.basename(info.filename)
+        if info.flag_bits & 0x1:
+            skipped.append(f"Skipped {filename}: encrypted")
+        elif info.file_size > max_bytes:
+            skipped.append(f"Skipped {filename}: larger than {max_bytes // (1024 * 1024)} MB")
+        else:
+            members.append((info, filename))
+    return members, skipped
+
@@ -0,0 +1,142 @@
+"""
+Classical item analysis of a test.
+
+Computed from the (N, Q) response matrix (Submission.objects.answer_matrix)
+in a few NumPy passes:
+
+- difficulty: share of students answering each question correctly
+- discrimination index: difficulty in the top 27% of total scores minus
+  difficulty in the bottom 27%
+- point-biserial: correlation of each question with the rest of the test
+  (the total score without that question)
+- distractors: how many students chose each option, and their mean score
+- KR-20 reliability of the whole test, and the score histogram
+
+Results are cached per (test, answer-key version, statistics version) with
+accounts.caching; the statistics version (TestStats.version) changes with
+every graded, edited or deleted submission, so a cached analysis is never
+stale.
+"""
+import math
+
+import numpy as np
+
+from .caching import cached
+from .models import Submission
+from .test_stats import stats_version
+
+# Share of students in each of the upper and lower groups of the
+# discrimination index (Kelley's 27%)
+DISCRIMINATION_GROUP = 0.27
+
+ITEM_ANALYSIS_CACHE_SECONDS = 24 * 60 * 60
+
+
+def _rounded(values, digits=4):
+    """List of rounded floats, None where a value is undefined"""
+    return [None if math.isnan(v) else round(v, digits) for v in np.asarray(values, dtype=np.float64).tolist()]
+
+
+def analyze_responses(answers, correct_answers, num_options):
+    """
+    Item statistics of a response matrix
+
+    Args:
+        answers: (N, Q) option indices, negative for blank
+        correct_answers: Correct option index of every question
+        num_options: Options per question
+
+    Returns:
+        dict with a 'test' summary and one 'questions' entry per question
+    """
+    num_students, num_questions = answers.shape
+    key = np.asarray(correct_answers, dtype=answers.dtype)
+    correct = (answers == key).astype(np.float64)
+    totals = correct.sum(axis=1)
+
+    summary = {
+        'students': num_students,
+        'questions': num_questions,
+        'score_histogram': np.bincount(totals.astype(np.intp), minlength=num_questions + 1).tolist(),
+    }
+    if num_students == 0:
+        summary.update(mean_score=None, score_std_dev=None, kr20=None)
+        return {'test': summary, 'questions': []}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        difficulty = correct.mean(axis=0)
+        item_var = difficulty * (1 - difficulty)
+        total_mean = totals.mean()
+        total_var = totals.var()
+
+        # Upper and lower groups by total score
+        group = max(1, int(round(num_students * DISCRIMINATION_GROUP)))
+        order = np.argsort(totals, kind='stable')
+        discrimination = correct[order[-group:]].mean(axis=0) - correct[order[:group]].mean(axis=0)
+
+        # Corrected item-total correlation: item vs total minus the item
+        cov_item_total = (correct * totals[:, None]).mean(axis=0) - difficulty * total_mean
+        rest_var = total_var - 2 * cov_item_total + item_var
+        point_biserial = (cov_item_total - item_var) / np.sqrt(item_var * rest_var)
+
+        kr20 = (
+            num_questions / (num_questions - 1) * (1 - item_var.sum() / total_var)
+            if num_questions > 1 and total_var > 0 else float('nan')
+        )
+
+        # Per-option counts and mean total score of the students choosing it
+        option_counts = np.empty((num_questions, num_options), dtype=np.int64)
+        option_means = np.empty((num_questions, num_options))
+        for option in range(num_options):
+            chose = answers == option
+            option_counts[:, option] = chose.sum(axis=0)
+            option_means[:, option] = (chose * totals[:, None]).sum(axis=0) / option_counts[:, option]
+        blank_counts = (answers < 0).sum(axis=0)
+
+    summary.update(
+        mean_score=round(float(total_mean), 4),
+        score_std_dev=round(float(np.sqrt(total_var)), 4),
+        kr20=_rounded([kr20])[0],
+    )
+
+    questions = []
+    columns = zip(
+        _rounded(difficulty), _rounded(discrimination), _rounded(point_biserial),
+        option_counts.tolist(), [_rounded(row, 2) for row in option_means], blank_counts.tolist(),
+    )
+    for index, (p, d, r, counts, means, blanks) in enumerate(columns):
+        questions.append({
+            'question_num': index + 1,
+            'correct_answer': int(key[index]),
+            'difficulty': p,
+            'discrimination': d,
+            'point_biserial': r,
+            'blank_count': blanks,
+            'options': [
+                {'option': option, 'count': count, 'share': round(count / num_students, 4), 'mean_score': mean}
+                for option, (count, mean) in enumerate(zip(counts, means))
+            ],
+        })
+    return {'test': summary, 'questions': questions}
+
+
+def analyze_test(test):
+    """
+    Item analysis of a test's graded submissions, cached until a
+    submission or the answer key changes
+
+    Returns:
+        dict as analyze_responses, plus the test id and the cache watermark
+    """
+    key_version = test.answer_key_version()
+    version = stats_version(test)
+
+    def analyze():
+        _, answers = Submission.objects.filter(test=test, processed=True).answer_matrix(test.num_questions)
+        result = analyze_responses(answers, test.correct_answers(), test.num_options)
+        result.update(test_id=test.id, answer_key_version=key_version, stats_version=version)
+        return result
+
+    return cached(
+        'item-analysis', [('test', test.id)], analyze, key_version, version, timeout=ITEM_ANALYSIS_CACHE_SECONDS
+    )
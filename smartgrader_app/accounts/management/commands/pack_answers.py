@@ -0,0 +1,29 @@
+"""
+Pack the answers of submissions saved before packed answers existed.
+
+Idle grading workers do this in the background; the command finishes the
+job in one go.
+
+Usage:
+    python manage.py pack_answers [--batch-size 1000]
+"""
+from django.core.management.base import BaseCommand
+
+from accounts.models import PACK_ANSWERS_BATCH_SIZE, Submission
+
+
+class Command(BaseCommand):
+    help = "Backfill Submission.packed_answers from the JSON answers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PACK_ANSWERS_BATCH_SIZE,
+                            help="Submissions packed per query")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            packed = Submission.objects.pack_stored_answers(options['batch_size'])
+            if not packed:
+                break
+            total += packed
+        self.stdout.write(self.style.SUCCESS(f"Packed the answers of {total} submission(s)"))
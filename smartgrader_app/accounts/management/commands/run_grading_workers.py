@@ -0,0 +1,66 @@
+"""
+Run grading workers that drain the grading job queue.
+
+Usage:
+    python manage.py run_grading_workers [--workers 2] [--poll 2] [--once]
+"""
+import logging
+import multiprocessing
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from accounts.grading_jobs import run_grading_worker
+
+
+def _worker_main(poll_interval, once):
+    run_grading_worker(poll_interval=poll_interval, once=once)
+
+
+class Command(BaseCommand):
+    help = "Claim and grade queued answer sheet uploads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Worker processes (each also uses the OMR_WORKERS grading pool)")
+        parser.add_argument('--poll', type=float, default=2.0,
+                            help="Seconds to wait between polls when the queue is empty")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit when the queue is empty")
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        poll_interval = options['poll']
+        once = options['once']
+
+        # Show the workers' job log on the console (forked workers inherit it)
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        job_logger = logging.getLogger('accounts.grading_jobs')
+        job_logger.addHandler(handler)
+        job_logger.setLevel(logging.INFO)
+
+        if workers <= 1:
+            self.stdout.write(f"Grading worker started (poll {poll_interval}s)")
+            jobs_run = run_grading_worker(poll_interval=poll_interval, once=once)
+            self.stdout.write(self.style.SUCCESS(f"Ran {jobs_run} grading job(s)"))
+            return
+
+        # Forked workers must open their own database connections
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=_worker_main, args=(poll_interval, once))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {workers} grading workers (poll {poll_interval}s)")
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+                process.join()
@@ -0,0 +1,68 @@
+"""
+Request-scoped profile role.
+
+ProfileRoleMiddleware gives every request a lazy request.profile_role
+('teacher', 'student', or None when signed out), resolved at most once per
+request and kept in the session, so role checks (accounts.decorators) and
+templates (accounts.context_processors) do not query Profile on each page.
+
+A role kept in a session is trusted while it carries the user's current
+role stamp, held in the cache. Saving or deleting a Profile replaces the
+stamp (see accounts.signals), so a changed role is picked up on the user's
+next request in every session. Stamps expire after ROLE_STAMP_SECONDS,
+which bounds how long a change made outside Django (a raw SQL update, or a
+process that does not share the cache) can go unnoticed.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+from .models import Profile
+
+ROLE_SESSION_KEY = '_profile_role'
+ROLE_STAMP_SECONDS = 5 * 60
+
+
+def role_stamp_key(user_id):
+    return f"profile-role-stamp:{user_id}"
+
+
+def invalidate_profile_role(user_id):
+    """Have every session of a user look its role up again"""
+    cache.set(role_stamp_key(user_id), uuid.uuid4().hex, ROLE_STAMP_SECONDS)
+
+
+def resolve_profile_role(request):
+    """
+    Role of the request's user, from the session when its stamp is current
+    and from the database otherwise (creating a student profile if missing)
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return None
+
+    stamp = cache.get(role_stamp_key(user.pk))
+    saved = request.session.get(ROLE_SESSION_KEY)
+    if stamp is not None and saved and saved[0] == user.pk and saved[2] == stamp:
+        return saved[1]
+
+    profile, _ = Profile.objects.get_or_create(user=user, defaults={'role': 'student'})
+    if stamp is None:
+        # Keep a stamp another request set in the meantime
+        cache.add(role_stamp_key(user.pk), uuid.uuid4().hex, ROLE_STAMP_SECONDS)
+        stamp = cache.get(role_stamp_key(user.pk))
+    if stamp is not None:
+        request.session[ROLE_SESSION_KEY] = [user.pk, profile.role, stamp]
+    return profile.role
+
+
+class ProfileRoleMiddleware:
+    """Adds request.profile_role; must come after AuthenticationMiddleware"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profile_role = SimpleLazyObject(lambda: resolve_profile_role(request))
+        return self.get_response(request)
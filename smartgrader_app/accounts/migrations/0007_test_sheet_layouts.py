@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0006_generate_enrollment_codes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="test",
+            name="sheet_layouts",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
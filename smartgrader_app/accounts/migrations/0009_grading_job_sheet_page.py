@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0008_grading_jobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="gradingjobsheet",
+            name="page",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
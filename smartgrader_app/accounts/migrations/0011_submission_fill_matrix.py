@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0010_sheet_fingerprints"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="submission",
+            name="fill_matrix",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.15 on 2026-10-18 05:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0011_submission_fill_matrix"),
+    ]
+
+    operations = [
+        # Existing rows are packed in the background by idle grading
+        # workers (or manage.py pack_answers), not in this migration
+        migrations.AddField(
+            model_name="submission",
+            name="packed_answers",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
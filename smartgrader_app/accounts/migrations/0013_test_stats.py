@@ -0,0 +1,76 @@
+# Generated by Django 5.1.15 on 2026-10-18 06:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0012_submission_packed_answers"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TestStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("count", models.IntegerField(default=0)),
+                ("score_sum", models.IntegerField(default=0)),
+                ("score_sq_sum", models.BigIntegerField(default=0)),
+                ("percentage_sum", models.FloatField(default=0)),
+                ("min_score", models.IntegerField(blank=True, null=True)),
+                ("max_score", models.IntegerField(blank=True, null=True)),
+                ("score_histogram", models.JSONField(blank=True, default=list)),
+                ("version", models.PositiveIntegerField(default=0)),
+                ("stale", models.BooleanField(default=False)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "test",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stats",
+                        to="accounts.test",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="QuestionStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("question", models.IntegerField()),
+                ("correct_count", models.IntegerField(default=0)),
+                ("blank_count", models.IntegerField(default=0)),
+                ("option_counts", models.JSONField(blank=True, default=list)),
+                (
+                    "test",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="question_stats",
+                        to="accounts.test",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["question"],
+                "unique_together": {("test", "question")},
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.15 on 2026-10-18 06:50
+
+from django.db import migrations, models
+
+
+def number_finished_sheets(apps, schema_editor):
+    """Number the sheets finished so far in index order, matching each job's processed_sheets"""
+    GradingJobSheet = apps.get_model('accounts', 'GradingJobSheet')
+
+    finished = GradingJobSheet.objects.exclude(status='pending').order_by('job_id', 'index')
+    numbered = []
+    job_id, seq = None, 0
+    for sheet in finished.only('id', 'job_id'):
+        if sheet.job_id != job_id:
+            job_id, seq = sheet.job_id, 0
+        seq += 1
+        sheet.finish_seq = seq
+        numbered.append(sheet)
+    GradingJobSheet.objects.bulk_update(numbered, ['finish_seq'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0013_test_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="gradingjobsheet",
+            name="finish_seq",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="gradingjobsheet",
+            index=models.Index(fields=["job", "finish_seq"], name="accounts_gr_job_id_e968b5_idx"),
+        ),
+        migrations.RunPython(number_finished_sheets, migrations.RunPython.noop),
+    ]
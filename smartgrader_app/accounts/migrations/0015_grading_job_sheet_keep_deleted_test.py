@@ -0,0 +1,25 @@
+# Generated by Django 5.1.15 on 2026-10-18 06:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0014_grading_job_sheet_finish_seq"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="gradingjobsheet",
+            name="test",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="accounts.test",
+            ),
+        ),
+    ]
@@ -1,12 +1,15 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
+import hashlib
 import secrets
 import string
 import uuid
 
+import numpy as np
+
 
 class CustomUserManager(BaseUserManager):
     use_in_migrations = True
@@ -65,6 +68,7 @@ class Test(models.Model):
     num_questions = models.IntegerField()
     num_options = models.IntegerField(default=5)
     enrollment_code = models.CharField(max_length=8, unique=True, blank=True, null=True)
+    sheet_layouts = models.JSONField(default=dict, blank=True)  # Printed answer-sheet layouts by version
 
     class Meta:
         ordering = ['-created_at']
@@ -84,6 +88,33 @@ class Test(models.Model):
             if not Test.objects.filter(enrollment_code=code).exists():
                 return code
 
+    def add_sheet_layout(self, layout):
+        """Record the layout template of a printed answer sheet"""
+        self.sheet_layouts = {**self.sheet_layouts, str(layout['version']): layout}
+
+    def get_sheet_layout(self, version=None):
+        """
+        Get the answer-sheet layout for a template version (newest if None).
+        Returns None for tests whose sheets were printed before layouts existed.
+        """
+        if not self.sheet_layouts:
+            return None
+        if version is None:
+            version = max(int(v) for v in self.sheet_layouts)
+        return self.sheet_layouts.get(str(version))
+
+    def correct_answers(self):
+        """Correct option index of every question, in order"""
+        return [q['correct_answer'] for q in self.questions]
+
+    def answer_key_version(self):
+        """
+        Short hash of the answer key; changes whenever a correct answer does,
+        so results graded against an older key can be recognized
+        """
+        key = ','.join(str(answer) for answer in self.correct_answers())
+        return hashlib.sha1(key.encode()).hexdigest()[:16]
+
     def __str__(self):
         return f"{self.title} - {self.created_by.email}"
 
@@ -102,6 +133,121 @@ class TestEnrollment(models.Model):
         return f"{self.student.email} enrolled in {self.test.title}"
 
 
+# Packed answers hold one byte per question: the option index, or
+# PACKED_BLANK for a blank question
+PACKED_BLANK = 255
+
+# Submissions packed per batch by the background backfill
+PACK_ANSWERS_BATCH_SIZE = 1000
+
+# Percentages counted as passing and as excellent in the class statistics
+PASS_PERCENTAGE = 60
+EXCELLENT_PERCENTAGE = 80
+
+
+def letter_grade(percentage):
+    """Letter grade of a percentage"""
+    if percentage >= 90:
+        return 'A'
+    elif percentage >= 80:
+        return 'B'
+    elif percentage >= 70:
+        return 'C'
+    elif percentage >= 60:
+        return 'D'
+    else:
+        return 'F'
+
+
+def student_display_name(first_name, last_name, user_first_name=None, user_last_name=None, user_email=None):
+    """
+    Name shown for a submission's student: the linked account's (when
+    user_email is given), else the name read from the sheet
+    """
+    if user_email is not None:
+        return f"{user_first_name or ''} {user_last_name or ''}".strip() or user_email
+    if first_name and last_name:
+        return f"{first_name} {last_name}"
+    elif first_name:
+        return first_name
+    elif last_name:
+        return last_name
+    return "Unknown"
+
+
+def pack_answers(answers):
+    """Pack an answer list (None for blank) into one byte per question"""
+    return bytes(PACKED_BLANK if answer is None else answer for answer in answers)
+
+
+class SubmissionQuerySet(models.QuerySet):
+    def answer_matrix(self, num_questions, *fields):
+        """
+        All selected submissions' answers as one array, in one query
+
+        Reads the packed answers, so no JSON is decoded (rows not packed yet
+        are read from their JSON answers).
+
+        Args:
+            num_questions: Q; shorter answer lists are padded with blanks
+            *fields: Fields returned alongside each row (default: id)
+
+        Returns:
+            (rows, answers): a list of value tuples of `fields` and an int16
+            (N, Q) array of option indices, -1 for blank questions
+        """
+        fields = fields or ('id',)
+        rows = []
+        packed = []
+        missing = {}
+        for submission_id, answers, *values in self.values_list('id', 'packed_answers', *fields):
+            if answers is None:
+                missing[submission_id] = len(packed)
+            rows.append(tuple(values))
+            packed.append(answers)
+
+        if missing:
+            # Rows the background backfill has not packed yet
+            stored = Submission.objects.filter(id__in=list(missing)).values_list('id', 'answers')
+            for submission_id, answers in stored:
+                packed[missing[submission_id]] = pack_answers(answers or [])
+
+        blank = bytes([PACKED_BLANK])
+        data = b''.join(
+            answers if len(answers) == num_questions else bytes(answers[:num_questions]).ljust(num_questions, blank)
+            for answers in packed
+        )
+        matrix = np.frombuffer(data, dtype=np.uint8).reshape(len(rows), num_questions)
+
+        answers = matrix.astype(np.int16)
+        answers[matrix == PACKED_BLANK] = -1
+        return rows, answers
+
+    def pack_stored_answers(self, batch_size=PACK_ANSWERS_BATCH_SIZE):
+        """
+        Pack the answers of one batch of submissions saved before packed
+        answers existed (run by idle grading workers, see
+        grading_jobs.run_grading_worker, and manage.py pack_answers)
+
+        Returns:
+            Number of submissions packed; 0 once all are
+        """
+        batch = list(
+            self.filter(packed_answers__isnull=True).order_by('id').values_list('id', 'answers')[:batch_size]
+        )
+        if batch:
+            Submission.objects.bulk_update(
+                [Submission(id=submission_id, packed_answers=pack_answers(answers or []))
+                 for submission_id, answers in batch],
+                ['packed_answers'],
+            )
+        return len(batch)
+
+
+# Fields Submission.stats_state reads
+STATS_STATE_FIELDS = {'processed', 'score', 'percentage', 'packed_answers'}
+
+
 class Submission(models.Model):
     test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='submissions')
     student_user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, related_name='submissions', blank=True, null=True)
@@ -115,41 +261,208 @@ class Submission(models.Model):
     submitted_at = models.DateTimeField(auto_now_add=True)
     processed = models.BooleanField(default=False)
     error_message = models.TextField(blank=True, null=True)
+    layout_version = models.IntegerField(blank=True, null=True)  # Sheet template the answers were read with
+    answer_key_version = models.CharField(max_length=16, blank=True)  # Test.answer_key_version() the score is for
+    fill_matrix = models.BinaryField(blank=True, null=True)  # Q x O bubble fill ratios, one byte each (omr_processor.pack_fill_matrix)
+    packed_answers = models.BinaryField(blank=True, null=True)  # answers as one byte per question (pack_answers)
+
+    objects = SubmissionQuerySet.as_manager()
 
     class Meta:
         ordering = ['-submitted_at']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Graded state as loaded, so saves and deletes can update the class
+        # statistics by difference (see accounts.test_stats)
+        if STATS_STATE_FIELDS.issubset(field_names):
+            instance._stats_state = instance.stats_state()
+        return instance
+
+    def stats_state(self):
+        """What this submission contributes to its test's statistics (None if nothing)"""
+        if not self.processed:
+            return None
+        packed = bytes(self.packed_answers) if self.packed_answers is not None else None
+        return (self.score, self.percentage, packed)
+
+    def save(self, *args, **kwargs):
+        # Keep the packed copy of the answers in step with the JSON list
+        if self.answers is not None:
+            self.packed_answers = pack_answers(self.answers)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'answers' in update_fields:
+                kwargs['update_fields'] = set(update_fields) | {'packed_answers'}
+        # The statistics are updated by a post_save receiver, in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     @property
     def full_name(self):
         """Return full name of student"""
         if self.student_user:
-            return f"{self.student_user.first_name} {self.student_user.last_name}".strip() or self.student_user.email
-        if self.first_name and self.last_name:
-            return f"{self.first_name} {self.last_name}"
-        elif self.first_name:
-            return self.first_name
-        elif self.last_name:
-            return self.last_name
-        return "Unknown"
+            user = self.student_user
+            return student_display_name(None, None, user.first_name, user.last_name, user.email)
+        return student_display_name(self.first_name, self.last_name)
 
     @property
     def grade(self):
         """Calculate letter grade based on percentage"""
-        if self.percentage >= 90:
-            return 'A'
-        elif self.percentage >= 80:
-            return 'B'
-        elif self.percentage >= 70:
-            return 'C'
-        elif self.percentage >= 60:
-            return 'D'
-        else:
-            return 'F'
+        return letter_grade(self.percentage)
 
     def __str__(self):
         return f"{self.full_name} - {self.test.title} - {self.score}/{self.total_questions}"
 
 
+class SheetFingerprint(models.Model):
+    """
+    An uploaded sheet file that was graded as (or found to be) a Submission.
+
+    Re-uploads of the same file are matched by content_hash and not graded
+    or saved twice. sheet_hash (see omr_processor.sheet_hash) only flags
+    possible rescans of the same physical sheet for the teacher.
+    """
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='+')
+    submission = models.ForeignKey(Submission, on_delete=models.CASCADE, related_name='fingerprints')
+    content_hash = models.CharField(max_length=64)  # SHA-256 of the file (and page number for scans)
+    sheet_hash = models.CharField(max_length=384, blank=True)  # Perceptual hash of the name boxes
+    layout_version = models.IntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['test', 'content_hash'])]
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} -> submission {self.submission_id}"
+
+
+class TestStats(models.Model):
+    """
+    Class statistics of a test's graded submissions, kept up to date as
+    submissions are saved, deleted and regraded (see accounts/test_stats.py)
+    """
+    test = models.OneToOneField(Test, on_delete=models.CASCADE, related_name='stats')
+    count = models.IntegerField(default=0)
+    score_sum = models.IntegerField(default=0)
+    score_sq_sum = models.BigIntegerField(default=0)
+    percentage_sum = models.FloatField(default=0)
+    min_score = models.IntegerField(blank=True, null=True)
+    max_score = models.IntegerField(blank=True, null=True)
+    score_histogram = models.JSONField(default=list, blank=True)  # Submissions per score, 0..num_questions
+    # Bumped by every change; a watermark for anything cached from the statistics
+    version = models.PositiveIntegerField(default=0)
+    # Set when a change could not be applied by difference; rebuilt on next read
+    stale = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Statistics of {self.test} ({self.count} submissions)"
+
+
+class QuestionStats(models.Model):
+    """Answer counts of one question of a test, maintained with its TestStats"""
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='question_stats')
+    question = models.IntegerField()  # Zero-based question index
+    correct_count = models.IntegerField(default=0)
+    blank_count = models.IntegerField(default=0)
+    option_counts = models.JSONField(default=list, blank=True)  # Submissions per chosen option
+
+    class Meta:
+        ordering = ['question']
+        unique_together = ('test', 'question')
+
+    def __str__(self):
+        return f"Q{self.question + 1} of {self.test}"
+
+
+class GradingJob(models.Model):
+    """
+    A batch of uploaded answer sheets queued for grading by a worker
+    (see accounts/grading_jobs.py and the run_grading_workers command).
+
+    Workers claim a job by taking a time-limited lease on it; a job whose
+    lease expires (e.g. the worker crashed) can be claimed again and resumes
+    from its per-sheet checkpoints.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='grading_jobs')
+    # None for a mixed stack whose sheets are routed to tests by their QR code
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='grading_jobs', blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    archive = models.CharField(max_length=500, blank=True)  # Storage name of the uploaded zip, if any
+    total_sheets = models.IntegerField(default=0)
+    processed_sheets = models.IntegerField(default=0)
+    failed_sheets = models.IntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)  # Job-level messages (skipped files, failures)
+    lease_owner = models.CharField(max_length=100, blank=True)
+    lease_expires_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'lease_expires_at'])]
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_COMPLETED, self.STATUS_FAILED)
+
+    def __str__(self):
+        return f"Grading job {self.id} ({self.status}, {self.processed_sheets}/{self.total_sheets})"
+
+
+class GradingJobSheet(models.Model):
+    """One sheet of a grading job; its status is the job's checkpoint for that sheet"""
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    job = models.ForeignKey(GradingJob, on_delete=models.CASCADE, related_name='sheets')
+    index = models.IntegerField()  # Position in the upload
+    filename = models.CharField(max_length=255)
+    # Storage name of the uploaded image or scan, or the member name inside job.archive
+    source = models.CharField(max_length=500)
+    # Page number within a multi-page PDF/TIFF scan (None for single images)
+    page = models.IntegerField(blank=True, null=True)
+    # Set when the job is queued for a single test, or once the QR code is
+    # read; cleared if the test is deleted, which fails the sheet
+    test = models.ForeignKey(Test, on_delete=models.SET_NULL, related_name='+', blank=True, null=True)
+    layout_version = models.IntegerField(blank=True, null=True)
+    routed = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    result = models.JSONField(blank=True, null=True)  # Per-sheet result reported to the client
+    submission = models.ForeignKey(Submission, on_delete=models.SET_NULL, related_name='+', blank=True, null=True)
+    # Order the job's sheets were finished in (1, 2, ...); sheets of mixed
+    # jobs finish out of index order, so progress is followed by this
+    finish_seq = models.IntegerField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['index']
+        unique_together = ('job', 'index')
+        indexes = [models.Index(fields=['job', 'finish_seq'])]
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+
 class EmailVerificationToken(models.Model):
     """Token for email verification during registration"""
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='verification_tokens')
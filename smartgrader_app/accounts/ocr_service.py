@@ -0,0 +1,383 @@
+"""
+Shared OCR service.
+
+Keeps a pool of warm Tesseract recognizers so OCR does not pay the engine
+start-up and language-data load on every call:
+
+- 'tesserocr': in-process Tesseract API (tesserocr binding), one
+  initialized API per worker thread, reused for every image.
+- 'tesseract': the tesseract command-line tool via pytesseract, a
+  fallback for hosts without tesserocr. It is NOT warm: the CLI cannot be
+  kept running and fed images over a pipe, so every batch starts a new
+  tesseract process and loads the language data again. recognize_batch
+  only amortizes that start-up over the batch, by handing the whole batch
+  to one process through tesseract's image-list input. Install tesserocr
+  (requirements-ocr.txt) where OCR throughput matters.
+
+Requests go through a bounded queue (submit blocks while it is full) and
+every call is timed. Use get_ocr_service() to get the process-wide
+instance shared by the upload path and the offline tools.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+try:
+    import tesserocr
+    from PIL import Image
+    HAS_TESSEROCR = True
+except ImportError:
+    HAS_TESSEROCR = False
+
+try:
+    import pytesseract
+    from pytesseract import Output
+    HAS_PYTESSERACT = True
+except ImportError:
+    HAS_PYTESSERACT = False
+
+OCR_BACKENDS = ('tesserocr', 'tesseract')
+
+# Number of recent call latencies kept for the percentile metrics
+LATENCY_WINDOW = 1000
+
+
+def has_tesseract_binary():
+    """True if pytesseract is installed and the tesseract binary is on PATH"""
+    return HAS_PYTESSERACT and shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
+
+
+def available_backend():
+    """Best OCR backend usable in this environment, or None"""
+    if HAS_TESSEROCR:
+        return 'tesserocr'
+    if has_tesseract_binary():
+        return 'tesseract'
+    return None
+
+
+def _empty_result():
+    return {'text': '', 'words': [], 'confidence': -1}
+
+
+def _words_to_result(words):
+    """
+    Build a recognition result from (line_key, word, confidence) tuples
+
+    Words on the same line are joined with spaces and lines with newlines,
+    so multi-line page segmentation modes still give line-structured text.
+    """
+    if not words:
+        return _empty_result()
+
+    lines = []
+    previous_line = None
+    for line_key, word, _ in words:
+        if line_key != previous_line:
+            lines.append([])
+            previous_line = line_key
+        lines[-1].append(word)
+
+    confidences = [conf for _, _, conf in words]
+    return {
+        'text': "\n".join(' '.join(line) for line in lines),
+        'words': [(word, conf) for _, word, conf in words],
+        'confidence': sum(confidences) / len(confidences)
+    }
+
+
+def _data_to_result(data):
+    """Convert pytesseract image_to_data output (DICT) to a recognition result"""
+    words = []
+    for i, text in enumerate(data['text']):
+        text = text.strip()
+        conf = float(data['conf'][i])
+        if text and conf >= 0:
+            line_key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            words.append((line_key, text, conf))
+    return _words_to_result(words)
+
+
+def parse_tsv_pages(tsv_text, page_count):
+    """
+    Split tesseract TSV output covering several input images into one
+    recognition result per image (TSV page_num is 1-based)
+    """
+    pages = [[] for _ in range(page_count)]
+    rows = tsv_text.splitlines()
+    if not rows:
+        return [_empty_result() for _ in range(page_count)]
+
+    header = rows[0].split('\t')
+    columns = {name: index for index, name in enumerate(header)}
+    for row in rows[1:]:
+        fields = row.split('\t')
+        if len(fields) < len(header):
+            continue
+        text = fields[columns['text']].strip()
+        conf = float(fields[columns['conf']])
+        page = int(fields[columns['page_num']]) - 1
+        if text and conf >= 0 and 0 <= page < page_count:
+            line_key = tuple(fields[columns[name]] for name in ('block_num', 'par_num', 'line_num'))
+            pages[page].append((line_key, text, conf))
+
+    return [_words_to_result(words) for words in pages]
+
+
+def _tesseract_config(psm, whitelist):
+    args = ['--oem', '3', '--psm', str(psm)]
+    if whitelist:
+        args += ['-c', f'tessedit_char_whitelist={whitelist}']
+    return args
+
+
+class OCRService:
+    """
+    Pool of OCR workers with a bounded request queue
+
+    Workers keep a warm recognizer only with the tesserocr backend; with
+    the tesseract CLI backend each call starts one process (see metrics()
+    'warm' and 'subprocesses').
+
+    Args:
+        workers: Number of recognizer threads
+        max_queue: Maximum number of requests queued or running at once;
+            submit() blocks while the queue is full
+        backend: 'tesserocr', 'tesseract' or None to pick the best available
+        lang: Tesseract language
+    """
+
+    def __init__(self, workers=2, max_queue=64, backend=None, lang='eng'):
+        backend = backend or available_backend()
+        if backend not in OCR_BACKENDS:
+            raise RuntimeError("No OCR backend available (install tesserocr or the tesseract binary)")
+        if backend == 'tesserocr' and not HAS_TESSEROCR:
+            raise RuntimeError("tesserocr is not installed")
+
+        self.backend = backend
+        self.lang = lang
+        self.pid = os.getpid()
+        self.workers = max(1, workers)
+        self.max_queue = max(self.workers, max_queue)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ocr')
+        self._slots = threading.BoundedSemaphore(self.max_queue)
+        self._local = threading.local()
+        self._apis = []
+        self._lock = threading.Lock()
+
+        self._calls = 0
+        self._images = 0
+        self._subprocesses = 0
+        self._total_ms = 0.0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    # ---- backends ----
+
+    def _api(self):
+        """This worker thread's tesserocr API, created on first use"""
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(lang=self.lang)
+            self._local.api = api
+            with self._lock:
+                self._apis.append(api)
+        return api
+
+    def _recognize_tesserocr(self, images, psm, whitelist):
+        api = self._api()
+        api.SetPageSegMode(psm)
+        api.SetVariable('tessedit_char_whitelist', whitelist or '')
+
+        results = []
+        for img in images:
+            api.SetImage(Image.fromarray(img))
+            api.Recognize()
+            words = []
+            iterator = api.GetIterator()
+            level = tesserocr.RIL.WORD
+            for word in tesserocr.iterate_level(iterator, level):
+                text = (word.GetUTF8Text(level) or '').strip()
+                if text:
+                    line_key = word.BoundingBox(tesserocr.RIL.TEXTLINE)
+                    words.append((line_key, text, word.Confidence(level)))
+            results.append(_words_to_result(words))
+        return results, 0
+
+    def _recognize_tesseract(self, images, psm, whitelist):
+        # Uncached: one tesseract process per call, started and torn down here
+        if len(images) == 1:
+            config = ' '.join(_tesseract_config(psm, whitelist))
+            data = pytesseract.image_to_data(images[0], lang=self.lang, config=config,
+                                             output_type=Output.DICT)
+            return [_data_to_result(data)], 1
+
+        # One tesseract process for the whole batch via an image-list file
+        with tempfile.TemporaryDirectory(prefix='ocr_') as tmp:
+            paths = []
+            for i, img in enumerate(images):
+                path = os.path.join(tmp, f"{i:05d}.png")
+                cv2.imwrite(path, img)
+                paths.append(path)
+
+            list_path = os.path.join(tmp, 'images.txt')
+            with open(list_path, 'w') as f:
+                f.write("\n".join(paths) + "\n")
+
+            out_base = os.path.join(tmp, 'out')
+            command = [pytesseract.pytesseract.tesseract_cmd, list_path, out_base, '-l', self.lang]
+            command += _tesseract_config(psm, whitelist) + ['tsv']
+            subprocess.run(command, check=True, capture_output=True)
+
+            with open(out_base + '.tsv', encoding='utf-8') as f:
+                return parse_tsv_pages(f.read(), len(images)), 1
+
+    def _run(self, images, psm, whitelist):
+        start = time.perf_counter()
+        if self.backend == 'tesserocr':
+            results, subprocesses = self._recognize_tesserocr(images, psm, whitelist)
+        else:
+            results, subprocesses = self._recognize_tesseract(images, psm, whitelist)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self._calls += 1
+            self._images += len(images)
+            self._subprocesses += subprocesses
+            self._total_ms += elapsed_ms
+            self._latencies.append(elapsed_ms)
+        return results
+
+    # ---- public API ----
+
+    def submit(self, images, psm=7, whitelist=None):
+        """
+        Queue one batch of images for recognition
+
+        Blocks while max_queue requests are already queued or running.
+
+        Args:
+            images: List of uint8 grayscale or binary images
+            psm: Tesseract page segmentation mode
+            whitelist: Optional string of allowed characters
+
+        Returns:
+            Future resolving to a list of result dicts ('text', 'words',
+            'confidence'), one per image
+        """
+        images = [np.ascontiguousarray(img) for img in images]
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._run, images, psm, whitelist)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def recognize_batch(self, images, psm=7, whitelist=None):
+        """Recognize a list of images with the same settings, in order"""
+        if not images:
+            return []
+        return self.submit(images, psm, whitelist).result()
+
+    def recognize(self, image, psm=7, whitelist=None):
+        """Recognize a single image"""
+        return self.recognize_batch([image], psm, whitelist)[0]
+
+    def metrics(self):
+        """
+        Latency and throughput counters since the service started
+
+        Returns:
+            dict with backend, warm (recognizers kept loaded between calls),
+            calls, images, subprocesses, mean/p50/p95/max call latency in
+            milliseconds
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            calls, images, subprocesses, total_ms = (
+                self._calls, self._images, self._subprocesses, self._total_ms
+            )
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1)
+
+        return {
+            'backend': self.backend,
+            'warm': self.backend == 'tesserocr',
+            'workers': self.workers,
+            'calls': calls,
+            'images': images,
+            'subprocesses': subprocesses,
+            'mean_ms': round(total_ms / calls, 1) if calls else 0.0,
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'max_ms': round(latencies[-1], 1) if latencies else 0.0,
+        }
+
+    def close(self):
+        """Stop the workers and release the recognizers"""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for api in self._apis:
+                api.End()
+            self._apis = []
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def _configured_options():
+    """OCR_* options from Django settings when running inside the project"""
+    try:
+        from django.conf import settings
+        if settings.configured:
+            return {
+                'workers': getattr(settings, 'OCR_WORKERS', 2),
+                'max_queue': getattr(settings, 'OCR_QUEUE_SIZE', 64),
+                'backend': getattr(settings, 'OCR_BACKEND', None) or None,
+            }
+    except ImportError:
+        pass
+    return {}
+
+
+def get_ocr_service():
+    """
+    Process-wide shared OCRService, created on first use
+
+    Returns:
+        OCRService, or None when no OCR backend is available
+    """
+    global _service
+    # A forked worker (e.g. the batch grading pool) inherits the parent's
+    # service object but not its threads, so it needs its own
+    if _service is None or _service.pid != os.getpid():
+        with _service_lock:
+            if _service is None or _service.pid != os.getpid():
+                options = _configured_options()
+                if not (options.get('backend') or available_backend()):
+                    return None
+                _service = OCRService(**options)
+    return _service
+
+
+def shutdown_ocr_service():
+    """Close the shared service (the next get_ocr_service() starts a new one)"""
+    global _service
+    with _service_lock:
+        if _service is not None:
+            _service.close()
+            _service = None
@@ -1,21 +1,87 @@
 import cv2
+import logging
 import numpy as np
 import sys
 import os
 import re
-import traceback
+import time
+from functools import lru_cache
 
 # Add grade_processor to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'grade_processor'))
 import utils
 
-# Try to import pytesseract for OCR
-try:
-    import pytesseract
-    HAS_TESSERACT = True
-except ImportError:
-    HAS_TESSERACT = False
-    print("Warning: pytesseract not installed. OCR name extraction will be disabled.")
+from .ocr_service import get_ocr_service
+from .scan_pages import ScanPage, render_scan_page
+
+logger = logging.getLogger(__name__)
+
+# Layout version of sheets printed before layout templates existed. These are
+# decoded by slicing the whole localized grid into equal cells.
+LEGACY_LAYOUT_VERSION = 1
+LEGACY_SHEET_SIZE = (550, 700)
+
+# Gray level at or below which a pixel counts as a pencil mark
+MARK_THRESHOLD = 150
+
+# Fill ratios are stored with each submission as one byte per bubble,
+# ratio * FILL_MATRIX_SCALE (see pack_fill_matrix)
+FILL_MATRIX_SCALE = 255
+
+# Only the inner part of each bubble is sampled so its printed outline is not counted
+BUBBLE_SAMPLE_FRACTION = 0.7
+
+# Longest side of the downscaled image the fiducial marker detector runs on
+FIDUCIAL_DETECTION_SIZE = 640
+
+# Longest side the sheet QR code is searched at before trying full resolution
+QR_DETECTION_SIZE = 1000
+
+# Decode flags for reading an image straight to grayscale at 1/1, 1/2, 1/4
+# and 1/8 resolution (JPEG is scaled inside the decoder, so reduced decodes
+# are also faster)
+GRAYSCALE_DECODE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+# Name/surname boxes are warped to this height (in pixels) before OCR
+OCR_LINE_HEIGHT = 64
+
+# Tesseract word confidence (0-100) below which other preprocessing variants are tried
+OCR_MIN_CONFIDENCE = 60
+
+# Characters allowed in a name
+OCR_NAME_WHITELIST = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-'
+
+
+def decode_sheet_image(source, reduction=1, layout=None):
+    """
+    Decode a sheet image straight to grayscale
+
+    Args:
+        source: Path to an image file, the encoded image itself as bytes,
+            bytearray or memoryview (decoded in place, without a copy), or a
+            ScanPage of a multi-page PDF/TIFF scan (rasterized on the spot)
+        reduction: Decode at 1/reduction of the full resolution (1, 2, 4 or 8)
+        layout: Layout template of the sheet, sets the PDF render resolution
+
+    Returns:
+        uint8 grayscale image, or None if the data cannot be decoded
+    """
+    if isinstance(source, ScanPage):
+        return render_scan_page(source, layout, reduction)
+
+    flags = GRAYSCALE_DECODE_FLAGS[reduction]
+    if isinstance(source, (str, os.PathLike)):
+        return cv2.imread(os.fspath(source), flags)
+
+    buffer = np.frombuffer(source, dtype=np.uint8)
+    if buffer.size == 0:
+        return None
+    return cv2.imdecode(buffer, flags)
 
 
 def order_points(pts):
@@ -33,8 +99,15 @@ def order_points(pts):
     return rect
 
 
-def find_answer_sheet(contours, img_original):
-    """Find the largest rectangular contour (answer sheet)"""
+def find_sheet_transform(contours, output_size=LEGACY_SHEET_SIZE, target_box=(0, 0, 1, 1)):
+    """
+    Find the largest rectangular contour (answer sheet) and the perspective
+    transform mapping it onto target_box, given in normalized coordinates of
+    the output image (the whole output by default).
+
+    Returns:
+        3x3 transform matrix, or None if no rectangle was found
+    """
     largest_area = 0
     largest_contour = None
 
@@ -48,27 +121,197 @@ def find_answer_sheet(contours, img_original):
                 largest_area = area
                 largest_contour = approx
 
-    if largest_contour is not None:
-        pts = largest_contour.reshape(4, 2)
-        rect = order_points(pts)
+    if largest_contour is None:
+        return None
+
+    pts = largest_contour.reshape(4, 2)
+    rect = order_points(pts)
+
+    output_width, output_height = output_size
+    left, top, right, bottom = target_box
+
+    dst = np.array([
+        [left * (output_width - 1), top * (output_height - 1)],
+        [right * (output_width - 1), top * (output_height - 1)],
+        [right * (output_width - 1), bottom * (output_height - 1)],
+        [left * (output_width - 1), bottom * (output_height - 1)]
+    ], dtype="float32")
+
+    return cv2.getPerspectiveTransform(rect, dst)
+
+
+def find_answer_sheet(contours, img_original, output_size=LEGACY_SHEET_SIZE, target_box=(0, 0, 1, 1)):
+    """Find the largest rectangular contour (answer sheet) and warp it"""
+    M = find_sheet_transform(contours, output_size, target_box)
+    if M is None:
+        return None
+    return cv2.warpPerspective(img_original, M, output_size)
+
+
+def find_fiducials(img_gray):
+    """
+    Find the four solid square markers printed in the page corners
+
+    Detection runs on a downscaled copy of the image, so its cost stays
+    roughly the same whatever the photo resolution.
+
+    Returns:
+        float32 array with the marker centers (top-left, top-right,
+        bottom-right, bottom-left) in img_gray pixels, or None
+    """
+    height, width = img_gray.shape
+    scale = min(1.0, FIDUCIAL_DETECTION_SIZE / max(height, width))
+    small = cv2.resize(img_gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+
+    _, binary = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(binary, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+    image_area = small.shape[0] * small.shape[1]
+    centers = []
+    areas = []
+
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        if not image_area * 0.0002 <= area <= image_area * 0.01:
+            continue
+
+        # Square: fills its rotated bounding box and has equal sides
+        (cx, cy), (w, h), _ = cv2.minAreaRect(contour)
+        if area < 0.75 * w * h or not 0.7 <= w / h <= 1.4:
+            continue
+
+        # Solid: rejects hollow squares such as the QR code finder patterns
+        x, y, bw, bh = cv2.boundingRect(contour)
+        inner = cv2.countNonZero(binary[y:y + bh, x:x + bw])
+        if inner < 0.9 * area:
+            continue
+
+        # Printed on paper: the band around the marker must be blank, which
+        # rejects dark squares in the background around the page
+        x0, y0 = max(x - bw // 2, 0), max(y - bh // 2, 0)
+        x1, y1 = x + bw + bw // 2, y + bh + bh // 2
+        band = binary[y0:y1, x0:x1]
+        if cv2.countNonZero(band) - inner > 0.1 * (band.size - bw * bh):
+            continue
 
-        output_width = 550
-        output_height = 700
+        centers.append((cx, cy))
+        areas.append(area)
 
-        dst = np.array([
-            [0, 0],
-            [output_width - 1, 0],
-            [output_width - 1, output_height - 1],
-            [0, output_height - 1]
-        ], dtype="float32")
+    if len(centers) < 4:
+        return None
 
-        M = cv2.getPerspectiveTransform(rect, dst)
-        warped = cv2.warpPerspective(img_original, M, (output_width, output_height))
+    centers = np.array(centers, dtype="float32")
+    areas = np.array(areas)
+
+    # The markers are the outermost squares in each diagonal direction
+    s = centers.sum(axis=1)
+    diff = centers[:, 0] - centers[:, 1]
+    chosen = [np.argmin(s), np.argmax(diff), np.argmax(s), np.argmin(diff)]
+
+    if len(set(chosen)) < 4 or areas[chosen].max() > 3 * areas[chosen].min():
+        return None
 
-        return warped
-    else:
+    quad = centers[chosen]
+    if not cv2.isContourConvex(quad) or cv2.contourArea(quad) < 0.2 * image_area:
         return None
 
+    return quad / scale
+
+
+def locate_answer_sheet(img_gray, layout=None):
+    """
+    Find the answer sheet in a photo and warp it into the layout frame
+
+    Sheets printed with fiducial markers are located from the markers.
+    Otherwise (or if the markers are not visible) the largest quadrilateral,
+    the answer grid rectangle, is used.
+
+    Returns:
+        (warped, transform, method) where transform maps img_gray pixels to
+        warped sheet pixels and method is 'fiducials' or 'contour',
+        or (None, None, None) if the sheet could not be found
+    """
+    output_size = tuple(layout['sample_size']) if layout else LEGACY_SHEET_SIZE
+    output_width, output_height = output_size
+
+    if layout and 'fiducials' in layout:
+        markers = find_fiducials(img_gray)
+        if markers is not None:
+            dst = np.array([
+                [0, 0],
+                [output_width - 1, 0],
+                [output_width - 1, output_height - 1],
+                [0, output_height - 1]
+            ], dtype="float32")
+            M = cv2.getPerspectiveTransform(markers, dst)
+            return cv2.warpPerspective(img_gray, M, output_size), M, 'fiducials'
+
+    # Fall back to the contour search on a small copy of the image
+    img_small = cv2.resize(img_gray, LEGACY_SHEET_SIZE)
+    img_blur = cv2.GaussianBlur(img_small, (5, 5), 1)
+    img_canny = cv2.Canny(img_blur, 10, 50)
+    contours, _ = cv2.findContours(img_canny, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+
+    grid_box = tuple(layout.get('grid_box', (0, 0, 1, 1))) if layout else (0, 0, 1, 1)
+    M = find_sheet_transform(contours, output_size, grid_box)
+    if M is None:
+        return None, None, None
+
+    # Express the transform relative to the full-size image
+    height, width = img_gray.shape
+    to_small = np.diag([LEGACY_SHEET_SIZE[0] / width, LEGACY_SHEET_SIZE[1] / height, 1.0])
+    return cv2.warpPerspective(img_small, M, output_size), M @ to_small, 'contour'
+
+
+def parse_sheet_qr(data):
+    """
+    Parse an answer-sheet QR payload
+
+    Accepts "SG:<test id>:<layout version>" and the bare test id printed
+    on older sheets.
+
+    Returns:
+        (test_id, layout_version) with layout_version None if not encoded,
+        or None if the payload is not a SmartGrader sheet code
+    """
+    data = (data or '').strip()
+    match = re.fullmatch(r'SG:(\d+):(\d+)', data)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    if data.isdigit():
+        return int(data), None
+    return None
+
+
+def read_sheet_qr(source):
+    """
+    Read the QR code of an answer sheet image with as little decoding as possible
+
+    The image is first decoded at a quarter of its resolution (JPEG decodes
+    this directly from the DCT, so it is much cheaper than a full decode);
+    only if no code is found there is it decoded again at full resolution.
+
+    Args:
+        source: Image path, encoded image buffer or scan page (see decode_sheet_image)
+
+    Returns:
+        (test_id, layout_version) as returned by parse_sheet_qr, or None
+    """
+    for reduction in (4, 1):
+        img = decode_sheet_image(source, reduction)
+        if img is None:
+            return None
+
+        scale = QR_DETECTION_SIZE / max(img.shape)
+        if scale < 1:
+            img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        route = parse_sheet_qr(utils.qr_decoder(img))
+        if route:
+            return route
+
+    return None
+
 
 def extract_student_info(img, debug_path=None):
     """
@@ -81,16 +324,19 @@ def extract_student_info(img, debug_path=None):
     Returns:
         dict with 'first_name', 'last_name', and 'debug_text' keys
     """
-    if not HAS_TESSERACT:
+    service = get_ocr_service()
+    if service is None:
         return {'first_name': None, 'last_name': None, 'debug_text': 'Tesseract not installed'}
 
+    start_time = time.perf_counter()
+    ocr_calls = 0
+
     try:
         # Extract top portion of image (first 25% contains name/surname fields)
         height, width = img.shape
         name_region = img[0:int(height * 0.25), :]
 
-        print(f"\n=== OCR Name Extraction ===")
-        print(f"Image region size: {name_region.shape}")
+        logger.debug("OCR name extraction, region %s", name_region.shape)
 
         # Save original region for debugging
         if debug_path:
@@ -120,58 +366,273 @@ def extract_student_info(img, debug_path=None):
         _, enhanced = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
         preprocessed_images.append(('enhanced', enhanced))
 
-        # Try OCR on each preprocessed version
+        # Try OCR on each preprocessed version with multiple PSM modes. All
+        # versions go to the shared service as one batch per mode, queued at
+        # once: with the tesseract backend that is one process per mode
+        # instead of one per version and mode
+        images = [processed_img for _, processed_img in preprocessed_images]
+        batches = {psm: service.submit(images, psm=psm) for psm in LEGACY_NAME_OCR_PSMS}
+        ocr_calls = len(batches)
+
         best_result = {'first_name': None, 'last_name': None}
         all_texts = []
 
-        for method_name, processed_img in preprocessed_images:
+        for index, (method_name, processed_img) in enumerate(preprocessed_images):
             if debug_path:
                 cv2.imwrite(f"{debug_path}_2_{method_name}.png", processed_img)
 
-            # Try multiple PSM modes
-            for psm in [6, 11, 13]:
+            for psm, batch in batches.items():
                 try:
-                    config = f'--oem 3 --psm {psm}'
-                    text = pytesseract.image_to_string(processed_img, config=config)
-                    all_texts.append(f"\n--- {method_name} (PSM {psm}) ---\n{text}")
-
-                    # Parse the extracted text
-                    result = parse_name_from_text(text)
-
-                    # Keep the best result (one with both names if possible)
-                    if result['first_name'] and result['last_name']:
-                        print(f"✓ Found both names using {method_name} PSM {psm}")
-                        best_result = result
-                        break
-                    elif result['first_name'] or result['last_name']:
-                        if not best_result['first_name'] and result['first_name']:
-                            best_result['first_name'] = result['first_name']
-                        if not best_result['last_name'] and result['last_name']:
-                            best_result['last_name'] = result['last_name']
+                    text = batch.result()[index]['text']
                 except Exception as e:
-                    print(f"Error with {method_name} PSM {psm}: {e}")
+                    logger.warning("OCR failed for %s PSM %s: %s", method_name, psm, e)
                     continue
+                all_texts.append(f"\n--- {method_name} (PSM {psm}) ---\n{text}")
+
+                # Parse the extracted text
+                result = parse_name_from_text(text)
+
+                # Keep the best result (one with both names if possible)
+                if result['first_name'] and result['last_name']:
+                    logger.debug("Found both names using %s PSM %s", method_name, psm)
+                    best_result = result
+                    break
+                elif result['first_name'] or result['last_name']:
+                    if not best_result['first_name'] and result['first_name']:
+                        best_result['first_name'] = result['first_name']
+                    if not best_result['last_name'] and result['last_name']:
+                        best_result['last_name'] = result['last_name']
 
             # If we found both names, no need to try more methods
             if best_result['first_name'] and best_result['last_name']:
                 break
 
         debug_text = "\n".join(all_texts)
-        print(f"\nFinal result - First: {best_result['first_name']}, Last: {best_result['last_name']}")
+        logger.debug("Read names: first %r, last %r", best_result['first_name'], best_result['last_name'])
 
         return {
             'first_name': best_result['first_name'],
             'last_name': best_result['last_name'],
-            'debug_text': debug_text
+            'debug_text': debug_text,
+            'ocr_time_ms': round((time.perf_counter() - start_time) * 1000, 1),
+            'ocr_calls': ocr_calls
         }
 
     except Exception as e:
         error_msg = f"Error extracting student info: {e}"
-        print(error_msg)
-        traceback.print_exc()
+        logger.exception("Error extracting student info")
         return {'first_name': None, 'last_name': None, 'debug_text': error_msg}
 
 
+def crop_layout_roi(img_gray, transform, layout, roi, height=OCR_LINE_HEIGHT, inset=0.1):
+    """
+    Warp one layout ROI straight out of the photo at OCR resolution
+
+    Args:
+        img_gray: Grayscale photo of the sheet
+        transform: Photo-to-sheet transform from locate_answer_sheet
+        layout: Answer-sheet layout template
+        roi: [left, top, right, bottom] in normalized frame coordinates
+        height: Output height in pixels (width follows the box aspect ratio)
+        inset: Margin trimmed on every side, as a fraction of the box height,
+            so the printed box border is left out
+
+    Returns:
+        Grayscale image of the box contents
+    """
+    frame_w, frame_h = layout['frame']['width'], layout['frame']['height']
+    sheet_w, sheet_h = layout['sample_size']
+    left, top, right, bottom = roi
+
+    # Trim the same physical margin horizontally and vertically
+    margin = (bottom - top) * frame_h * inset
+    left, right = left + margin / frame_w, right - margin / frame_w
+    top, bottom = top + margin / frame_h, bottom - margin / frame_h
+
+    width = int(round(height * (right - left) * frame_w / ((bottom - top) * frame_h)))
+
+    # Sheet pixels -> ROI pixels, composed with photo -> sheet pixels
+    x0, y0 = left * (sheet_w - 1), top * (sheet_h - 1)
+    sx = width / ((right - left) * (sheet_w - 1))
+    sy = height / ((bottom - top) * (sheet_h - 1))
+    to_roi = np.array([[sx, 0, -x0 * sx], [0, sy, -y0 * sy], [0, 0, 1]])
+
+    return cv2.warpPerspective(img_gray, to_roi @ transform, (width, height), borderValue=255)
+
+
+# Grid (columns, rows) each name box is reduced to for the sheet hash
+SHEET_HASH_GRID = (64, 12)
+
+# A hash cell is inked if at least this fraction of it is darker than
+# SHEET_HASH_INK_LEVEL times the box background
+SHEET_HASH_CELL_FILL = 0.2
+SHEET_HASH_INK_LEVEL = 0.6
+
+# Sheet hashes at most this far apart (share of differing inked cells) may
+# be scans of the same handwriting. Photos of one sheet measure up to ~0.28,
+# but similar names come much closer (Maria/Mara Ionescu ~0.09), so a match
+# only flags a sheet as a possible rescan (see accounts.sheet_cache)
+SHEET_HASH_MAX_DISTANCE = 0.3
+
+
+def sheet_hash(img_gray, transform, layout):
+    """
+    Perceptual hash of a sheet: where the handwriting in the name boxes is
+
+    Every answer sheet of a test is the same printed page, so the hash is
+    taken over what makes a sheet unique. Each name box is warped out of
+    the photo, normalized to its own paper brightness (so exposure and
+    scanner differences cancel out) and reduced to a grid of inked/blank
+    cells. Rescans of the same sheet give nearly the same grid.
+
+    Returns:
+        Hex string, or None if both boxes are blank (nothing to tell
+        sheets apart by)
+    """
+    cols, rows = SHEET_HASH_GRID
+    cells = []
+    for roi in layout['name_boxes'].values():
+        box = crop_layout_roi(img_gray, transform, layout, roi, height=rows * 4).astype(np.float32)
+        paper = np.percentile(box, 90)
+        ink = (box < SHEET_HASH_INK_LEVEL * paper).astype(np.float32)
+        cells.append(cv2.resize(ink, (cols, rows), interpolation=cv2.INTER_AREA) >= SHEET_HASH_CELL_FILL)
+
+    bits = np.concatenate([cell.ravel() for cell in cells])
+    if np.count_nonzero(bits) < 4:
+        return None
+    return np.packbits(bits).tobytes().hex()
+
+
+def sheet_hash_distance(hash_a, hash_b):
+    """Share of inked cells that differ between two sheet hashes (0 = same)"""
+    a, b = int(hash_a, 16), int(hash_b, 16)
+    inked = (a | b).bit_count()
+    return (a ^ b).bit_count() / inked if inked else 0.0
+
+
+# Page segmentation modes the legacy name region is read with
+LEGACY_NAME_OCR_PSMS = (6, 11, 13)
+
+
+# Preprocessing variants for the name boxes, in the order they are tried
+NAME_OCR_VARIANTS = [
+    ('otsu', lambda img: cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]),
+    ('adaptive', lambda img: cv2.adaptiveThreshold(
+        img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10)),
+    ('gray', lambda img: img),
+]
+
+
+def clean_name_words(words):
+    """
+    Keep only name characters from recognized (word, confidence) pairs
+
+    Returns:
+        (text, confidence) with confidence the mean over the kept words,
+        or (None, -1) if nothing is left
+    """
+    kept = []
+    for word, conf in words:
+        word = re.sub(r'[^A-Za-z\-]', '', word).strip('-')
+        if word:
+            kept.append((word, conf))
+
+    if not kept:
+        return None, -1
+    return ' '.join(word for word, _ in kept), sum(conf for _, conf in kept) / len(kept)
+
+
+def ocr_name_boxes(rois, service):
+    """
+    Read the handwritten names in a list of boxes
+
+    Every box starts with one single-line recognition on an Otsu-binarized
+    crop; only boxes still below OCR_MIN_CONFIDENCE move on to the next
+    preprocessing variant. Each round is sent to the OCR service as one
+    batch.
+
+    Returns:
+        List of dicts with 'text', 'confidence', 'variant' and 'calls' keys
+    """
+    readings = [{'text': None, 'confidence': -1, 'variant': None, 'calls': 0} for _ in rois]
+
+    # Nothing written in the box: skip OCR entirely
+    pending = []
+    for i, roi in enumerate(rois):
+        if np.count_nonzero(roi <= MARK_THRESHOLD) < 0.005 * roi.size:
+            readings[i]['variant'] = 'blank'
+        else:
+            pending.append(i)
+
+    for name, preprocess in NAME_OCR_VARIANTS:
+        if not pending:
+            break
+
+        results = service.recognize_batch(
+            [preprocess(rois[i]) for i in pending], psm=7, whitelist=OCR_NAME_WHITELIST
+        )
+        for i, result in zip(pending, results):
+            text, confidence = clean_name_words(result['words'])
+            readings[i]['calls'] += 1
+            if text and confidence > readings[i]['confidence']:
+                readings[i].update(text=text, confidence=confidence, variant=name)
+
+        pending = [i for i in pending if readings[i]['confidence'] < OCR_MIN_CONFIDENCE]
+
+    return readings
+
+
+def extract_student_info_from_layout(img_gray, transform, layout, debug_path=None):
+    """
+    Extract student name and surname from the Name/Surname boxes of the layout
+
+    Args:
+        img_gray: Grayscale photo of the answer sheet
+        transform: Photo-to-sheet transform from locate_answer_sheet
+        layout: Answer-sheet layout template with 'name_boxes'
+        debug_path: Optional path prefix to save the cropped boxes
+
+    Returns:
+        dict with 'first_name', 'last_name', 'debug_text', 'ocr_time_ms'
+        and 'ocr_calls' keys
+    """
+    service = get_ocr_service()
+    if service is None:
+        return {'first_name': None, 'last_name': None, 'debug_text': 'Tesseract not installed'}
+
+    start_time = time.perf_counter()
+    result = {'first_name': None, 'last_name': None}
+    ocr_calls = 0
+
+    try:
+        fields = list(layout['name_boxes'])
+        boxes = [crop_layout_roi(img_gray, transform, layout, layout['name_boxes'][field]) for field in fields]
+        if debug_path:
+            for field, box in zip(fields, boxes):
+                cv2.imwrite(f"{debug_path}_{field}.png", box)
+
+        debug_lines = []
+        for field, reading in zip(fields, ocr_name_boxes(boxes, service)):
+            ocr_calls += reading['calls']
+            result[field] = reading['text']
+            debug_lines.append(
+                f"{field}: '{reading['text']}' (confidence {reading['confidence']:.0f}, "
+                f"{reading['variant']}, {reading['calls']} call(s))"
+            )
+        debug_text = "\n".join(debug_lines)
+    except Exception as e:
+        debug_text = f"Error extracting student info: {e}"
+        logger.exception("Error extracting student info")
+
+    return {
+        'first_name': result['first_name'],
+        'last_name': result['last_name'],
+        'debug_text': debug_text,
+        'ocr_time_ms': round((time.perf_counter() - start_time) * 1000, 1),
+        'ocr_calls': ocr_calls
+    }
+
+
 def find_next_valid_word(lines, start_index, max_lookahead=5):
     """Find the next valid alphabetic word after start_index, skipping empty lines and noise"""
     for j in range(start_index + 1, min(start_index + max_lookahead, len(lines))):
@@ -193,7 +654,7 @@ def parse_name_from_text(text):
     first_name = None
     last_name = None
 
-    print(f"\nParsing text ({len(lines)} lines):")
+    logger.debug("Parsing text (%d lines)", len(lines))
 
     # First pass: look for explicit patterns with colons
     for i, line in enumerate(lines):
@@ -201,41 +662,41 @@ def parse_name_from_text(text):
         if not line:
             continue
 
-        print(f"  Line {i}: '{line}'")
+        logger.debug("  Line %d: %r", i, line)
 
         # Look for "Name:" label (with colon) - NOT surname
         if re.search(r'\bname\s*:', line, re.IGNORECASE) and not re.search(r'surname|last', line, re.IGNORECASE):
-            print(f"    → Found 'Name:' label (with colon)")
+            logger.debug("    Found 'Name:' label (with colon)")
             # Try to extract from same line (e.g., "Name: Gaspar" or "Name:Gaspar")
             match = re.search(r'\bname\s*:\s*([A-Za-z]{2,})', line, re.IGNORECASE)
             if match and match.group(1).lower() != 'name':
                 first_name = match.group(1).strip()
-                print(f"    → ✓ Extracted first name from same line: '{first_name}'")
+                logger.debug("    Extracted first name from same line: %r", first_name)
             else:
                 # Look ahead for the next valid word (skipping empty lines and noise)
                 name, found_line = find_next_valid_word(lines, i)
                 if name:
                     first_name = name
-                    print(f"    → ✓ Extracted first name from line {found_line}: '{first_name}'")
+                    logger.debug("    Extracted first name from line %d: %r", found_line, first_name)
 
         # Look for "Surname:" label (with colon)
         if re.search(r'\bsurname\s*:|\blast\s*name\s*:', line, re.IGNORECASE):
-            print(f"    → Found 'Surname:' or 'Last name:' label (with colon)")
+            logger.debug("    Found 'Surname:' or 'Last name:' label (with colon)")
             # Try to extract from same line
             match = re.search(r'\b(?:surname|last\s*name)\s*:\s*([A-Za-z]{2,})', line, re.IGNORECASE)
             if match and match.group(1).lower() not in ['surname', 'last', 'name']:
                 last_name = match.group(1).strip()
-                print(f"    → ✓ Extracted last name from same line: '{last_name}'")
+                logger.debug("    Extracted last name from same line: %r", last_name)
             else:
                 # Look ahead for the next valid word (skipping empty lines and noise)
                 name, found_line = find_next_valid_word(lines, i)
                 if name:
                     last_name = name
-                    print(f"    → ✓ Extracted last name from line {found_line}: '{last_name}'")
+                    logger.debug("    Extracted last name from line %d: %r", found_line, last_name)
 
     # Second pass: if we still don't have first_name, look for standalone "Name" without colon
     if not first_name:
-        print("\n  Second pass: looking for standalone 'Name' without colon...")
+        logger.debug("  Second pass: looking for standalone 'Name' without colon")
         for i, line in enumerate(lines):
             line = line.strip()
             if not line:
@@ -243,16 +704,16 @@ def parse_name_from_text(text):
 
             # Look for just "Name" word (case insensitive, without surname)
             if re.search(r'^name$', line, re.IGNORECASE):
-                print(f"    → Found standalone 'Name' at line {i}")
+                logger.debug("    Found standalone 'Name' at line %d", i)
                 name, found_line = find_next_valid_word(lines, i)
                 if name:
                     first_name = name
-                    print(f"    → ✓ Extracted first name from line {found_line}: '{first_name}'")
+                    logger.debug("    Extracted first name from line %d: %r", found_line, first_name)
                     break
 
     # Third pass: if still no last_name, look for standalone "Surname"
     if not last_name:
-        print("\n  Third pass: looking for standalone 'Surname' without colon...")
+        logger.debug("  Third pass: looking for standalone 'Surname' without colon")
         for i, line in enumerate(lines):
             line = line.strip()
             if not line:
@@ -260,111 +721,193 @@ def parse_name_from_text(text):
 
             # Look for just "Surname" word
             if re.search(r'^surname$', line, re.IGNORECASE):
-                print(f"    → Found standalone 'Surname' at line {i}")
+                logger.debug("    Found standalone 'Surname' at line %d", i)
                 name, found_line = find_next_valid_word(lines, i)
                 if name:
                     last_name = name
-                    print(f"    → ✓ Extracted last name from line {found_line}: '{last_name}'")
+                    logger.debug("    Extracted last name from line %d: %r", found_line, last_name)
                     break
 
-    print(f"\n  ✓ Final parse result: first_name='{first_name}', last_name='{last_name}'")
+    logger.debug("  Parse result: first_name=%r, last_name=%r", first_name, last_name)
     return {'first_name': first_name, 'last_name': last_name}
 
 
+def score_bubbles(img, num_questions=20, num_options=5):
+    """
+    Score every bubble of one thresholded sheet at once
+
+    Args:
+        img: Thresholded sheet (H, W)
+        num_questions: Number of questions (grid rows)
+        num_options: Number of options per question (grid columns)
+
+    Returns:
+        (fill_ratios, answers) where fill_ratios has shape (Q, O) and
+        answers holds the argmax option per question, or -1 for a blank row
+    """
+    fill_ratios = utils.bubble_fill_ratios(img, num_questions, num_options)
+    return fill_ratios, fill_to_answers(fill_ratios)
+
+
+def fill_to_answers(fill_ratios):
+    """Pick the most filled option per question (-1 where nothing is filled)"""
+    answers = fill_ratios.argmax(axis=-1)
+    answers[fill_ratios.max(axis=-1) == 0] = -1
+    return answers
+
+
+def answers_to_list(answers):
+    """Convert an answer vector from score_bubbles to a list (None for blank)"""
+    return [int(a) if a >= 0 else None for a in answers]
+
+
+def pack_fill_matrix(fill_ratios):
+    """
+    Quantize a (Q, O) fill-ratio matrix to one byte per bubble
+
+    Ratios are rounded up, so a bubble with any mark in it stays non-zero
+    and fill_to_answers gives the same answers on the unpacked matrix.
+
+    Returns:
+        Q * O bytes, row-major (see accounts.rescoring.unpack_fill_matrices)
+    """
+    scaled = np.ceil(np.clip(fill_ratios, 0, 1) * FILL_MATRIX_SCALE)
+    return scaled.astype(np.uint8).tobytes()
+
+
 def detect_answers(img, num_questions=20, num_options=5):
     """
     Detect marked answers on OMR sheet
     Returns array of selected answer indices for each question
     """
-    # Ensure image dimensions are divisible
-    height, width = img.shape
+    _, answers = score_bubbles(img, num_questions, num_options)
+    return answers_to_list(answers)
+
 
-    # Calculate target dimensions that are evenly divisible
-    target_height = (height // num_questions) * num_questions
-    target_width = (width // num_options) * num_options
+@lru_cache(maxsize=64)
+def _bubble_index_map(centers, radius, width, height):
+    """Flat pixel indices of the sampled area of every bubble, shape (Q, O, K)"""
+    centers = np.asarray(centers, dtype=np.float64) * (width, height)
+    rx = radius[0] * width * BUBBLE_SAMPLE_FRACTION
+    ry = radius[1] * height * BUBBLE_SAMPLE_FRACTION
 
-    # Resize if necessary
-    if height != target_height or width != target_width:
-        img = cv2.resize(img, (target_width, target_height))
+    # Offsets of the pixels inside one (elliptical, after warping) bubble
+    dy, dx = np.mgrid[-int(ry):int(ry) + 1, -int(rx):int(rx) + 1]
+    inside = (dx / rx) ** 2 + (dy / ry) ** 2 <= 1
+    dx, dy = dx[inside], dy[inside]
 
-    # Split into rows (questions)
-    rows = np.vsplit(img, num_questions)
-    detected_answers = []
+    xs = np.clip(np.rint(centers[..., 0])[..., None] + dx, 0, width - 1)
+    ys = np.clip(np.rint(centers[..., 1])[..., None] + dy, 0, height - 1)
+    index = (ys * width + xs).astype(np.intp)
+    index.flags.writeable = False
+    return index
 
-    for row in rows:
-        # Split row into columns (options)
-        cols = np.hsplit(row, num_options)
-        max_white_pixels = 0
-        selected_option = -1
 
-        for idx, col in enumerate(cols):
-            white_pixels = cv2.countNonZero(col)
-            if white_pixels > max_white_pixels:
-                max_white_pixels = white_pixels
-                selected_option = idx
+def bubble_index_map(layout):
+    """
+    Get the cached pixel index map for a layout template
+
+    Returns:
+        (Q, O, K) array of flat indices into a sheet warped to layout['sample_size']
+    """
+    width, height = layout['sample_size']
+    centers = tuple(tuple(tuple(point) for point in row) for row in layout['bubbles']['centers'])
+    return _bubble_index_map(centers, tuple(layout['bubbles']['radius']), width, height)
+
+
+def sample_bubbles(sheet, layout, threshold=MARK_THRESHOLD):
+    """
+    Measure how filled every bubble is using the layout template
+
+    Only the precomputed bubble pixels are read, so the rest of the sheet
+    (header, question numbers, margins) is never thresholded.
 
-        detected_answers.append(selected_option if selected_option != -1 else None)
+    Args:
+        sheet: Warped grayscale sheet (H, W) or stack of sheets (N, H, W)
+            of size layout['sample_size']
+        layout: Answer-sheet layout template
+        threshold: Gray level at or below which a pixel counts as marked
 
-    return detected_answers
+    Returns:
+        float32 fill ratios of shape (..., Q, O)
+    """
+    index = bubble_index_map(layout)
+    flat = sheet.reshape(sheet.shape[:-2] + (-1,))
+    samples = flat[..., index]
+    return (samples <= threshold).mean(axis=-1, dtype=np.float32)
 
 
-def process_omr_image(image_path, num_questions=20, num_options=5):
+def process_omr_image(source, num_questions=20, num_options=5, layout=None, reduction=1):
     """
     Process an OMR image and return detected answers
 
     Args:
-        image_path: Path to the OMR image
+        source: Path to the OMR image, the encoded image bytes
+            (bytes/bytearray/memoryview, decoded without a temp file) or a
+            ScanPage of a multi-page scan
         num_questions: Number of questions on the test
         num_options: Number of options per question (default 5 for A-E)
+        layout: Layout template the sheet was printed with
+            (None for sheets printed before layout templates existed)
+        reduction: Decode the image at 1/reduction resolution (1, 2, 4 or 8),
+            for photos with far more pixels than the pipeline needs
 
     Returns:
-        dict with 'success', 'answers', and 'error' keys
+        dict with 'success', 'answers', and 'error' keys, 'fill_matrix'
+        (the packed fill ratio of every bubble, see pack_fill_matrix);
+        'sheet_hash' for layouts with name boxes (see sheet_hash), and for
+        scan pages 'sheet_image', the rendered page as JPEG bytes to store
     """
     try:
-        # Read image
-        img = cv2.imread(image_path)
-        if img is None:
+        # Decode straight to grayscale
+        img_gray = decode_sheet_image(source, reduction, layout)
+        if img_gray is None:
             return {'success': False, 'error': 'Could not read image file'}
 
-        # Resize
-        imgWidth = 550
-        imgHeight = 700
-        img = cv2.resize(img, (imgWidth, imgHeight))
-
-        # Convert to grayscale
-        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-        # Apply blur
-        img_blur = cv2.GaussianBlur(img_gray, (5, 5), 1)
-
-        # Edge detection
-        img_canny = cv2.Canny(img_blur, 10, 50)
-
-        # Find contours
-        contours, _ = cv2.findContours(img_canny, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-
         # Find and warp answer sheet
-        answer_sheet = find_answer_sheet(contours, img_gray)
+        answer_sheet, transform, localization = locate_answer_sheet(img_gray, layout)
 
         if answer_sheet is None:
             return {'success': False, 'error': 'Could not find answer sheet rectangle in image'}
 
-        # Threshold the image
-        _, img_threshold = cv2.threshold(answer_sheet, 150, 255, cv2.THRESH_BINARY_INV)
+        if layout:
+            # Sample only the bubbles of the printed template
+            fill_ratios = sample_bubbles(answer_sheet, layout)
+            answers = answers_to_list(fill_to_answers(fill_ratios))
+        else:
+            # Threshold the image
+            _, img_threshold = cv2.threshold(answer_sheet, MARK_THRESHOLD, 255, cv2.THRESH_BINARY_INV)
 
-        # Detect answers
-        answers = detect_answers(img_threshold, num_questions, num_options)
+            # Detect answers
+            fill_ratios, answers = score_bubbles(img_threshold, num_questions, num_options)
+            answers = answers_to_list(answers)
 
         # Extract student name information using OCR
-        student_info = extract_student_info(img_gray)
+        if layout and 'name_boxes' in layout:
+            student_info = extract_student_info_from_layout(img_gray, transform, layout)
+        else:
+            student_info = extract_student_info(cv2.resize(img_gray, LEGACY_SHEET_SIZE))
 
-        return {
+        result = {
             'success': True,
             'answers': answers,
+            'fill_matrix': pack_fill_matrix(fill_ratios),
             'student_info': student_info,
+            'layout_version': layout['version'] if layout else LEGACY_LAYOUT_VERSION,
+            'localization': localization,
             'error': None
         }
 
+        if layout and 'name_boxes' in layout:
+            result['sheet_hash'] = sheet_hash(img_gray, transform, layout)
+
+        # Pages of a scan have no image file of their own to keep; encode
+        # the page here, in the worker that rendered it
+        if isinstance(source, ScanPage):
+            result['sheet_image'] = cv2.imencode('.jpg', img_gray, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+        return result
+
     except Exception as e:
         return {
             'success': False,
@@ -400,11 +943,14 @@ def grade_submission(detected_answers, correct_answers):
             'is_correct': is_correct
         })
 
-    percentage = (score / total * 100) if total > 0 else 0
-
     return {
         'score': score,
         'total': total,
-        'percentage': round(percentage, 2),
+        'percentage': score_percentage(score, total),
         'details': details
     }
+
+
+def score_percentage(score, total):
+    """Percentage of a score, rounded to 2 decimals"""
+    return round(score / total * 100, 2) if total > 0 else 0
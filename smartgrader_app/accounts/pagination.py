@@ -0,0 +1,89 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are selected with a WHERE on the sort key of the last row shown
+instead of an OFFSET, so every page costs the same however deep the
+client pages. The sort key must end with a unique field (the id) so rows
+with equal values are neither skipped nor repeated.
+"""
+import base64
+import datetime
+import json
+
+from django.db.models import Q
+
+
+class _CursorEncoder(json.JSONEncoder):
+    # Full precision: DjangoJSONEncoder drops microseconds, which would make
+    # rows created within the same millisecond compare equal
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.date)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    """Opaque URL-safe cursor for a row's sort key values"""
+    data = json.dumps(values, cls=_CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Sort key values of a cursor
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def keyset_page(queryset, fields, descending=False, cursor=None, page_size=25):
+    """
+    One page of a queryset ordered by `fields`
+
+    Args:
+        queryset: Queryset to page through (of instances or values() dicts);
+            `fields` may be annotations
+        fields: Sort key, ending with a unique field (e.g. ['title', 'id'])
+        descending: Sort every field of the key in descending order
+        cursor: Cursor of the previous page's last row (None for the first page)
+        page_size: Rows per page
+
+    Returns:
+        (rows, next_cursor) with next_cursor None on the last page
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(fields):
+            raise ValueError("Invalid cursor")
+        lookup = 'lt' if descending else 'gt'
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+        after = Q()
+        for i, field in enumerate(fields):
+            condition = Q(**{f"{field}__{lookup}": values[i]})
+            for previous, value in zip(fields[:i], values[:i]):
+                condition &= Q(**{previous: value})
+            after |= condition
+        queryset = queryset.filter(after)
+
+    ordering = [f"-{field}" if descending else field for field in fields]
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        key = [last[field] if isinstance(last, dict) else getattr(last, field) for field in fields]
+        next_cursor = encode_cursor(key)
+    return rows, next_cursor
@@ -0,0 +1,52 @@
+"""
+Class rank and percentile of a submission.
+
+A submission's rank only depends on how many classmates scored higher, and
+the materialized score histogram (TestStats.score_histogram, see
+accounts.test_stats) already counts submissions per score. It is the
+test's order-statistics index: rank, percentile and class average are
+read from one row, however large the class.
+"""
+from .test_stats import current_stats
+
+
+def standing_in_histogram(histogram, score):
+    """
+    Rank and percentile of a score among the counted scores
+
+    Args:
+        histogram: Submissions per score (index = score)
+        score: The score to place
+
+    Returns:
+        (rank, percentile): rank is 1 + the number of higher scores (equal
+        scores share a rank); percentile is the share of the class scoring
+        lower, counting half of the equal scores
+    """
+    total = sum(histogram)
+    if not total:
+        return None, None
+    higher = sum(histogram[score + 1:])
+    lower = sum(histogram[:score])
+    equal = total - higher - lower
+    return higher + 1, round((lower + equal / 2) / total * 100, 1)
+
+
+def class_standing(test, submission):
+    """
+    Where a graded submission stands in its class
+
+    Returns:
+        dict with rank, percentile, total_students and class_average
+        (average percentage), or None if no submission is graded yet
+    """
+    stats = current_stats(test)
+    if not stats.count:
+        return None
+    rank, percentile = standing_in_histogram(stats.score_histogram, submission.score)
+    return {
+        'rank': rank,
+        'percentile': percentile,
+        'total_students': stats.count,
+        'class_average': stats.percentage_sum / stats.count,
+    }
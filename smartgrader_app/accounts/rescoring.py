@@ -0,0 +1,235 @@
+"""
+Rescoring and regrading a test in bulk.
+
+Every graded sheet keeps the fill ratio of each of its bubbles
+(Submission.fill_matrix, one byte per bubble, see
+omr_processor.pack_fill_matrix). Deciding which bubble was marked is
+therefore a pure function of those matrices: a whole test is loaded with
+one query, stacked into an (N, Q, O) array and re-decided and rescored in a
+few vectorized operations, without decoding a single image.
+
+The default rules give exactly the answers read at upload time (the most
+filled bubble, blank only when no bubble has a mark in it). Raising
+min_fill ignores stray marks and erasures; double_mark_ratio treats a
+question as blank when its second most filled bubble is nearly as full as
+the first.
+
+Regrading (after an answer-key correction) keeps the answers and only
+scores them again: the test's packed answers are compared with the key as
+one (N, Q) matrix (Submission.objects.answer_matrix). It runs on its own
+whenever a test is saved with a changed answer key (see accounts.signals).
+
+Both rebuild the test's materialized statistics (accounts.test_stats)
+and invalidate its cached values (accounts.caching).
+"""
+import numpy as np
+from django.db import transaction
+
+from .caching import invalidate_test
+from .models import Submission, pack_answers
+from .omr_processor import FILL_MATRIX_SCALE, answers_to_list, score_percentage
+from .test_stats import rebuild_test_stats
+
+BLANK_ANSWER = -1
+
+# Submissions are written back in batches of this size
+RESCORE_BATCH_SIZE = 500
+
+# Most submission ids a regrade sends in one UPDATE
+REGRADE_IDS_PER_QUERY = 5000
+
+
+def unpack_fill_matrices(blobs, num_questions, num_options):
+    """
+    Stack packed fill matrices into one array
+
+    Args:
+        blobs: Packed matrices (bytes or memoryview), Q * O bytes each
+        num_questions: Q
+        num_options: O
+
+    Returns:
+        uint8 array of shape (N, Q, O), ratio * FILL_MATRIX_SCALE
+    """
+    data = np.frombuffer(b''.join(blobs), dtype=np.uint8)
+    return data.reshape(-1, num_questions, num_options)
+
+
+def derive_answers(fill, min_fill=0.0, double_mark_ratio=None):
+    """
+    Decide the marked option of every question of a stack of sheets
+
+    Args:
+        fill: (N, Q, O) packed fill ratios
+        min_fill: A bubble counts as marked when more than this share of it
+            is filled
+        double_mark_ratio: If set, questions whose second most filled marked
+            bubble has at least this fraction of the fill of the first are
+            double marks and count as blank
+
+    Returns:
+        (answers, double_marks): int16 (N, Q) option indices with
+        BLANK_ANSWER for blank questions, and a boolean (N, Q) mask of the
+        double marks
+    """
+    level = min_fill * FILL_MATRIX_SCALE
+    answers = fill.argmax(axis=-1).astype(np.int16)
+    top = fill.max(axis=-1)
+    marked = top > level
+
+    double_marks = np.zeros(answers.shape, dtype=bool)
+    if double_mark_ratio is not None and fill.shape[-1] > 1:
+        second = np.partition(fill, -2, axis=-1)[..., -2]
+        double_marks = marked & (second > level) & (second >= double_mark_ratio * top.astype(np.float32))
+
+    answers[~marked | double_marks] = BLANK_ANSWER
+    return answers, double_marks
+
+
+def score_answers(answers, correct_answers):
+    """
+    Score a stack of answer vectors against the answer key
+
+    Args:
+        answers: (N, Q) option indices (BLANK_ANSWER for blank)
+        correct_answers: Correct option index of every question
+
+    Returns:
+        (scores, percentages) as (N,) arrays, percentages exactly as
+        grade_submission rounds them
+    """
+    key = np.asarray(correct_answers, dtype=answers.dtype)
+    scores = (answers == key).sum(axis=-1)
+    total = len(correct_answers)
+    percentages = np.array([score_percentage(score, total) for score in range(total + 1)])[scores]
+    return scores, percentages
+
+
+
+def rescore_test(test, min_fill=0.0, double_mark_ratio=None, dry_run=False):
+    """
+    Re-derive the answers and scores of all of a test's graded sheets
+
+    Args:
+        test: Test to rescore
+        min_fill, double_mark_ratio: Mark decision rules (see derive_answers)
+        dry_run: Only report what would change
+
+    Returns:
+        dict with the number of submissions rescored and updated, those
+        without stored fill ratios (graded before they were kept), and the
+        blank and double-marked answers found
+    """
+    num_questions, num_options = test.num_questions, test.num_options
+    matrix_size = num_questions * num_options
+
+    rows, old_answers = (
+        Submission.objects.filter(test=test, processed=True)
+        .answer_matrix(num_questions, 'id', 'fill_matrix', 'score', 'answer_key_version')
+    )
+    has_matrix = np.array([row[1] is not None and len(row[1]) == matrix_size for row in rows], dtype=bool)
+
+    summary = {
+        'test_id': test.id,
+        'rescored': int(has_matrix.sum()),
+        'updated': 0,
+        'without_fill_matrix': int((~has_matrix).sum()),
+        'blank_answers': 0,
+        'double_marks': 0,
+        'dry_run': dry_run,
+    }
+    if not has_matrix.any():
+        return summary
+
+    rows = [row for row, kept in zip(rows, has_matrix) if kept]
+    old_answers = old_answers[has_matrix]
+    fill = unpack_fill_matrices([row[1] for row in rows], num_questions, num_options)
+    answers, double_marks = derive_answers(fill, min_fill, double_mark_ratio)
+    correct_answers = test.correct_answers()
+    scores, percentages = score_answers(answers, correct_answers)
+    summary['blank_answers'] = int((answers == BLANK_ANSWER).sum())
+    summary['double_marks'] = int(double_marks.sum())
+
+    key_version = test.answer_key_version()
+    changed = (
+        (answers != old_answers).any(axis=1)
+        | (scores != np.array([row[2] for row in rows]))
+        | np.array([row[3] != key_version for row in rows], dtype=bool)
+    )
+    updates = []
+    for i in np.flatnonzero(changed).tolist():
+        new_answers = answers_to_list(answers[i])
+        updates.append(Submission(
+            id=rows[i][0],
+            answers=new_answers,
+            packed_answers=pack_answers(new_answers),
+            score=int(scores[i]),
+            total_questions=len(correct_answers),
+            percentage=float(percentages[i]),
+            answer_key_version=key_version,
+        ))
+
+    summary['updated'] = len(updates)
+    if updates and not dry_run:
+        with transaction.atomic():
+            Submission.objects.bulk_update(
+                updates,
+                ['answers', 'packed_answers', 'score', 'total_questions', 'percentage', 'answer_key_version'],
+                batch_size=RESCORE_BATCH_SIZE,
+            )
+            rebuild_test_stats(test)
+            # bulk_update sends no signals
+            invalidate_test(test.id, test.created_by_id)
+    return summary
+
+
+def regrade_test(test):
+    """
+    Score every graded submission of a test against its current answer key
+
+    The answers are compared with the key in one vectorized pass; only
+    submissions whose score changed are written back, with one UPDATE per
+    distinct new score.
+
+    Returns:
+        dict with the number of submissions regraded and updated
+    """
+    correct_answers = test.correct_answers()
+    total = len(correct_answers)
+    key_version = test.answer_key_version()
+
+    rows, answers = (
+        Submission.objects.filter(test=test, processed=True)
+        .answer_matrix(total, 'id', 'score', 'total_questions', 'percentage')
+    )
+    summary = {'test_id': test.id, 'regraded': len(rows), 'updated': 0, 'answer_key_version': key_version}
+    if not rows:
+        return summary
+
+    scores, percentages = score_answers(answers, correct_answers)
+
+    ids = np.array([row[0] for row in rows])
+    changed = (
+        (scores != np.array([row[1] for row in rows]))
+        | (np.array([row[2] for row in rows]) != total)
+        | (percentages != np.array([row[3] for row in rows]))
+    )
+    summary['updated'] = int(changed.sum())
+
+    # A test has at most Q + 1 distinct scores: one UPDATE per score writes
+    # every changed submission, instead of a per-row CASE
+    with transaction.atomic():
+        for score in np.unique(scores[changed]).tolist():
+            score_ids = ids[changed & (scores == score)].tolist()
+            for start in range(0, len(score_ids), REGRADE_IDS_PER_QUERY):
+                Submission.objects.filter(id__in=score_ids[start:start + REGRADE_IDS_PER_QUERY]).update(
+                    score=score,
+                    total_questions=total,
+                    percentage=score_percentage(score, total),
+                )
+        (Submission.objects.filter(test=test, processed=True)
+            .exclude(answer_key_version=key_version)
+            .update(answer_key_version=key_version))
+        rebuild_test_stats(test)
+        invalidate_test(test.id, test.created_by_id)
+    return summary
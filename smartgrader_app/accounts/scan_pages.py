@@ -0,0 +1,191 @@
+"""
+Multi-page scan ingestion.
+
+Document scanners produce one PDF or multi-page TIFF per class stack. A
+stack is split into ScanPage references (file + page number) without
+decoding anything; each page is rasterized by the grading worker that
+grades it, so pages are rendered in parallel by the batch grading pool,
+only as many pages as are in flight are held in memory, and no
+intermediate images are written.
+
+- TIFF pages are read one at a time with cv2.imreadmulti (start, count)
+- PDF pages are rendered with pypdfium2 at the resolution the sheet's
+  layout template needs rather than a fixed high DPI
+"""
+import math
+import os
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+try:
+    import pypdfium2
+    HAS_PDFIUM = True
+except ImportError:
+    HAS_PDFIUM = False
+
+PDF_EXTENSIONS = ('.pdf',)
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+SCAN_EXTENSIONS = PDF_EXTENSIONS + TIFF_EXTENSIONS
+
+# Render resolution for sheets without a layout template (legacy sheets)
+# and for the QR routing pass, which does not know the template yet
+DEFAULT_SCAN_DPI = 150
+
+# Rasterize at this multiple of the resolution the warped sheet is sampled
+# at, so bubbles and QR modules keep a few pixels of margin
+SCAN_DPI_OVERSAMPLE = 1.5
+
+# Never render pages coarser or finer than this
+MIN_SCAN_DPI = 100
+MAX_SCAN_DPI = 300
+
+# PDFium is not thread-safe; pages rendered from worker threads take turns
+# (process workers each have their own PDFium and render in parallel)
+_pdfium_lock = threading.Lock()
+
+# One page of a multi-page scan. source is a path or the file bytes, kind is
+# 'pdf' or 'tiff', page is the zero-based page number and dpi the render
+# resolution for PDF pages (None to derive it from the layout template).
+ScanPage = namedtuple('ScanPage', ['source', 'kind', 'page', 'dpi'])
+
+
+def scan_kind(filename):
+    """'pdf' or 'tiff' for multi-page scan files, None for anything else"""
+    name = filename.lower()
+    if name.endswith(PDF_EXTENSIONS):
+        return 'pdf'
+    if name.endswith(TIFF_EXTENSIONS):
+        return 'tiff'
+    return None
+
+
+def template_dpi(layout):
+    """
+    Lowest PDF render resolution that gives the layout's sampling grid and
+    name-box OCR their full resolution
+
+    Args:
+        layout: Layout template (see pdf_generator.answer_sheet_layout) or None
+
+    Returns:
+        Dots per inch
+    """
+    if not layout or 'frame' not in layout:
+        return DEFAULT_SCAN_DPI
+
+    # Layout frames are measured in PDF points (1/72 inch)
+    frame_w = layout['frame']['width']
+    frame_h = layout['frame']['height']
+    sample_w, sample_h = layout['sample_size']
+    dpi = 72 * max(sample_w / frame_w, sample_h / frame_h)
+
+    # Name boxes are warped to OCR_LINE_HEIGHT pixels high before OCR
+    # (imported here because omr_processor imports this module)
+    from .omr_processor import OCR_LINE_HEIGHT
+    for x0, y0, x1, y1 in layout.get('name_boxes', {}).values():
+        box_h = abs(y1 - y0) * frame_h
+        if box_h > 0:
+            dpi = max(dpi, 72 * OCR_LINE_HEIGHT / box_h)
+
+    dpi = math.ceil(dpi * SCAN_DPI_OVERSAMPLE)
+    return min(max(dpi, MIN_SCAN_DPI), MAX_SCAN_DPI)
+
+
+def _open_pdf(source):
+    if not HAS_PDFIUM:
+        raise RuntimeError("PDF scans need the pypdfium2 package")
+    if isinstance(source, memoryview):
+        source = source.tobytes()
+    return pypdfium2.PdfDocument(source)
+
+
+def count_scan_pages(source, kind):
+    """
+    Number of pages in a scan, without rendering any of them
+
+    Args:
+        source: Path or file bytes
+        kind: 'pdf' or 'tiff'
+    """
+    if kind == 'pdf':
+        with _pdfium_lock:
+            pdf = _open_pdf(source)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+
+    if isinstance(source, str):
+        return cv2.imcount(source)
+    # OpenCV only counts pages of files; buffers are decoded page by page
+    buffer = np.frombuffer(source, dtype=np.uint8)
+    count = 0
+    while cv2.imdecodemulti(buffer, cv2.IMREAD_GRAYSCALE, range=(count, count + 1))[0]:
+        count += 1
+    return count
+
+
+def iter_scan_pages(source, filename, dpi=None):
+    """
+    Split a multi-page scan into page references, lazily
+
+    Args:
+        source: Path or file bytes of a PDF or TIFF
+        filename: Original file name (the extension picks the reader)
+        dpi: PDF render resolution (None to use the layout template's)
+
+    Yields:
+        ScanPage for every page, in page order
+    """
+    kind = scan_kind(filename)
+    for page in range(count_scan_pages(source, kind)):
+        yield ScanPage(source, kind, page, dpi)
+
+
+def render_scan_page(scan_page, layout=None, reduction=1):
+    """
+    Rasterize one page of a scan to a grayscale image
+
+    Args:
+        scan_page: ScanPage reference
+        layout: Layout template the sheet was printed with, used for the
+            PDF render resolution when scan_page.dpi is None
+        reduction: Render at 1/reduction of that resolution
+
+    Returns:
+        Grayscale image, or None if the page could not be read
+    """
+    if scan_page.kind == 'pdf':
+        dpi = (scan_page.dpi or template_dpi(layout)) / reduction
+        with _pdfium_lock:
+            pdf = _open_pdf(scan_page.source)
+            try:
+                bitmap = pdf[scan_page.page].render(scale=dpi / 72, grayscale=True)
+                img = bitmap.to_numpy()
+            finally:
+                pdf.close()
+        return np.ascontiguousarray(img.reshape(img.shape[:2]))
+
+    # TIFF pages are scanned at a fixed resolution; decode only this page
+    if isinstance(scan_page.source, str):
+        ok, pages = cv2.imreadmulti(scan_page.source, scan_page.page, 1, flags=cv2.IMREAD_GRAYSCALE)
+    else:
+        buffer = np.frombuffer(scan_page.source, dtype=np.uint8)
+        page_range = (scan_page.page, scan_page.page + 1)
+        ok, pages = cv2.imdecodemulti(buffer, cv2.IMREAD_GRAYSCALE, range=page_range)
+    if not ok or not pages:
+        return None
+
+    img = pages[0]
+    if reduction > 1:
+        img = cv2.resize(img, None, fx=1 / reduction, fy=1 / reduction, interpolation=cv2.INTER_AREA)
+    return img
+
+
+def scan_page_filename(filename, page):
+    """Name a page of a scan is stored and reported under"""
+    base, _ = os.path.splitext(filename)
+    return f"{base}_page{page + 1:03d}.jpg"
@@ -0,0 +1,160 @@
+"""
+Duplicate detection and result cache for uploaded sheets.
+
+Teachers re-upload the same zip after a partial failure, and rescan sheets
+that came out badly. Every graded sheet is fingerprinted (SheetFingerprint)
+so neither creates a second Submission or image copy:
+
+- the exact same file (same SHA-256, same layout template) is answered
+  from the cache before it reaches the OMR pool
+- a sheet that may be a rescan of a graded one (equal answers plus a close
+  perceptual hash of the name boxes, omr_processor.sheet_hash) is still
+  graded as a new submission, and its result names the earlier submission
+  under 'possible_rescan_of' for the teacher to check. Students with
+  similar names and the same answers hash close together, so a perceptual
+  match is never taken as the same sheet.
+
+The cache key is (fingerprint, template version, answer-key version): a
+hit graded against an older answer key is regraded from its stored
+answers instead of being read again.
+"""
+import hashlib
+
+from .models import SheetFingerprint
+from .omr_processor import SHEET_HASH_MAX_DISTANCE, grade_submission, sheet_hash_distance
+from .scan_pages import ScanPage
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_content_hash(source):
+    """SHA-256 hex digest of a path, bytes or memoryview"""
+    digest = hashlib.sha256()
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    else:
+        digest.update(source)
+    return digest.hexdigest()
+
+
+def submission_result(submission, filename):
+    """Per-sheet result reported for a sheet that matched an existing submission"""
+    return {
+        'filename': filename,
+        'success': True,
+        'submission_id': submission.id,
+        'score': submission.score,
+        'total': submission.total_questions,
+        'percentage': submission.percentage,
+        'duplicate': True,
+    }
+
+
+class SheetResultCache:
+    """
+    Fingerprints of one test's graded sheets for one layout version
+
+    Loaded with one query when a group of sheets is graded; sheets graded
+    meanwhile are added with add().
+    """
+
+    def __init__(self, test, layout_version):
+        self.test = test
+        self.layout_version = layout_version
+        self.answer_key_version = test.answer_key_version()
+        self.by_content = {}
+        self.by_sheet_hash = []
+        self.scan_hashes = {}
+
+        fingerprints = (
+            SheetFingerprint.objects.filter(test=test, layout_version=layout_version)
+            .select_related('submission')
+        )
+        for fingerprint in fingerprints:
+            self._remember(fingerprint.submission, fingerprint.content_hash, fingerprint.sheet_hash)
+
+    def _remember(self, submission, content_hash, sheet_hash):
+        self.by_content[content_hash] = submission
+        if sheet_hash:
+            self.by_sheet_hash.append((sheet_hash, submission))
+
+    def content_hash(self, upload, name=None):
+        """
+        Content hash of a sheet; pages of a scan hash the scan file once
+
+        Args:
+            upload: Sheet source (see accounts.ingestion)
+            name: Storage name of the file the sheet was read from (shared
+                by the pages of a scan); without it, pages of a scan read
+                from memory are hashed one by one
+        """
+        if isinstance(upload, ScanPage):
+            key = name or (upload.source if isinstance(upload.source, str) else None)
+            if key is None:
+                scan_hash = file_content_hash(upload.source)
+            else:
+                if key not in self.scan_hashes:
+                    self.scan_hashes = {key: file_content_hash(upload.source)}
+                scan_hash = self.scan_hashes[key]
+            return f"{scan_hash[:56]}{upload.page:08d}"
+        return file_content_hash(upload)
+
+    def _fresh(self, submission):
+        """Regrade a cached submission if the answer key changed since"""
+        if submission.answer_key_version != self.answer_key_version:
+            grading = grade_submission(submission.answers, self.test.correct_answers())
+            submission.score = grading['score']
+            submission.total_questions = grading['total']
+            submission.percentage = grading['percentage']
+            submission.answer_key_version = self.answer_key_version
+            submission.save(update_fields=['score', 'total_questions', 'percentage', 'answer_key_version'])
+        return submission
+
+    def find_duplicate(self, content_hash):
+        """
+        The submission an identical file was graded as, or None
+
+        Checked before a sheet is read and again before it is saved, which
+        catches identical files that were in flight together.
+        """
+        return self.by_content.get(content_hash)
+
+    def possible_rescan(self, omr_result):
+        """
+        A graded submission a freshly read sheet may be a rescan of, or None
+
+        Only a hint for the teacher: the answers are equal, the name boxes
+        hash close together and no name read on both sheets differs.
+        """
+        sheet_hash = omr_result.get('sheet_hash')
+        if not sheet_hash:
+            return None
+
+        info = omr_result.get('student_info') or {}
+        names = [(info.get(field) or '').strip().lower() for field in ('first_name', 'last_name')]
+        for known_hash, submission in self.by_sheet_hash:
+            if submission.answers != omr_result['answers']:
+                continue
+            known_names = [(name or '').strip().lower() for name in (submission.first_name, submission.last_name)]
+            if any(a and b and a != b for a, b in zip(names, known_names)):
+                continue
+            if sheet_hash_distance(known_hash, sheet_hash) <= SHEET_HASH_MAX_DISTANCE:
+                return submission
+        return None
+
+    def cached_result(self, submission, filename):
+        """Result for a file identical to the one `submission` was graded from"""
+        return submission_result(self._fresh(submission), filename)
+
+    def add(self, submission, content_hash, sheet_hash=None):
+        """Fingerprint a graded sheet"""
+        SheetFingerprint.objects.create(
+            test=self.test,
+            submission=submission,
+            content_hash=content_hash,
+            sheet_hash=sheet_hash or '',
+            layout_version=self.layout_version,
+        )
+        self._remember(submission, content_hash, sheet_hash)
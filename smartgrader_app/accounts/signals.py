@@ -1,7 +1,17 @@
-from django.db.models.signals import post_save
+import logging
+
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.conf import settings
-from .models import Profile
+from .caching import bump_entity, invalidate_test
+from .middleware import invalidate_profile_role
+from .models import Profile, Submission, Test, TestEnrollment
+from .rescoring import regrade_test
+from .test_stats import UNKNOWN_STATE, mark_stale, record_submission_change
+
+logger = logging.getLogger(__name__)
+
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_profile(sender, instance, created, **kwargs):
@@ -11,3 +21,88 @@ def create_profile(sender, instance, created, **kwargs):
     """
     # Do not auto-create profiles - let the registration view handle it
     pass
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_role_on_profile_change(sender, instance, **kwargs):
+    """Have sessions look the user's role up again (see accounts.middleware)"""
+    invalidate_profile_role(instance.user_id)
+
+
+@receiver(post_save, sender=Test)
+def regrade_on_answer_key_change(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Regrade a test's submissions when it is saved with a different answer
+    key than they were graded against (e.g. a corrected question)
+    """
+    if created or raw:
+        return
+    if update_fields is not None and 'questions' not in update_fields:
+        return
+
+    stale = (
+        instance.submissions.filter(processed=True)
+        .exclude(answer_key_version=instance.answer_key_version())
+    )
+    if stale.exists():
+        summary = regrade_test(instance)
+        logger.info("Regraded test %s: %s of %s scores changed",
+                    instance.id, summary['updated'], summary['regraded'])
+
+
+@receiver(post_save, sender=Submission)
+def update_stats_on_submission_save(sender, instance, created, raw=False, **kwargs):
+    """Apply a saved submission to its test's statistics"""
+    if raw:
+        return
+    old_state = None if created else getattr(instance, '_stats_state', UNKNOWN_STATE)
+    new_state = instance.stats_state()
+    record_submission_change(instance, old_state, new_state)
+    instance._stats_state = new_state
+
+
+@receiver(post_delete, sender=Submission)
+def update_stats_on_submission_delete(sender, instance, origin=None, **kwargs):
+    """Take a deleted submission out of its test's statistics"""
+    deleted_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if deleted_model is Test:
+        # The statistics are deleted with the test
+        return
+    if origin is not instance:
+        # Part of a bulk delete: rebuild once on the next read
+        mark_stale(instance.test_id)
+        return
+    record_submission_change(instance, getattr(instance, '_stats_state', UNKNOWN_STATE), None)
+
+
+@receiver(post_save, sender=Test)
+@receiver(post_delete, sender=Test)
+def invalidate_test_cache(sender, instance, update_fields=None, **kwargs):
+    """Drop a test's cached analytics, results and PDF (see accounts.caching)"""
+    if update_fields is not None and set(update_fields) == {'sheet_layouts'}:
+        # Recording a printed sheet layout changes nothing that is cached
+        return
+    invalidate_test(instance.id, instance.created_by_id)
+
+
+@receiver(post_save, sender=Submission)
+@receiver(post_delete, sender=Submission)
+def invalidate_submission_cache(sender, instance, origin=None, **kwargs):
+    """Drop the cached values a submission is part of (see accounts.caching)"""
+    deleted_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if deleted_model is Test:
+        # Invalidated with the test
+        return
+    if Submission.test.is_cached(instance):
+        teacher_id = instance.test.created_by_id
+    else:
+        teacher_id = Test.objects.filter(id=instance.test_id).values_list('created_by_id', flat=True).first()
+    invalidate_test(instance.test_id, teacher_id)
+
+
+@receiver(post_save, sender=TestEnrollment)
+@receiver(post_delete, sender=TestEnrollment)
+def invalidate_enrollment_cache(sender, instance, **kwargs):
+    """Drop a student's cached results (see accounts.caching)"""
+    bump_entity('student', instance.student_id)
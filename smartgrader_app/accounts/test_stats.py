@@ -0,0 +1,220 @@
+"""
+Materialized class statistics.
+
+Every test has a TestStats row (count, sums, score histogram) and one
+QuestionStats row per question (correct, blank and per-option counts).
+Analytics read these O(Q) rows instead of the submissions:
+
+- saving or deleting a Submission applies the difference between its old
+  and new graded state, in the same transaction (see accounts.signals)
+- regrades and rescores rebuild the statistics from the packed answer
+  matrix in one vectorized pass
+- changes that cannot be applied by difference mark the statistics stale;
+  they are rebuilt on the next read
+
+TestStats.version is bumped by every change (including saves that leave
+the statistics as they were, such as a renamed student), so anything
+derived from the statistics or the submissions can be cached against it;
+updated_at is the time of the last change.
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EXCELLENT_PERCENTAGE, PACKED_BLANK, PASS_PERCENTAGE, QuestionStats, Submission, TestStats
+from .omr_processor import score_percentage
+
+# Marker for a submission whose previous graded state is not known
+UNKNOWN_STATE = object()
+
+
+def mark_stale(test_id):
+    """Have a test's statistics rebuilt on their next read"""
+    TestStats.objects.filter(test_id=test_id).update(
+        stale=True, version=F('version') + 1, updated_at=timezone.now()
+    )
+
+
+def touch_stats(test_id):
+    """Bump a test's statistics version for a change that leaves them as they are"""
+    TestStats.objects.filter(test_id=test_id).update(version=F('version') + 1, updated_at=timezone.now())
+
+
+def rebuild_test_stats(test):
+    """
+    Recompute a test's statistics from its submissions
+
+    Returns:
+        (TestStats, list of QuestionStats)
+    """
+    num_questions, num_options = test.num_questions, test.num_options
+    with transaction.atomic():
+        stats, _ = TestStats.objects.get_or_create(test=test)
+        stats = TestStats.objects.select_for_update().get(pk=stats.pk)
+
+        rows, answers = (
+            Submission.objects.filter(test=test, processed=True)
+            .answer_matrix(num_questions, 'score', 'percentage')
+        )
+        scores = np.array([row[0] for row in rows], dtype=np.int64)
+        histogram = np.bincount(scores, minlength=num_questions + 1) if len(scores) else np.zeros(num_questions + 1)
+
+        stats.count = len(rows)
+        stats.score_sum = int(scores.sum())
+        stats.score_sq_sum = int((scores * scores).sum())
+        stats.percentage_sum = float(sum(row[1] for row in rows))
+        stats.score_histogram = histogram.astype(int).tolist()
+        _set_score_range(stats)
+        stats.stale = False
+        stats.version += 1
+        stats.save()
+
+        key = np.array(test.correct_answers()[:num_questions], dtype=answers.dtype)
+        correct_counts = (answers == key).sum(axis=0).tolist()
+        blank_counts = (answers < 0).sum(axis=0).tolist()
+        option_counts = (answers[:, :, None] == np.arange(num_options)).sum(axis=0).tolist()
+
+        existing = {q.question: q for q in QuestionStats.objects.filter(test=test)}
+        question_stats = []
+        for question in range(num_questions):
+            q = existing.pop(question, None) or QuestionStats(test=test, question=question)
+            q.correct_count = correct_counts[question]
+            q.blank_count = blank_counts[question]
+            q.option_counts = option_counts[question]
+            question_stats.append(q)
+
+        if existing:
+            QuestionStats.objects.filter(id__in=[q.id for q in existing.values()]).delete()
+        QuestionStats.objects.bulk_create([q for q in question_stats if q.pk is None])
+        QuestionStats.objects.bulk_update(
+            [q for q in question_stats if q.pk is not None],
+            ['correct_count', 'blank_count', 'option_counts'],
+        )
+    return stats, question_stats
+
+
+def _set_score_range(stats):
+    scores = [score for score, count in enumerate(stats.score_histogram) if count > 0]
+    stats.min_score = scores[0] if scores else None
+    stats.max_score = scores[-1] if scores else None
+
+
+def record_submission_change(submission, old_state, new_state):
+    """
+    Apply a saved or deleted submission to its test's statistics
+
+    Args:
+        submission: The Submission
+        old_state, new_state: Submission.stats_state() before and after the
+            change (None if it did not count, UNKNOWN_STATE if not known)
+    """
+    if old_state == new_state:
+        touch_stats(submission.test_id)
+        return
+
+    test_id = submission.test_id
+    stats = TestStats.objects.select_for_update().filter(test_id=test_id, stale=False).first()
+    if stats is None:
+        # Nothing materialized yet (or already stale): built on next read
+        return
+
+    changes = [(-1, old_state), (1, new_state)]
+    if any(state is UNKNOWN_STATE or (state is not None and state[2] is None) for _, state in changes):
+        mark_stale(test_id)
+        return
+
+    test = submission.test
+    question_stats = list(QuestionStats.objects.filter(test_id=test_id))
+    if len(question_stats) != test.num_questions:
+        mark_stale(test_id)
+        return
+    key = test.correct_answers()
+
+    for sign, state in changes:
+        if state is None:
+            continue
+        score, percentage, packed = state
+        stats.count += sign
+        stats.score_sum += sign * score
+        stats.score_sq_sum += sign * score * score
+        stats.percentage_sum += sign * percentage
+        if score >= len(stats.score_histogram):
+            stats.score_histogram += [0] * (score + 1 - len(stats.score_histogram))
+        stats.score_histogram[score] += sign
+
+        for q in question_stats:
+            answer = packed[q.question] if q.question < len(packed) else PACKED_BLANK
+            if answer == PACKED_BLANK:
+                q.blank_count += sign
+                continue
+            if answer >= len(q.option_counts):
+                q.option_counts += [0] * (answer + 1 - len(q.option_counts))
+            q.option_counts[answer] += sign
+            if q.question < len(key) and answer == key[q.question]:
+                q.correct_count += sign
+
+    _set_score_range(stats)
+    stats.version += 1
+    stats.save()
+    QuestionStats.objects.bulk_update(question_stats, ['correct_count', 'blank_count', 'option_counts'])
+
+
+def get_test_stats(test):
+    """
+    A test's statistics, rebuilt first if they are missing or stale
+
+    Returns:
+        (TestStats, list of QuestionStats)
+    """
+    stats = TestStats.objects.filter(test=test).first()
+    if stats is None or stats.stale:
+        return rebuild_test_stats(test)
+    return stats, list(QuestionStats.objects.filter(test=test))
+
+
+def current_stats(test):
+    """A test's TestStats row, rebuilt first if it is missing or stale"""
+    stats = TestStats.objects.filter(test=test).first()
+    if stats is None or stats.stale:
+        stats = rebuild_test_stats(test)[0]
+    return stats
+
+
+def stats_version(test):
+    """Current TestStats.version of a test (rebuilding stale statistics first)"""
+    return current_stats(test).version
+
+
+def class_summary(stats, num_questions):
+    """
+    Class statistics in the shape test_analytics_api reports them
+
+    Pass and distribution counts are read from the score histogram
+    (a score's percentage is fixed by the number of questions).
+    """
+    if not stats.count:
+        return {'total_submissions': 0}
+
+    passed = excellent = 0
+    for score, count in enumerate(stats.score_histogram):
+        percentage = score_percentage(score, num_questions)
+        passed += count if percentage >= PASS_PERCENTAGE else 0
+        excellent += count if percentage >= EXCELLENT_PERCENTAGE else 0
+
+    mean = stats.score_sum / stats.count
+    variance = max(stats.score_sq_sum / stats.count - mean * mean, 0.0)
+    return {
+        'total_submissions': stats.count,
+        'average_score': round(mean, 2),
+        'average_percentage': round(stats.percentage_sum / stats.count, 2),
+        'highest_score': stats.max_score,
+        'lowest_score': stats.min_score,
+        'score_std_dev': round(variance ** 0.5, 2),
+        'pass_rate': round(passed / stats.count * 100, 2),
+        'score_distribution': {
+            'excellent': excellent,
+            'good': passed - excellent,
+            'needs_improvement': stats.count - passed,
+        },
+    }
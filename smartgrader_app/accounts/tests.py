@@ -1,3 +1,1171 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import grading_jobs, views
+from .caching import bump_entity, cache_stats, cached
+from .exports import iter_results_csv
+from .grading_jobs import LeaseLost, claim_grading_job, enqueue_grading_job, grading_job_status, run_grading_job
+from .item_analysis import analyze_responses
+from .middleware import ROLE_SESSION_KEY, role_stamp_key
+from .models import (
+    GradingJob, GradingJobSheet, Profile, Submission, Test, TestEnrollment, TestStats, letter_grade,
+)
+from .omr_processor import find_fiducials, pack_fill_matrix, parse_sheet_qr, process_omr_image, score_bubbles
+from .ranking import class_standing, standing_in_histogram
+from .rescoring import regrade_test, rescore_test
+from .scan_pages import ScanPage
+from .sheet_cache import SheetResultCache
+from .test_stats import get_test_stats, rebuild_test_stats
+
+# Synthetic answer sheets drawn from the printed sheet geometry
+sys.path.insert(0, os.path.join(settings.BASE_DIR.parent, 'utils'))
+sys.path.insert(0, os.path.join(settings.BASE_DIR.parent, 'pdf_generator'))
+from pdf_generator import answer_sheet_layout, sheet_qr_payload  # noqa: E402
+from synthetic_sheets import render_answer_page, render_photo, write_scan_stack  # noqa: E402
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='smartgrader_tests_')
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def sheet_png(answers, num_options=5, **kwargs):
+    """A flat scan of an answer sheet with the given answers, as PNG bytes"""
+    page = render_answer_page(answers, num_options, dpi=100, **kwargs)
+    return cv2.imencode('.png', page)[1].tobytes()
+
+
+def sse_events(response):
+    """(event, id, data) of every message of an event stream response"""
+    events = []
+    for message in b''.join(response.streaming_content).decode().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in message.splitlines() if not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields['event'], fields.get('id'), json.loads(fields['data'])))
+    return events
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, OMR_WORKERS=1, GRADING_JOBS_INLINE=False)
+class SmartGraderTestCase(TestCase):
+    """Teacher, test and sheet helpers shared by the test cases below"""
+
+    def setUp(self):
+        cache.clear()
+        self.teacher = self.make_user('teacher@example.com', 'teacher')
+        self.client.force_login(self.teacher)
+
+    def make_user(self, email, role):
+        user = User.objects.create_user(email=email, password='password', first_name='Test', last_name='User')
+        Profile.objects.create(user=user, role=role)
+        return user
+
+    def make_test(self, answers, num_options=5, title='Quiz'):
+        questions = [
+            {'question': f'Question {i + 1}', 'options': [f'Option {j}' for j in range(num_options)],
+             'correct_answer': answer}
+            for i, answer in enumerate(answers)
+        ]
+        test = Test(title=title, questions=questions, num_questions=len(answers), num_options=num_options,
+                    created_by=self.teacher)
+        test.add_sheet_layout(answer_sheet_layout(len(answers), num_options))
+        test.save()
+        return test
+
+    def make_submission(self, test, answers, first_name='Ana', last_name='Pop', **kwargs):
+        correct = sum(a == b for a, b in zip(answers, test.correct_answers()))
+        return Submission.objects.create(
+            test=test, first_name=first_name, last_name=last_name, image='submissions/sheet.png',
+            answers=answers, score=correct, total_questions=test.num_questions,
+            percentage=round(correct / test.num_questions * 100, 2), processed=True,
+            answer_key_version=test.answer_key_version(), **kwargs
+        )
+
+    def upload(self, test, sheets):
+        """Queue {filename: answers} as one grading job"""
+        files = [SimpleUploadedFile(name, sheet_png(answers)) for name, answers in sheets.items()]
+        return enqueue_grading_job(self.teacher, files, None, test=test)
+
+
+class SheetLayoutTests(SmartGraderTestCase):
+    def test_layouts_are_kept_per_version(self):
+        test = self.make_test([0, 1, 2, 3] * 3, num_options=4)
+        printed = test.get_sheet_layout()
+        self.assertEqual(printed, answer_sheet_layout(12, 4))
+
+        # A reprint with a newer template keeps the older one for its sheets
+        reprint = dict(printed, version=printed['version'] + 7)
+        test.add_sheet_layout(reprint)
+        test.save()
+        test.refresh_from_db()
+        self.assertEqual(test.get_sheet_layout(), reprint)
+        self.assertEqual(test.get_sheet_layout(printed['version']), printed)
+        self.assertIsNone(test.get_sheet_layout(printed['version'] + 1))
+        self.assertIsNone(Test(title='Old print').get_sheet_layout())
+
+    def test_sheet_is_read_at_the_stored_bubble_centers(self):
+        answers = [3, None, 0, 2, 1, 3, 0, None, 2, 1, 1, 0]
+        test = self.make_test([0, 1, 2, 3] * 3, num_options=4)
+        test.refresh_from_db()
+        layout = test.get_sheet_layout()
+
+        result = process_omr_image(sheet_png(answers, num_options=4), layout=layout)
+        self.assertTrue(result['success'], result['error'])
+        self.assertEqual(result['answers'], answers)
+        self.assertEqual(result['layout_version'], layout['version'])
+        self.assertEqual(len(result['fill_matrix']), 12 * 4)
+
+
+class SheetLocalizationTests(SimpleTestCase):
+    answers = [0, 4, None, 2, 1, 3, 3, 0, None, 2, 4, 1, 0, 2, 3, 1, None, 4, 2, 0]
+
+    def setUp(self):
+        self.layout = answer_sheet_layout(20, 5)
+        self.page = render_answer_page(self.answers, 5, dpi=100)
+
+    def read(self, img):
+        result = process_omr_image(cv2.imencode('.png', img)[1].tobytes(), layout=self.layout)
+        self.assertTrue(result['success'], result['error'])
+        return result
+
+    def test_rotated_and_shifted_scan(self):
+        height, width = self.page.shape
+        M = cv2.getRotationMatrix2D((width / 2, height / 2), 4, 0.9)
+        M[:, 2] += (60, -40)
+        scan = cv2.warpAffine(self.page, M, (width + 120, height + 80), borderValue=255)
+
+        result = self.read(scan)
+        self.assertEqual(result['localization'], 'fiducials')
+        self.assertEqual(result['answers'], self.answers)
+
+    def test_tilted_photo_on_a_cluttered_background(self):
+        for seed in range(3):
+            result = self.read(render_photo(self.page, random.Random(seed)))
+            self.assertEqual(result['localization'], 'fiducials', seed)
+            self.assertEqual(result['answers'], self.answers, seed)
+
+    def test_markers_out_of_frame_fall_back_to_the_grid(self):
+        height, width = self.page.shape
+        # Cut off the bottom markers, keeping the whole answer grid
+        grid_bottom = self.layout['grid_box'][3]
+        cropped = self.page[:int(height * (0.05 + 0.9 * grid_bottom)) + 20]
+        self.assertIsNone(find_fiducials(cropped))
+
+        result = self.read(cropped)
+        self.assertEqual(result['localization'], 'contour')
+
+
+class SheetRoutingTests(SmartGraderTestCase):
+    def test_parse_sheet_qr(self):
+        self.assertEqual(parse_sheet_qr('SG:12:2'), (12, 2))
+        # Sheets printed before the layout version was encoded
+        self.assertEqual(parse_sheet_qr(' 12 '), (12, None))
+        for data in ('', None, 'SG:12', 'https://example.com/12'):
+            self.assertIsNone(parse_sheet_qr(data), data)
+
+    def test_mixed_stack_is_routed_by_qr_code(self):
+        quiz = self.make_test([0, 1, 2, 3, 4] * 2)
+        other = self.make_test([4, 3, 2, 1, 0] * 2, title='Other')
+        foreign = self.make_test([0] * 10, title='Foreign')
+        Test.objects.filter(id=foreign.id).update(created_by=self.make_user('other@example.com', 'teacher'))
+
+        sheets = [
+            ('quiz.png', quiz.correct_answers(), sheet_qr_payload(quiz.id)),
+            ('other.png', other.correct_answers(), sheet_qr_payload(other.id)),
+            ('old_print.png', other.correct_answers()[:5] + [None] * 5, str(other.id)),
+            ('foreign.png', foreign.correct_answers(), sheet_qr_payload(foreign.id)),
+            ('no_code.png', quiz.correct_answers(), None),
+        ]
+        response = self.client.post(reverse('upload-mixed-submissions'), {
+            'files': [SimpleUploadedFile(name, sheet_png(answers, qr_data=qr)) for name, answers, qr in sheets],
+        })
+        self.assertEqual(response.status_code, 202)
+        run_grading_job(claim_grading_job('worker-a'), 'worker-a')
+
+        routed = {sheet.filename: (sheet.test_id, sheet.layout_version, sheet.result)
+                  for sheet in GradingJobSheet.objects.all()}
+        layout_version = quiz.get_sheet_layout()['version']
+        self.assertEqual(routed['quiz.png'][:2], (quiz.id, layout_version))
+        self.assertEqual(routed['other.png'][:2], (other.id, layout_version))
+        self.assertEqual(routed['old_print.png'][:2], (other.id, None))
+        self.assertEqual(routed['foreign.png'][2]['error'], f'Test {foreign.id} not found')
+        self.assertIn('error', routed['no_code.png'][2])
+
+        scores = {(s.test_id, s.score) for s in Submission.objects.all()}
+        self.assertEqual(scores, {(quiz.id, 10), (other.id, 10), (other.id, 5)})
+        self.assertFalse(Submission.objects.filter(test=foreign).exists())
+
+
+class GradingJobQueueTests(SmartGraderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.key = [0, 1, 2, 3, 4] * 2
+        self.test = self.make_test(self.key)
+        self.sheets = {
+            'all_right.png': self.key,
+            'half_right.png': self.key[:5] + [4, 3, 2, 1, 0],
+            'blank_last.png': self.key[:9] + [None],
+        }
+
+    def expire_lease(self, job):
+        GradingJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_claim_is_exclusive(self):
+        job = self.upload(self.test, self.sheets)
+        self.assertEqual(job.total_sheets, 3)
+
+        claimed = claim_grading_job('worker-a')
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual(claimed.status, GradingJob.STATUS_RUNNING)
+        self.assertEqual(claimed.lease_owner, 'worker-a')
+        self.assertEqual(claimed.attempts, 1)
+        self.assertIsNone(claim_grading_job('worker-b'))
+
+    def test_grades_sheets_end_to_end(self):
+        response = self.client.post(f'/tests/{self.test.id}/upload-submissions/', {
+            'files': [SimpleUploadedFile(name, sheet_png(answers)) for name, answers in self.sheets.items()],
+        })
+        self.assertEqual(response.status_code, 202)
+        job = claim_grading_job('worker-a')
+        run_grading_job(job, 'worker-a')
+
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(status['status'], GradingJob.STATUS_COMPLETED)
+        self.assertEqual((status['processed'], status['failed']), (3, 0))
+        scores = {result['filename']: result['score'] for result in status['results']}
+        self.assertEqual(scores, {'all_right.png': 10, 'half_right.png': 6, 'blank_last.png': 9})
+
+        for submission in Submission.objects.filter(test=self.test):
+            sheet = GradingJobSheet.objects.get(submission=submission)
+            self.assertEqual(submission.answers, self.sheets[sheet.filename])
+            self.assertEqual(submission.answer_key_version, self.test.answer_key_version())
+
+    def test_progress_events_stream_under_wsgi(self):
+        job = self.upload(self.test, self.sheets)
+        run_grading_job(claim_grading_job('worker-a'), 'worker-a')
+
+        response = self.client.get(reverse('grading-job-events', args=[job.id]), HTTP_LAST_EVENT_ID='1')
+        # A blocking iterator, so WSGI servers send each event as it comes
+        self.assertFalse(response.is_async)
+        events = [line for chunk in response.streaming_content
+                  for line in chunk.decode().splitlines() if line.startswith('event:')]
+        self.assertEqual(events, ['event: progress'] + ['event: sheet', 'event: stats'] * 2 + ['event: done'])
+
+    def test_mixed_job_reports_sheets_in_the_order_they_finish(self):
+        other = self.make_test([4, 3, 2, 1, 0] * 2, title='Other')
+
+        def coded(name, test, answers):
+            return SimpleUploadedFile(name, sheet_png(answers, qr_data=sheet_qr_payload(test.id)))
+
+        # Sheets are graded one test at a time, after the unroutable ones failed
+        files = [
+            coded('quiz_1.png', self.test, self.key),
+            coded('other_1.png', other, other.correct_answers()),
+            coded('quiz_2.png', self.test, self.sheets['half_right.png']),
+            SimpleUploadedFile('no_code.png', sheet_png(self.key)),
+            coded('other_2.png', other, [None] * 10),
+        ]
+        job = enqueue_grading_job(self.teacher, files, None)
+
+        # Poll after every checkpoint, like a client watching the job
+        polled = []
+        checkpoint = grading_jobs._checkpoint
+
+        def checkpoint_and_poll(job, *args):
+            checkpoint(job, *args)
+            polled.extend(grading_job_status(job, polled[-1]['seq'] if polled else 0)['results'])
+
+        with mock.patch.object(grading_jobs, '_checkpoint', checkpoint_and_poll):
+            run_grading_job(claim_grading_job('worker-a'), 'worker-a')
+
+        self.assertEqual([(result['seq'], result['index']) for result in polled],
+                         [(1, 3), (2, 0), (3, 2), (4, 1), (5, 4)])
+        self.assertEqual([result.get('test_id') for result in polled],
+                         [None, self.test.id, self.test.id, other.id, other.id])
+
+        # A stream resumed after the third sheet sends the other test's sheets
+        response = self.client.get(reverse('grading-job-events', args=[job.id]), HTTP_LAST_EVENT_ID='3')
+        sheets = [(event_id, data['filename']) for event, event_id, data in sse_events(response) if event == 'sheet']
+        self.assertEqual(sheets, [('4', 'other_1.png'), ('5', 'other_2.png')])
+
+    def test_sheets_of_a_deleted_test_fail_alone(self):
+        other = self.make_test([4, 3, 2, 1, 0] * 2, title='Other')
+        job = enqueue_grading_job(self.teacher, [
+            SimpleUploadedFile(f'{test.title}.png', sheet_png(self.key, qr_data=sheet_qr_payload(test.id)))
+            for test in (self.test, other)
+        ], None)
+
+        route = grading_jobs._route_pending_sheets
+
+        def route_then_delete(*args):
+            route(*args)
+            other.delete()
+
+        with mock.patch.object(grading_jobs, '_route_pending_sheets', route_then_delete):
+            run_grading_job(claim_grading_job('worker-a'), 'worker-a')
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_sheets, job.failed_sheets), (GradingJob.STATUS_COMPLETED, 2, 1))
+        results = {sheet.filename: sheet.result for sheet in job.sheets.all()}
+        self.assertEqual(results['Quiz.png']['score'], 10)
+        self.assertEqual(results['Other.png']['error'], 'Test was deleted')
+
+    def test_worker_that_lost_its_lease_stops(self):
+        job = self.upload(self.test, self.sheets)
+        stalled = claim_grading_job('worker-a')
+        self.expire_lease(job)
+
+        taken_over = claim_grading_job('worker-b')
+        self.assertEqual(taken_over.attempts, 2)
+        with self.assertRaises(LeaseLost):
+            run_grading_job(stalled, 'worker-a')
+        # The sheet worker-a graded was rolled back with its checkpoint
+        self.assertFalse(Submission.objects.exists())
+
+        run_grading_job(taken_over, 'worker-b')
+        taken_over.refresh_from_db()
+        self.assertEqual(taken_over.status, GradingJob.STATUS_COMPLETED)
+        self.assertEqual(Submission.objects.count(), 3)
+
+    def test_heartbeat_raises_once_the_lease_is_lost(self):
+        job = self.upload(self.test, self.sheets)
+        claimed = claim_grading_job('worker-a')
+        heartbeat = grading_jobs._LeaseHeartbeat(claimed, 'worker-a')
+        heartbeat.renewed_at -= settings.GRADING_JOB_LEASE_SECONDS
+
+        GradingJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now())
+        heartbeat()
+        job.refresh_from_db()
+        self.assertGreater(job.lease_expires_at, timezone.now())
+
+        self.expire_lease(job)
+        claim_grading_job('worker-b')
+        heartbeat.renewed_at -= settings.GRADING_JOB_LEASE_SECONDS
+        with self.assertRaises(LeaseLost):
+            heartbeat()
+
+    def test_resumed_job_grades_only_pending_sheets(self):
+        class WorkerCrashed(BaseException):
+            pass
+
+        save = grading_jobs.save_graded_submission
+        graded = []
+
+        def crash_on_second_sheet(test, upload, filename, *args, **kwargs):
+            if graded:
+                raise WorkerCrashed()
+            graded.append(filename)
+            return save(test, upload, filename, *args, **kwargs)
+
+        def record(test, upload, filename, *args, **kwargs):
+            graded.append(filename)
+            return save(test, upload, filename, *args, **kwargs)
+
+        job = self.upload(self.test, self.sheets)
+        with mock.patch.object(grading_jobs, 'save_graded_submission', crash_on_second_sheet):
+            with self.assertRaises(WorkerCrashed):
+                run_grading_job(claim_grading_job('worker-a'), 'worker-a')
+        self.assertEqual(Submission.objects.count(), 1)
+
+        self.expire_lease(job)
+        resumed = claim_grading_job('worker-b')
+        with mock.patch.object(grading_jobs, 'save_graded_submission', record):
+            run_grading_job(resumed, 'worker-b')
+
+        self.assertEqual(graded, ['all_right.png', 'half_right.png', 'blank_last.png'])
+        resumed.refresh_from_db()
+        self.assertEqual(resumed.status, GradingJob.STATUS_COMPLETED)
+        self.assertEqual((resumed.processed_sheets, resumed.attempts), (3, 2))
+        self.assertEqual(Submission.objects.count(), 3)
+
+    def test_failed_sheet_image_is_deleted(self):
+        blank_page = cv2.imencode('.png', np.full((60, 60), 255, dtype=np.uint8))[1].tobytes()
+        blank = SimpleUploadedFile('not_a_sheet.png', blank_page)
+        job = enqueue_grading_job(self.teacher, [blank], None, test=self.test)
+        image_name = job.sheets.get().source
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_ROOT, image_name)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            run_grading_job(claim_grading_job('worker-a'), 'worker-a')
+
+        job.refresh_from_db()
+        self.assertEqual(job.failed_sheets, 1)
+        self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, image_name)))
+
+
+class ScanIngestionTests(SmartGraderTestCase):
+    def grade_scan(self, extension):
+        key = [0, 1, 2, 3, 4] * 2
+        test = self.make_test(key)
+        path = os.path.join(MEDIA_ROOT, f'stack.{extension}')
+        stack = write_scan_stack(path, 3, num_questions=10, dpi=100, seed=7)
+        with open(path, 'rb') as f:
+            scan = SimpleUploadedFile(f'class.{extension}', f.read())
+        os.remove(path)
+
+        job = enqueue_grading_job(self.teacher, [scan], None, test=test)
+        self.assertEqual(job.total_sheets, 3)
+        run_grading_job(claim_grading_job('worker-a'), 'worker-a')
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.failed_sheets), (GradingJob.STATUS_COMPLETED, 0))
+        sheets = job.sheets.order_by('index')
+        self.assertEqual([sheet.page for sheet in sheets], [0, 1, 2])
+        self.assertEqual([sheet.submission.answers for sheet in sheets], stack)
+        # The scan is dropped once its pages are graded
+        self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, sheets[0].source)))
+
+    def test_pdf_pages_are_graded_in_order(self):
+        self.grade_scan('pdf')
+
+    def test_tiff_pages_are_graded_in_order(self):
+        self.grade_scan('tif')
+
+
+class SheetDeduplicationTests(SmartGraderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.answers = [0, 1, 2, 3, 4] * 2
+        self.test = self.make_test(self.answers)
+
+    def grade(self, files):
+        job = enqueue_grading_job(self.teacher, files, None, test=self.test)
+        run_grading_job(claim_grading_job('worker-a'), 'worker-a')
+        return [sheet.result for sheet in job.sheets.order_by('index')]
+
+    def test_identical_file_is_not_graded_twice(self):
+        sheet = sheet_png(self.answers, first_name='Maria', last_name='Ionescu')
+        first, = self.grade([SimpleUploadedFile('maria.png', sheet)])
+        again, = self.grade([SimpleUploadedFile('maria_again.png', sheet)])
+
+        self.assertTrue(again['duplicate'])
+        self.assertEqual(again['submission_id'], first['submission_id'])
+        self.assertEqual(Submission.objects.count(), 1)
+
+    def test_similar_sheet_is_only_flagged(self):
+        # Same answers and nearly the same handwriting: a different student
+        # as far as grading goes, flagged for the teacher to check
+        maria, mara = self.grade([
+            SimpleUploadedFile('maria.png', sheet_png(self.answers, first_name='Maria', last_name='Ionescu')),
+            SimpleUploadedFile('mara.png', sheet_png(self.answers, first_name='Mara', last_name='Ionescu')),
+        ])
+
+        self.assertNotEqual(maria['submission_id'], mara['submission_id'])
+        self.assertNotIn('duplicate', mara)
+        self.assertEqual(mara['possible_rescan_of'], maria['submission_id'])
+        self.assertEqual(Submission.objects.count(), 2)
+
+    def test_scans_read_from_memory_are_told_apart(self):
+        cache = SheetResultCache(self.test, None)
+
+        def page(data, number=0):
+            # A fresh buffer each time, so freed ones can reuse an id
+            return ScanPage(bytes(bytearray(data)), 'pdf', number, None)
+
+        first = cache.content_hash(page(b'first scan'), 'grading_jobs/job_1/first.pdf')
+        other = cache.content_hash(page(b'other scan'), 'grading_jobs/job_1/other.pdf')
+        self.assertNotEqual(first[:56], other[:56])
+        self.assertEqual(cache.content_hash(page(b'first scan', 1), 'grading_jobs/job_1/first.pdf')[:56], first[:56])
+        # Without a stored name each page is hashed from its own bytes
+        self.assertNotEqual(cache.content_hash(page(b'first scan')), cache.content_hash(page(b'other scan')))
+
+
+class BubbleKernelTests(SimpleTestCase):
+    def grid(self, answers, num_options, size=(700, 550)):
+        """A thresholded answer grid (marks white) with one round mark per answered row"""
+        height, width = size
+        img = np.zeros(size, dtype=np.uint8)
+        cell_h, cell_w = height / len(answers), width / num_options
+        for row, option in enumerate(answers):
+            if option is not None:
+                center = (int((option + 0.5) * cell_w), int((row + 0.5) * cell_h))
+                cv2.circle(img, center, int(cell_h * 0.35), 255, -1)
+        return img
+
+    def resized_fill_ratios(self, img, num_rows, num_cols):
+        """The per-cell loop the kernel replaced: resize onto the grid, then split it"""
+        height, width = img.shape
+        img = cv2.resize(img, ((width // num_cols) * num_cols, (height // num_rows) * num_rows))
+        return np.array([[cv2.countNonZero(cell) / cell.size for cell in np.hsplit(row, num_cols)]
+                         for row in np.vsplit(img, num_rows)])
+
+    def test_uneven_grid_matches_the_resized_grid(self):
+        # 700 / 30 and 550 / 4 leave remainders; every cell still covers its bubble
+        answers = [i % 4 for i in range(30)]
+        answers[7] = answers[29] = None
+        img = self.grid(answers, 4)
+
+        fill_ratios, detected = score_bubbles(img, 30, 4)
+        np.testing.assert_allclose(fill_ratios, self.resized_fill_ratios(img, 30, 4), atol=0.03)
+        self.assertEqual(detected.tolist(), [-1 if a is None else a for a in answers])
+        # The last rows are not shifted off their bubbles
+        self.assertAlmostEqual(fill_ratios[28, answers[28]], fill_ratios[0, answers[0]], delta=0.005)
+
+    def test_even_grid_is_counted_exactly(self):
+        img = self.grid([0, 1, 2, 3, 4] * 4, 5)
+        fill_ratios, _ = score_bubbles(img, 20, 5)
+        np.testing.assert_allclose(fill_ratios, self.resized_fill_ratios(img, 20, 5), rtol=1e-6)
+
+
+class ItemAnalysisTests(SimpleTestCase):
+    def test_statistics_of_a_small_class(self):
+        # Key (A, B, C); totals 3, 2, 1, 0, so one student in each 27% group
+        answers = np.array([
+            [0, 1, 2],
+            [0, 1, 0],
+            [0, 2, -1],
+            [1, 2, 1],
+        ])
+        result = analyze_responses(answers, [0, 1, 2], 3)
+
+        # Mean 1.5, variance 1.25; KR-20 = 3/2 * (1 - (3/16 + 1/4 + 3/16) / 1.25)
+        self.assertEqual(result['test'], {
+            'students': 4, 'questions': 3, 'score_histogram': [1, 1, 1, 1],
+            'mean_score': 1.5, 'score_std_dev': 1.118, 'kr20': 0.75,
+        })
+        questions = result['questions']
+        self.assertEqual([q['difficulty'] for q in questions], [0.75, 0.5, 0.25])
+        self.assertEqual([q['discrimination'] for q in questions], [1.0, 1.0, 1.0])
+        # Question 1 against the rest of the test (2, 1, 0, 0):
+        # cov 3/16 / sqrt(3/16 * 11/16) = 0.5222; question 2: 1/4 / sqrt(1/4 * 1/2)
+        self.assertEqual([q['point_biserial'] for q in questions], [0.5222, 0.7071, 0.5222])
+        self.assertEqual([q['blank_count'] for q in questions], [0, 0, 1])
+        self.assertEqual(questions[0]['options'], [
+            {'option': 0, 'count': 3, 'share': 0.75, 'mean_score': 2.0},
+            {'option': 1, 'count': 1, 'share': 0.25, 'mean_score': 0.0},
+            {'option': 2, 'count': 0, 'share': 0.0, 'mean_score': None},
+        ])
+        self.assertEqual([o['mean_score'] for o in questions[2]['options']], [2.0, 0.0, 3.0])
+
+    def test_equal_scores_leave_correlations_undefined(self):
+        result = analyze_responses(np.array([[0, 1, 2]] * 3), [0, 1, 2], 3)
+
+        self.assertEqual((result['test']['score_std_dev'], result['test']['kr20']), (0.0, None))
+        for question in result['questions']:
+            self.assertEqual((question['difficulty'], question['discrimination'], question['point_biserial']),
+                             (1.0, 0.0, None))
+
+    def test_single_question(self):
+        result = analyze_responses(np.array([[0], [1], [0], [-1]]), [0], 2)
+
+        self.assertEqual((result['test']['kr20'], result['test']['score_histogram']), (None, [2, 2]))
+        question, = result['questions']
+        # Without other questions there is no rest score to correlate with
+        self.assertEqual((question['difficulty'], question['point_biserial']), (0.5, None))
+        self.assertEqual(question['discrimination'], 1.0)
+
+    def test_blank_answers_count_as_wrong(self):
+        result = analyze_responses(np.array([[0, -1], [1, -1], [0, -1]]), [0, 1], 2)
+
+        blank = result['questions'][1]
+        self.assertEqual((blank['difficulty'], blank['blank_count']), (0.0, 3))
+        self.assertEqual([(o['count'], o['mean_score']) for o in blank['options']], [(0, None), (0, None)])
+        self.assertEqual(result['test']['score_histogram'], [1, 2, 0])
+
+    def test_no_submissions(self):
+        result = analyze_responses(np.empty((0, 3), dtype=np.int8), [0, 1, 2], 3)
+        self.assertEqual(result['test']['kr20'], None)
+        self.assertEqual(result['questions'], [])
+
+
+class RescoringTests(SmartGraderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.key = [0, 1, 2, 3, 4] * 2
+        self.test = self.make_test(self.key)
+
+        # All answers right, but question 1 only has a faint mark and
+        # question 2 a second, nearly as full bubble
+        fill = np.zeros((10, 5), dtype=np.float32)
+        fill[np.arange(10), self.key] = 0.6
+        fill[0, 0] = 0.1
+        fill[1, 2] = 0.55
+        self.submission = self.make_submission(self.test, self.key, fill_matrix=pack_fill_matrix(fill))
+        self.unscanned = self.make_submission(self.test, self.key, first_name='Ion')
+
+    def test_default_rules_keep_the_answers_read_at_upload(self):
+        summary = rescore_test(self.test)
+        self.assertEqual((summary['rescored'], summary['updated'], summary['without_fill_matrix']), (1, 0, 1))
+
+    def test_dry_run_changes_nothing(self):
+        summary = rescore_test(self.test, min_fill=0.2, dry_run=True)
+        self.assertEqual(summary['updated'], 1)
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.score, 10)
+
+    def test_stricter_rules_blank_faint_and_double_marks(self):
+        response = self.client.post(f'/tests/{self.test.id}/rescore/', json.dumps({
+            'min_fill': 0.2, 'double_mark_ratio': 0.8,
+        }), content_type='application/json')
+        summary = response.json()
+        self.assertEqual((summary['updated'], summary['blank_answers'], summary['double_marks']), (1, 2, 1))
+
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.answers, [None, None] + self.key[2:])
+        self.assertEqual((self.submission.score, self.submission.percentage), (8, 80.0))
+        # The statistics were rebuilt with the new score
+        stats = TestStats.objects.get(test=self.test)
+        self.assertEqual((stats.count, stats.score_sum), (2, 18))
+
+    def test_rejects_out_of_range_rules(self):
+        response = self.client.post(f'/tests/{self.test.id}/rescore/', json.dumps({'min_fill': 1.5}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class RegradeTests(SmartGraderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.key = [0, 1, 2, 3, 4] * 2
+        self.test = self.make_test(self.key)
+        self.right = self.make_submission(self.test, self.key)
+        self.chose_b = self.make_submission(self.test, [1] + self.key[1:], first_name='Ion')
+        self.blank = self.make_submission(self.test, [None] + self.key[1:], first_name='Dan')
+
+    def test_answer_key_correction_regrades_submissions(self):
+        old_version = self.test.answer_key_version()
+        response = self.client.post(f'/tests/{self.test.id}/answer-key/', json.dumps({
+            'corrections': [{'question': 1, 'correct_answer': 1}],
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        self.test.refresh_from_db()
+        new_version = self.test.answer_key_version()
+        self.assertNotEqual(new_version, old_version)
+        scores = {s.id: (s.score, s.percentage, s.answer_key_version) for s in Submission.objects.all()}
+        self.assertEqual(scores, {
+            self.right.id: (9, 90.0, new_version),
+            self.chose_b.id: (10, 100.0, new_version),
+            self.blank.id: (9, 90.0, new_version),
+        })
+        stats = TestStats.objects.get(test=self.test)
+        self.assertEqual((stats.count, stats.score_sum, stats.stale), (3, 28, False))
+
+    def test_only_changed_scores_are_written(self):
+        questions = [dict(q) for q in self.test.questions]
+        questions[0]['correct_answer'] = 1
+        # Bypass the signal to call the regrade directly
+        Test.objects.filter(id=self.test.id).update(questions=questions)
+        self.test.refresh_from_db()
+
+        summary = regrade_test(self.test)
+        self.assertEqual((summary['regraded'], summary['updated']), (3, 2))
+        self.blank.refresh_from_db()
+        self.assertEqual(self.blank.answer_key_version, self.test.answer_key_version())
+
+    def test_saving_without_a_key_change_does_not_regrade(self):
+        with mock.patch('accounts.signals.regrade_test') as regrade:
+            self.test.title = 'Renamed'
+            self.test.save()
+            self.test.save(update_fields=['title'])
+        regrade.assert_not_called()
+
+
+class PackedAnswerTests(SmartGraderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.test = self.make_test([0, 1, 2, 3, 4])
+
+    def test_answers_are_packed_on_save(self):
+        submission = self.make_submission(self.test, [0, None, 4, 1, None])
+        self.assertEqual(bytes(Submission.objects.get(id=submission.id).packed_answers), bytes([0, 255, 4, 1, 255]))
+
+        submission.answers = [1, 1, 1, 1, 1]
+        submission.save(update_fields=['answers'])
+        self.assertEqual(bytes(Submission.objects.get(id=submission.id).packed_answers), bytes([1] * 5))
+
+    def test_answer_matrix(self):
+        first = self.make_submission(self.test, [0, 1, None, 3, 4], first_name='Ana')
+        short = self.make_submission(self.test, [4, 3], first_name='Ion')
+        long = self.make_submission(self.test, [0, 1, 2, 3, 4, 0, 1], first_name='Eva')
+        # Saved before answers were packed
+        legacy = self.make_submission(self.test, [2, None, 2], first_name='Dan')
+        Submission.objects.filter(id=legacy.id).update(packed_answers=None)
+
+        submissions = Submission.objects.filter(test=self.test).order_by('id')
+        with self.assertNumQueries(2):
+            rows, answers = submissions.answer_matrix(5, 'first_name')
+        self.assertEqual(rows, [('Ana',), ('Ion',), ('Eva',), ('Dan',)])
+        self.assertEqual(answers.dtype, np.int16)
+        self.assertEqual(answers.tolist(), [
+            [0, 1, -1, 3, 4],
+            [4, 3, -1, -1, -1],
+            [0, 1, 2, 3, 4],
+            [2, -1, 2, -1, -1],
+        ])
+
+        with self.assertNumQueries(1):
+            rows, answers = submissions.exclude(id=legacy.id).answer_matrix(5)
+        self.assertEqual(rows, [(first.id,), (short.id,), (long.id,)])
+
+        rows, answers = Submission.objects.none().answer_matrix(5)
+        self.assertEqual((rows, answers.shape), ([], (0, 5)))
+
+    def test_stored_answers_are_packed_in_batches(self):
+        for answers in ([0, 1], [None, 4, 2], []):
+            self.make_submission(self.test, answers)
+        Submission.objects.update(packed_answers=None)
+
+        self.assertEqual(Submission.objects.pack_stored_answers(batch_size=2), 2)
+        self.assertEqual(Submission.objects.pack_stored_answers(batch_size=2), 1)
+        self.assertEqual(Submission.objects.pack_stored_answers(batch_size=2), 0)
+        self.assertEqual(sorted(bytes(s.packed_answers) for s in Submission.objects.all()),
+                         [b'', bytes([0, 1]), bytes([255, 4, 2])])
+
+
+class TestStatsTests(SmartGraderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.key = [0, 1, 2, 3, 4] * 2
+        self.test = self.make_test(self.key)
+        self.first = self.make_submission(self.test, self.key)
+        get_test_stats(self.test)
+
+    def snapshot(self):
+        stats, questions = get_test_stats(self.test)
+        return (
+            (stats.count, stats.score_sum, stats.score_sq_sum, round(stats.percentage_sum, 6),
+             stats.min_score, stats.max_score, stats.score_histogram),
+            [(q.question, q.correct_count, q.blank_count, q.option_counts) for q in questions],
+        )
+
+    def assert_matches_rebuild(self):
+        incremental = self.snapshot()
+        self.assertFalse(TestStats.objects.get(test=self.test).stale)
+        rebuild_test_stats(self.test)
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_saves_and_deletes_are_applied_by_difference(self):
+        second = self.make_submission(self.test, [4, 4, None] + self.key[3:], first_name='Ion')
+        self.make_submission(self.test, [None] * 10, first_name='Dan')
+        self.assert_matches_rebuild()
+
+        second.answers = self.key[:9] + [0]
+        second.score, second.percentage = 9, 90.0
+        second.save()
+        self.assert_matches_rebuild()
+
+        second.delete()
+        self.assert_matches_rebuild()
+        stats, _ = get_test_stats(self.test)
+        self.assertEqual((stats.count, stats.min_score, stats.max_score), (2, 0, 10))
+
+    def test_unchanged_state_only_bumps_the_version(self):
+        before = TestStats.objects.get(test=self.test)
+        self.first.first_name = 'Anna'
+        self.first.save()
+
+        after = TestStats.objects.get(test=self.test)
+        self.assertEqual(after.version, before.version + 1)
+        self.assertGreater(after.updated_at, before.updated_at)
+        self.assertEqual((after.count, after.score_sum), (before.count, before.score_sum))
+
+    def test_bulk_delete_marks_stale_until_next_read(self):
+        self.make_submission(self.test, self.key, first_name='Ion')
+        Submission.objects.filter(test=self.test).delete()
+        self.assertTrue(TestStats.objects.get(test=self.test).stale)
+
+        stats, _ = get_test_stats(self.test)
+        self.assertEqual((stats.count, stats.stale), (0, False))
+
+    def test_unmaterialized_statistics_are_built_on_first_read(self):
+        other = self.make_test(self.key, title='Other')
+        self.make_submission(other, self.key)
+        self.assertFalse(TestStats.objects.filter(test=other).exists())
+
+        stats, questions = get_test_stats(other)
+        self.assertEqual((stats.count, stats.score_sum, len(questions)), (1, 10, 10))
+
+
+class TestListPagingTests(SmartGraderTestCase):
+    def setUp(self):
+        super().setUp()
+        key = [0, 1, 2, 3, 4]
+        # Repeated titles, submission counts and averages, so pages have to
+        # break ties by id
+        for i, title in enumerate(['Quiz', 'quiz', 'Algebra', 'Quiz', 'Biology', 'algebra', 'Quiz', 'Chemistry']):
+            test = self.make_test(key, title=title)
+            for _ in range(i % 3):
+                self.make_submission(test, key[:3 + i % 2] + [None] * (2 - i % 2))
+
+    def walk(self, sort):
+        """Every page of the list, returning the test ids and the number of pages"""
+        ids, pages, cursor = [], 0, None
+        while True:
+            response = self.client.get(reverse('test-list'), dict(sort=sort, **({'after': cursor} if cursor else {})))
+            ids += [row['test'].id for row in response.context['tests_with_stats']]
+            pages += 1
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                return ids, pages
+
+    def test_pages_have_no_duplicates_or_gaps(self):
+        tests = list(Test.objects.filter(created_by=self.teacher))
+        count = {test.id: test.submissions.count() for test in tests}
+        average = {test.id: sum(s.percentage for s in test.submissions.all()) / (count[test.id] or 1) for test in tests}
+        expected = {
+            'date-desc': sorted(tests, key=lambda t: (t.created_at, t.id), reverse=True),
+            'date-asc': sorted(tests, key=lambda t: (t.created_at, t.id)),
+            'name-asc': sorted(tests, key=lambda t: (t.title.lower(), t.id)),
+            'name-desc': sorted(tests, key=lambda t: (t.title.lower(), t.id), reverse=True),
+            'submissions-desc': sorted(tests, key=lambda t: (count[t.id], t.id), reverse=True),
+            'average-desc': sorted(tests, key=lambda t: (average[t.id], t.id), reverse=True),
+        }
+        with mock.patch.object(views, 'TEST_LIST_PAGE_SIZE', 3):
+            for sort, ordered in expected.items():
+                ids, pages = self.walk(sort)
+                self.assertEqual(ids, [test.id for test in ordered], sort)
+                self.assertEqual(pages, 3, sort)
+
+    def test_bad_cursor_starts_over(self):
+        with mock.patch.object(views, 'TEST_LIST_PAGE_SIZE', 3):
+            first = self.client.get(reverse('test-list')).context['tests_with_stats']
+            response = self.client.get(reverse('test-list'), {'after': 'garbage'})
+        self.assertEqual([row['test'].id for row in response.context['tests_with_stats']],
+                         [row['test'].id for row in first])
+
+
+class RankingTests(SmartGraderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.key = [0, 1, 2, 3, 4] * 2
+        self.test = self.make_test(self.key)
+
+    def test_standing_in_histogram(self):
+        # Scores 10, 8, 8 and 5 out of 10
+        histogram = [0] * 11
+        for score in (10, 8, 8, 5):
+            histogram[score] += 1
+
+        self.assertEqual(standing_in_histogram(histogram, 10), (1, 87.5))
+        # Equal scores share a rank and count half towards the percentile
+        self.assertEqual(standing_in_histogram(histogram, 8), (2, 50.0))
+        self.assertEqual(standing_in_histogram(histogram, 5), (4, 12.5))
+        self.assertEqual(standing_in_histogram([0] * 11, 5), (None, None))
+
+    def test_class_standing_of_tied_submissions(self):
+        top = self.make_submission(self.test, self.key)
+        tied = [self.make_submission(self.test, self.key[:8] + [None, None], first_name=name)
+                for name in ('Ion', 'Dan')]
+        bottom = self.make_submission(self.test, [None] * 10, first_name='Eva')
+
+        self.assertEqual(class_standing(self.test, top),
+                         {'rank': 1, 'percentile': 87.5, 'total_students': 4, 'class_average': 65.0})
+        self.assertEqual([class_standing(self.test, s)['rank'] for s in tied], [2, 2])
+        self.assertEqual(class_standing(self.test, tied[0])['percentile'], 50.0)
+        standing = class_standing(self.test, bottom)
+        self.assertEqual((standing['rank'], standing['percentile']), (4, 12.5))
+
+    def test_single_submission_on_the_result_page(self):
+        student = self.make_user('student@example.com', 'student')
+        TestEnrollment.objects.create(student=student, test=self.test)
+        self.make_submission(self.test, self.key[:7] + [None] * 3, student_user=student)
+
+        self.client.force_login(student)
+        analysis = self.client.get(reverse('student-test-result', args=[self.test.id])).context['analysis']
+        self.assertEqual((analysis['student_rank'], analysis['total_students'], analysis['percentile']), (1, 1, 50.0))
+        self.assertEqual(analysis['class_average'], 70.0)
+
+
+def baseline_results_csv(test):
+    """Results CSV as the export view wrote it before it was streamed"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    submissions = test.submissions.filter(processed=True).order_by('-percentage', 'id')
+    writer.writerow(['Rank', 'First Name', 'Last Name', 'Score', 'Total', 'Percentage', 'Grade', 'Submitted At']
+                    + [f'Q{i + 1}' for i in range(test.num_questions)])
+    for rank, submission in enumerate(submissions, start=1):
+        row = [rank, submission.first_name or '', submission.last_name or '', submission.score,
+               submission.total_questions, f'{submission.percentage}%', letter_grade(submission.percentage),
+               submission.submitted_at.strftime('%Y-%m-%d %H:%M')]
+        for i in range(test.num_questions):
+            if i < len(submission.answers) and submission.answers[i] is not None:
+                row.append('ABCDE'[submission.answers[i]])
+            else:
+                row.append('-')
+        writer.writerow(row)
+
+    writer.writerow([])
+    writer.writerow(['SUMMARY STATISTICS'])
+    count = submissions.count()
+    writer.writerow(['Total Submissions', count])
+    if count:
+        writer.writerow(['Average Score', f'{sum(s.score for s in submissions) / count:.2f}/{test.num_questions}'])
+        writer.writerow(['Average Percentage', f'{sum(s.percentage for s in submissions) / count:.2f}%'])
+        writer.writerow(['Highest Score', max(s.score for s in submissions)])
+        writer.writerow(['Lowest Score', min(s.score for s in submissions)])
+        passed = len([s for s in submissions if s.percentage >= 60])
+        writer.writerow(['Pass Rate (≥60%)', f'{passed}/{count} ({passed / count * 100:.1f}%)'])
+    return output.getvalue()
+
+
+class ResultExportTests(SmartGraderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.key = [0, 1, 2, 3, 4] * 2
+        self.test = self.make_test(self.key, title='Algebra')
+        self.make_submission(self.test, self.key, first_name='Ana')
+        self.make_submission(self.test, self.key[:6] + [0, None, 1, None], first_name='Ion', last_name='')
+        self.make_submission(self.test, [None] * 10, first_name='Eva')
+        # Graded before answers were packed: only the JSON list, shorter
+        # than the test
+        legacy = self.make_submission(self.test, self.key[:7], first_name='Dan')
+        Submission.objects.filter(id=legacy.id).update(packed_answers=None)
+
+    def test_results_csv_matches_the_baseline_export(self):
+        response = self.client.get(reverse('export-results', args=[self.test.id]))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        content = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(content, baseline_results_csv(self.test))
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual([row[1] for row in rows[1:5]], ['Ana', 'Dan', 'Ion', 'Eva'])
+        self.assertEqual(rows[2][8:], list('ABCDEAB---'))
+        self.assertEqual(rows[-1], ['Pass Rate (≥60%)', '3/4 (75.0%)'])
+
+    def test_results_csv_of_a_test_without_submissions(self):
+        empty = self.make_test(self.key, title='Empty')
+        content = ''.join(iter_results_csv(empty))
+        self.assertEqual(content, baseline_results_csv(empty))
+        self.assertTrue(content.endswith('Total Submissions,0\r\n'))
+
+    def test_gradebook_zip_holds_every_test(self):
+        other = self.make_test(self.key, title='Geometry')
+        self.make_submission(other, self.key[:5] + [None] * 5, first_name='Ana')
+        image = default_storage.save('submissions/export.png', ContentFile(b'png bytes'))
+        Submission.objects.update(image=image)
+
+        response = self.client.get(reverse('export-gradebook'), {'tests': f'{self.test.id},{other.id}', 'images': '1'})
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+        images = sorted(name for name in archive.namelist() if name.startswith('images/'))
+        self.assertEqual(archive.namelist()[:3], [
+            'gradebook.csv', f'tests/{self.test.id}_algebra.csv', f'tests/{other.id}_geometry.csv',
+        ])
+        self.assertEqual(len(images), 5)
+        self.assertEqual(archive.read(images[0]), b'png bytes')
+        self.assertEqual(archive.read(f'tests/{self.test.id}_algebra.csv').decode(), baseline_results_csv(self.test))
+        self.assertEqual(archive.read(f'tests/{other.id}_geometry.csv').decode(), baseline_results_csv(other))
+
+        gradebook = list(csv.reader(io.StringIO(archive.read('gradebook.csv').decode())))
+        self.assertEqual(gradebook[0], ['Student', 'Email', 'Algebra', 'Geometry', 'Average'])
+        self.assertEqual(sorted(gradebook[1:]), [
+            ['Ana Pop', '', '100.0', '50.0', '75.00'],
+            ['Dan Pop', '', '70.0', '', '70.00'],
+            ['Eva Pop', '', '0.0', '', '0.00'],
+            ['Ion', '', '60.0', '', '60.00'],
+        ])
+
+    def test_gradebook_without_images(self):
+        response = self.client.get(reverse('export-gradebook'))
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive.namelist(), ['gradebook.csv', f'tests/{self.test.id}_algebra.csv'])
+        self.assertIsNone(archive.testzip())
+
+
+class SubmissionsApiTests(SmartGraderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.key = [0, 1, 2, 3, 4] * 2
+        self.test = self.make_test(self.key)
+        self.url = f'/tests/{self.test.id}/submissions/'
+        names = ['Ana', 'bogdan', 'Cristi', 'dana', 'Elena', 'florin', 'Gabi']
+        # Repeated scores, so pages have to break ties by id
+        for i, name in enumerate(names):
+            answers = self.key[:10 - i % 3] + [None] * (i % 3)
+            self.make_submission(self.test, answers, first_name=name, last_name='Pop')
+
+    def walk(self, **params):
+        """Every page of the list, returning the rows and the number of pages"""
+        rows, pages, cursor = [], 0, None
+        while True:
+            query = dict(params, limit=3, **({'after': cursor} if cursor else {}))
+            data = self.client.get(self.url, query).json()
+            rows += data['submissions']
+            pages += 1
+            cursor = data['next_cursor']
+            if cursor is None:
+                return rows, pages
+
+    def test_pages_follow_every_sort_order(self):
+        submissions = list(Submission.objects.filter(test=self.test))
+        expected = {
+            'percentage-desc': sorted(submissions, key=lambda s: (s.percentage, s.id), reverse=True),
+            'percentage-asc': sorted(submissions, key=lambda s: (s.percentage, s.id)),
+            'name-asc': sorted(submissions, key=lambda s: (s.full_name.lower(), s.id)),
+            'name-desc': sorted(submissions, key=lambda s: (s.full_name.lower(), s.id), reverse=True),
+            'date-desc': sorted(submissions, key=lambda s: (s.submitted_at, s.id), reverse=True),
+        }
+        for sort, ordered in expected.items():
+            rows, pages = self.walk(sort=sort)
+            self.assertEqual([row['id'] for row in rows], [s.id for s in ordered], sort)
+            self.assertEqual(pages, 3)
+
+    def test_fields_and_search(self):
+        data = self.client.get(self.url, {'fields': 'id,student_name', 'q': 'an', 'sort': 'name-asc'}).json()
+        self.assertEqual([set(row) for row in data['submissions']], [{'id', 'student_name'}] * 3)
+        self.assertEqual([row['student_name'] for row in data['submissions']],
+                         ['Ana Pop', 'bogdan Pop', 'dana Pop'])
+
+    def test_bad_parameters_are_rejected(self):
+        for params in ({'sort': 'score'}, {'fields': 'id,secret'}, {'limit': 'all'}, {'after': 'garbage'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+    def test_unchanged_list_answers_304(self):
+        first = self.client.get(self.url)
+        etag = first['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Another page of the same list has its own tag
+        self.assertNotEqual(self.client.get(self.url, {'limit': 2})['ETag'], etag)
+
+        submission = Submission.objects.filter(test=self.test).first()
+        submission.first_name = 'Renamed'
+        submission.save()
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+        submission.delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=changed['ETag']).status_code, 200)
+
+
+class ProfileRoleTests(SmartGraderTestCase):
+    def profile_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, sum('"accounts_profile"' in query['sql'] for query in queries.captured_queries)
+
+    def test_role_is_kept_in_the_session(self):
+        response, queries = self.profile_queries(reverse('test-list'))
+        self.assertEqual((response.status_code, queries), (200, 1))
+        stamp = cache.get(role_stamp_key(self.teacher.pk))
+        self.assertEqual(self.client.session[ROLE_SESSION_KEY], [self.teacher.pk, 'teacher', stamp])
+
+        response, queries = self.profile_queries(reverse('test-list'))
+        self.assertEqual((response.status_code, queries), (200, 0))
+
+    def test_role_change_applies_on_the_next_request(self):
+        self.client.get(reverse('test-list'))
+        profile = Profile.objects.get(user=self.teacher)
+        profile.role = 'student'
+        profile.save()
+
+        response = self.client.get(reverse('test-list'))
+        self.assertRedirects(response, reverse('student-dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.client.session[ROLE_SESSION_KEY][1], 'student')
+
+    def test_expired_stamp_looks_the_role_up_again(self):
+        self.client.get(reverse('test-list'))
+        cache.delete(role_stamp_key(self.teacher.pk))
+
+        response, queries = self.profile_queries(reverse('test-list'))
+        self.assertEqual((response.status_code, queries), (200, 1))
+        self.assertEqual(self.client.session[ROLE_SESSION_KEY][2], cache.get(role_stamp_key(self.teacher.pk)))
+
+    def test_user_without_profile_becomes_a_student(self):
+        user = User.objects.create_user(email='new@example.com', password='password')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('test-list'))
+        self.assertRedirects(response, reverse('student-dashboard'), fetch_redirect_response=False)
+        self.assertEqual(Profile.objects.get(user=user).role, 'student')
+
+
+class VersionedCacheTests(SmartGraderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.key = [0, 1, 2, 3, 4] * 2
+        self.test = self.make_test(self.key, title='Algebra')
+        self.make_submission(self.test, self.key)
+
+    def test_values_are_rebuilt_once_their_entity_changes(self):
+        builds = []
+
+        def build():
+            builds.append(len(builds))
+            return len(builds)
+
+        self.assertEqual(cached('test-analytics', [('test', 1)], build), 1)
+        self.assertEqual(cached('test-analytics', [('test', 1)], build), 1)
+        self.assertEqual(cached('test-analytics', [('test', 1)], build, 'other'), 2)
+        # Only bumped once the change is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_entity('test', 1)
+            self.assertEqual(cached('test-analytics', [('test', 1)], build), 1)
+        self.assertEqual(cached('test-analytics', [('test', 1)], build), 3)
+        self.assertEqual(cached('test-analytics', [('test', 2)], build), 4)
+
+        self.assertEqual(cache_stats()['test-analytics'], {'hits': 2, 'misses': 4, 'hit_rate': 0.3333})
+
+    def test_new_submission_invalidates_analytics(self):
+        url = f'/tests/{self.test.id}/analytics/'
+        self.assertEqual(self.client.get(url).json()['total_submissions'], 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).json()['total_submissions'], 1)
+        self.assertFalse(any('"accounts_teststats"' in query['sql'] for query in queries.captured_queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_submission(self.test, [None] * 10, first_name='Ion')
+        analytics = self.client.get(url).json()
+        self.assertEqual((analytics['total_submissions'], analytics['average_score']), (2, 5.0))
+
+    def test_renamed_test_invalidates_the_test_list(self):
+        self.assertContains(self.client.get(reverse('test-list')), 'Algebra')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/tests/{self.test.id}/update-name/', json.dumps({'title': 'Geometry'}),
+                             content_type='application/json')
+        response = self.client.get(reverse('test-list'))
+        self.assertContains(response, 'Geometry')
+        self.assertNotContains(response, 'Algebra')
+
+    def test_answer_key_change_and_unenrolling_invalidate_student_results(self):
+        student = self.make_user('student@example.com', 'student')
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment = TestEnrollment.objects.create(student=student, test=self.test)
+            self.make_submission(self.test, self.key, first_name='Dan', student_user=student)
+        url = reverse('student-test-result', args=[self.test.id])
+        self.client.force_login(student)
+        self.assertEqual(self.client.get(url).context['submission'].score, 10)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.teacher)
+            self.client.post(f'/tests/{self.test.id}/answer-key/', json.dumps({
+                'corrections': [{'question': 1, 'correct_answer': 4}],
+            }), content_type='application/json')
+        self.client.force_login(student)
+        self.assertEqual(self.client.get(url).context['submission'].score, 9)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment.delete()
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_cache_stats_are_staff_only(self):
+        self.assertEqual(self.client.get(reverse('cache-stats')).status_code, 302)
+        self.teacher.is_staff = True
+        self.teacher.save()
+        self.assertIn('test-pdf', self.client.get(reverse('cache-stats')).json()['kinds'])
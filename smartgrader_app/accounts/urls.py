@@ -17,6 +17,8 @@ urlpatterns = [
     path("profile/", views.profile_page, name="profile"),
     path("test-generator/", views.test_generator_page, name="test-generator"),
     path("tests/", views.test_list_page, name="test-list"),
+    path("tests/export/", views.export_gradebook, name="export-gradebook"),
+    path("tests/upload-submissions/", views.upload_mixed_submissions, name="upload-mixed-submissions"),
     path("tests/<int:test_id>/", views.test_detail_page, name="test-detail"),
     path("tests/<int:test_id>/update-name/", views.update_test_name, name="update-test-name"),
     path("tests/<int:test_id>/generate-pdf/", views.generate_pdf_api, name="generate-pdf"),
@@ -27,7 +29,13 @@ urlpatterns = [
     path("tests/<int:test_id>/submissions/<int:submission_id>/", views.submission_detail_page, name="submission-detail"),
     path("tests/<int:test_id>/submissions/<int:submission_id>/update-name/", views.update_submission_name, name="update-submission-name"),
     path("tests/<int:test_id>/analytics/", views.test_analytics_api, name="test-analytics"),
+    path("tests/<int:test_id>/answer-key/", views.update_answer_key, name="update-answer-key"),
+    path("tests/<int:test_id>/item-analysis/", views.item_analysis_api, name="item-analysis"),
+    path("tests/<int:test_id>/rescore/", views.rescore_test_api, name="rescore-test"),
     path("tests/<int:test_id>/export/", views.export_results_csv, name="export-results"),
+    path("cache-stats/", views.cache_stats_api, name="cache-stats"),
+    path("grading-jobs/<int:job_id>/", views.grading_job_status_api, name="grading-job-status"),
+    path("grading-jobs/<int:job_id>/events/", views.grading_job_events_api, name="grading-job-events"),
 
     # Student Portal
     path("student/", views.student_dashboard, name="student-dashboard"),
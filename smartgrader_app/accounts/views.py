@@ -1,29 +1,100 @@
 from django.contrib.auth import get_user_model
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.conf import settings
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
-from .models import Test, Submission, TestEnrollment, Profile, EmailVerificationToken
+from .models import Test, Submission, TestEnrollment, Profile, EmailVerificationToken, GradingJob, student_display_name
 from .decorators import teacher_required, student_required
+import hashlib
 import json
 import os
 import sys
 import random
 import zipfile
+from django.urls import reverse
+from .grading import match_submission_to_student
+from .grading_jobs import (
+    enqueue_grading_job, claim_grading_job, run_grading_job, new_worker_id, grading_job_status
+)
+from .grading_progress import grading_job_events, iter_grading_job_events
+from .rescoring import rescore_test
+from .test_stats import class_summary, current_stats, get_test_stats
+from .item_analysis import analyze_test
+from .pagination import keyset_page
+from .ranking import class_standing
+from .exports import iter_gradebook_zip, iter_results_csv
+from .caching import cache_stats, cached
+from django.db.models import Avg, Case, CharField, Count, FloatField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Concat, Lower, NullIf, Trim
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
-from .omr_processor import process_omr_image, grade_submission
-from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 
 # Add pdf_generator to path
 sys.path.append(os.path.join(settings.BASE_DIR.parent, 'pdf_generator'))
 from pdf_generator import generate_test_pdf_from_db
 
+# Test list sort options: (sort key, descending)
+TEST_LIST_SORTS = {
+    'date-desc': ('created_at', True),
+    'date-asc': ('created_at', False),
+    'name-asc': ('sort_title', False),
+    'name-desc': ('sort_title', True),
+    'submissions-desc': ('submission_count', True),
+    'average-desc': ('average_percentage', True),
+}
+TEST_LIST_PAGE_SIZE = 24
+
+# Submission list sort options: (sort key, descending)
+SUBMISSION_SORTS = {
+    'percentage-desc': ('percentage', True),
+    'percentage-asc': ('percentage', False),
+    'name-asc': ('sort_name', False),
+    'name-desc': ('sort_name', True),
+    'date-desc': ('submitted_at', True),
+    'date-asc': ('submitted_at', False),
+}
+
+# Submission list fields: (columns read, value of a row)
+SUBMISSION_FIELDS = {
+    'id': (['id'], lambda row: row['id']),
+    'student_name': (
+        ['first_name', 'last_name', 'student_user__first_name', 'student_user__last_name', 'student_user__email'],
+        lambda row: student_display_name(
+            row['first_name'], row['last_name'],
+            row['student_user__first_name'], row['student_user__last_name'], row['student_user__email'],
+        ),
+    ),
+    'score': (['score'], lambda row: row['score']),
+    'total': (['total_questions'], lambda row: row['total_questions']),
+    'percentage': (['percentage'], lambda row: row['percentage']),
+    'submitted_at': (['submitted_at'], lambda row: row['submitted_at'].strftime('%Y-%m-%d %H:%M')),
+    'image_url': (['image'], lambda row: default_storage.url(row['image']) if row['image'] else None),
+}
+SUBMISSIONS_PAGE_SIZE = 100
+SUBMISSIONS_MAX_PAGE_SIZE = 500
+
+
+def submission_sort_name():
+    """Lowercased Submission.full_name as a query expression (for sorting and search)"""
+    sheet_name = Trim(Concat(Coalesce('first_name', Value('')), Value(' '), Coalesce('last_name', Value(''))))
+    user_name = Trim(Concat(
+        Coalesce('student_user__first_name', Value('')), Value(' '), Coalesce('student_user__last_name', Value('')),
+    ))
+    return Lower(Case(
+        When(student_user__isnull=False, then=Coalesce(NullIf(user_name, Value('')), 'student_user__email')),
+        default=Coalesce(NullIf(sheet_name, Value('')), Value('Unknown')),
+        output_field=CharField(),
+    ))
+
+
 User = get_user_model()
 
 
@@ -349,7 +420,9 @@ def create_test(request):
                 for test in created_tests:
                     pdf_filename = f"test_{test.id}.pdf"
                     pdf_path = os.path.join(media_root, pdf_filename)
-                    generate_test_pdf_from_db(test, pdf_path)
+                    layout = generate_test_pdf_from_db(test, pdf_path)
+                    test.add_sheet_layout(layout)
+                    test.save(update_fields=['sheet_layouts'])
                     pdf_urls.append(f"/media/tests/{pdf_filename}")
 
                 if len(created_tests) > 1:
@@ -486,28 +559,71 @@ Ensure each question tests understanding of {topic}."""
 @login_required
 @teacher_required
 def test_list_page(request):
-    """Render the test list page - show only user's tests with stats"""
-    tests = Test.objects.filter(created_by=request.user).order_by('-created_at')
-
-    # Add statistics for each test
-    tests_with_stats = []
-    for test in tests:
-        submissions = test.submissions.filter(processed=True)
-        stats = {
-            'test': test,
-            'submission_count': submissions.count(),
-            'average_percentage': 0,
-            'latest_submission': None
-        }
+    """
+    Render the test list page - show only user's tests with stats
+
+    One annotated query per page of tests (plus one for their latest
+    submissions), sorted on the server and paged by cursor (?after=);
+    pages are cached (accounts.caching).
+    """
+    sort = request.GET.get('sort', 'date-desc')
+    if sort not in TEST_LIST_SORTS:
+        sort = 'date-desc'
+    search = request.GET.get('q', '').strip()
+
+    processed = Submission.objects.filter(test=OuterRef('pk'), processed=True)
+    tests = (
+        Test.objects.filter(created_by=request.user)
+        .only('id', 'title', 'description', 'num_questions', 'created_at')
+        .annotate(
+            submission_count=Coalesce(
+                Subquery(processed.order_by().values('test').annotate(n=Count('id')).values('n')), 0
+            ),
+            average_percentage=Coalesce(
+                Subquery(processed.order_by().values('test').annotate(a=Avg('percentage')).values('a')), 0.0,
+                output_field=FloatField(),
+            ),
+            latest_submission_id=Subquery(processed.order_by('-submitted_at', '-id').values('id')[:1]),
+            sort_title=Lower('title'),
+        )
+    )
+    if search:
+        tests = tests.filter(Q(title__icontains=search) | Q(description__icontains=search))
+
+    sort_field, descending = TEST_LIST_SORTS[sort]
+    after = request.GET.get('after')
+
+    def build_page():
+        try:
+            page, next_cursor = keyset_page(tests, [sort_field, 'id'], descending, after, TEST_LIST_PAGE_SIZE)
+        except ValueError:
+            page, next_cursor = keyset_page(tests, [sort_field, 'id'], descending, None, TEST_LIST_PAGE_SIZE)
+
+        latest = Submission.objects.select_related('student_user').defer('fill_matrix').in_bulk(
+            [test.latest_submission_id for test in page if test.latest_submission_id]
+        )
 
-        if submissions.exists():
-            percentages = [sub.percentage for sub in submissions]
-            stats['average_percentage'] = round(sum(percentages) / len(percentages), 1)
-            stats['latest_submission'] = submissions.order_by('-submitted_at').first()
+        tests_with_stats = [
+            {
+                'test': test,
+                'submission_count': test.submission_count,
+                'average_percentage': round(test.average_percentage, 1),
+                'latest_submission': latest.get(test.latest_submission_id),
+            }
+            for test in page
+        ]
+        return tests_with_stats, next_cursor
 
-        tests_with_stats.append(stats)
+    # Cached until one of the teacher's tests or submissions changes
+    tests_with_stats, next_cursor = cached('test-list', [('teacher', request.user.id)], build_page, sort, search, after)
 
-    return render(request, 'accounts/test_list.html', {'tests_with_stats': tests_with_stats})
+    return render(request, 'accounts/test_list.html', {
+        'tests_with_stats': tests_with_stats,
+        'sort': sort,
+        'search': search,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('after'),
+    })
 
 
 @login_required
@@ -536,10 +652,15 @@ def generate_pdf_api(request, test_id):
         media_root = os.path.join(settings.BASE_DIR, 'media', 'tests')
         os.makedirs(media_root, exist_ok=True)
 
-        # Generate PDF
+        # Generate PDF (rendered once per version of the test, see accounts.caching)
         pdf_filename = f"test_{test.id}.pdf"
         pdf_path = os.path.join(media_root, pdf_filename)
-        generate_test_pdf_from_db(test, pdf_path)
+        pdf_bytes, layout = cached('test-pdf', [('test', test.id)], lambda: render_test_pdf(test, pdf_path))
+        with open(pdf_path, 'wb') as f:
+            f.write(pdf_bytes)
+        if test.get_sheet_layout(layout['version']) != json.loads(json.dumps(layout)):
+            test.add_sheet_layout(layout)
+            test.save(update_fields=['sheet_layouts'])
 
         return JsonResponse({
             "message": "PDF generated successfully!",
@@ -552,6 +673,18 @@ def generate_pdf_api(request, test_id):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+def render_test_pdf(test, pdf_path):
+    """
+    Render a test's PDF to pdf_path
+
+    Returns:
+        (PDF bytes, answer-sheet layout)
+    """
+    layout = generate_test_pdf_from_db(test, pdf_path)
+    with open(pdf_path, 'rb') as f:
+        return f.read(), layout
+
+
 @csrf_exempt
 @login_required
 @teacher_required
@@ -619,216 +752,205 @@ def logout_view(request):
     logout(request)
     return redirect('landing')
 
+
+def _queue_grading_upload(request, test=None):
+    """Store the uploaded sheets as a grading job and answer 202 with its status URL"""
+    uploaded_files = request.FILES.getlist('files')
+    zip_file = request.FILES.get('zip_file')
+    if not zip_file and not uploaded_files:
+        return JsonResponse({"error": "No files uploaded"}, status=400)
+
+    try:
+        job = enqueue_grading_job(request.user, uploaded_files, zip_file, test=test)
+    except zipfile.BadZipFile:
+        return JsonResponse({"error": "Uploaded file is not a valid zip archive"}, status=400)
+
+    # Without a worker process (development), grade in the request
+    if settings.GRADING_JOBS_INLINE:
+        worker_id = new_worker_id()
+        if claim_grading_job(worker_id, job_id=job.id):
+            run_grading_job(GradingJob.objects.get(id=job.id), worker_id)
+        job.refresh_from_db()
+
+    return JsonResponse({
+        "message": f"Queued {job.total_sheets} sheet(s) for grading",
+        "job_id": job.id,
+        "status": job.status,
+        "total": job.total_sheets,
+        "status_url": reverse('grading-job-status', args=[job.id]),
+        "events_url": reverse('grading-job-events', args=[job.id]),
+        "errors": job.errors,
+    }, status=202)
+
+
 @csrf_exempt
 @login_required
 @teacher_required
 def upload_submissions(request, test_id):
-    """Upload and process student submissions (images or zip file)"""
+    """
+    Queue student submissions (images or zip file) for grading
+
+    Returns 202 with the grading job id right away; progress and per-sheet
+    results are read from the job status endpoint.
+    """
     if request.method != "POST":
         return JsonResponse({"error": "Only POST allowed"}, status=400)
 
     try:
         test = Test.objects.get(id=test_id, created_by=request.user)
-        
-        # Get correct answers from test
-        correct_answers = [q['correct_answer'] for q in test.questions]
-        
-        uploaded_files = request.FILES.getlist('files')
-        zip_file = request.FILES.get('zip_file')
-        
-        results = []
-        errors = []
-        
-        # Handle zip file upload
-        if zip_file:
-            try:
-                # Save zip temporarily
-                zip_path = os.path.join(settings.BASE_DIR, 'media', 'temp', zip_file.name)
-                os.makedirs(os.path.dirname(zip_path), exist_ok=True)
-                
-                with open(zip_path, 'wb+') as destination:
-                    for chunk in zip_file.chunks():
-                        destination.write(chunk)
-                
-                # Extract and process images
-                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                    extract_path = os.path.join(settings.BASE_DIR, 'media', 'temp', 'extracted')
-                    zip_ref.extractall(extract_path)
-                    
-                    # Process each image in zip
-                    for filename in os.listdir(extract_path):
-                        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')):
-                            image_path = os.path.join(extract_path, filename)
-                            result = process_single_submission(test, image_path, filename, correct_answers)
-                            results.append(result)
-                
-                # Cleanup
-                os.remove(zip_path)
-                import shutil
-                shutil.rmtree(extract_path)
-                
-            except Exception as e:
-                errors.append(f"Error processing zip file: {str(e)}")
-        
-        # Handle individual image uploads
-        elif uploaded_files:
-            for uploaded_file in uploaded_files:
-                # Save file temporarily
-                temp_path = os.path.join(settings.BASE_DIR, 'media', 'temp', uploaded_file.name)
-                os.makedirs(os.path.dirname(temp_path), exist_ok=True)
-                
-                with open(temp_path, 'wb+') as destination:
-                    for chunk in uploaded_file.chunks():
-                        destination.write(chunk)
-                
-                # Process image
-                result = process_single_submission(test, temp_path, uploaded_file.name, correct_answers)
-                results.append(result)
-                
-                # Cleanup
-                os.remove(temp_path)
-        else:
-            return JsonResponse({"error": "No files uploaded"}, status=400)
-        
-        return JsonResponse({
-            "message": f"Processed {len(results)} submission(s)",
-            "results": results,
-            "errors": errors
-        }, status=200)
-        
+        return _queue_grading_upload(request, test)
     except Test.DoesNotExist:
         return JsonResponse({"error": "Test not found"}, status=404)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
-def match_submission_to_student(submission, test, first_name, last_name):
+@csrf_exempt
+@login_required
+@teacher_required
+def upload_mixed_submissions(request):
     """
-    Try to match a submission to an enrolled student based on name.
-    Returns the matched user or None.
+    Queue a mixed stack of answer sheets for several tests or variants.
+
+    The grading worker routes each sheet by the QR code printed on it, then
+    grades the sheets group by group so every Test's answer key and layout
+    template is loaded once per group.
     """
-    # Ensure first_name and last_name are strings, not None
-    first_name = first_name or ''
-    last_name = last_name or ''
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST allowed"}, status=400)
 
-    if not first_name and not last_name:
-        return None
+    try:
+        return _queue_grading_upload(request)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
 
-    # Get all enrolled students for this test
-    enrollments = TestEnrollment.objects.filter(test=test).select_related('student')
 
-    for enrollment in enrollments:
-        user = enrollment.student
-        # Try exact match (case-insensitive) - handle None values
-        user_first = (user.first_name or '').strip().lower()
-        user_last = (user.last_name or '').strip().lower()
-        ocr_first = first_name.strip().lower()
-        ocr_last = last_name.strip().lower()
-
-        # Match: first and last name
-        if user_first and user_last and ocr_first and ocr_last:
-            if user_first == ocr_first and user_last == ocr_last:
-                return user
-            # Try swapped (in case OCR detected them backwards)
-            if user_first == ocr_last and user_last == ocr_first:
-                return user
-        # Match: only last name (more unique)
-        elif user_last and ocr_last and user_last == ocr_last:
-            return user
-
-    return None
-
-
-def process_single_submission(test, image_path, filename, correct_answers):
-    """Process a single submission image"""
+@login_required
+@teacher_required
+def grading_job_status_api(request, job_id):
+    """
+    Progress of a grading job
+
+    Query params:
+        after: Only return results for sheets finished after this one (the
+            last 'seq' seen), so polling clients get each result once
+    """
     try:
-        # Run OMR processing
-        omr_result = process_omr_image(image_path, test.num_questions, test.num_options)
-        
-        if not omr_result['success']:
-            return {
-                'filename': filename,
-                'success': False,
-                'error': omr_result['error']
-            }
-        
-        detected_answers = omr_result['answers']
-        student_info = omr_result.get('student_info', {})
+        job = GradingJob.objects.get(id=job_id, created_by=request.user)
+    except GradingJob.DoesNotExist:
+        return JsonResponse({"error": "Grading job not found"}, status=404)
 
-        # Grade the submission
-        grading = grade_submission(detected_answers, correct_answers)
+    try:
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        return JsonResponse({"error": "Invalid 'after' parameter"}, status=400)
 
-        # Save to database
-        # First, save the image permanently
-        submission_image_path = f"submissions/test_{test.id}_{filename}"
-        with open(image_path, 'rb') as f:
-            image_content = f.read()
-        saved_path = default_storage.save(submission_image_path, ContentFile(image_content))
+    return JsonResponse(grading_job_status(job, after), status=200)
 
-        # Extract student info from OCR (handle None values)
-        first_name = (student_info.get('first_name') or '').strip()
-        last_name = (student_info.get('last_name') or '').strip()
 
-        # Try to match with enrolled student
-        student_user = match_submission_to_student(None, test, first_name, last_name)
+@login_required
+@teacher_required
+def grading_job_events_api(request, job_id):
+    """
+    Stream a grading job's per-sheet results and running class statistics
+    as Server-Sent Events (see accounts/grading_progress.py)
 
-        submission = Submission.objects.create(
-            test=test,
-            student_user=student_user,  # Link to enrolled student if matched
-            first_name=first_name,
-            last_name=last_name,
-            image=saved_path,
-            answers=detected_answers,
-            score=grading['score'],
-            total_questions=grading['total'],
-            percentage=grading['percentage'],
-            processed=True
-        )
-        
-        return {
-            'filename': filename,
-            'success': True,
-            'submission_id': submission.id,
-            'score': grading['score'],
-            'total': grading['total'],
-            'percentage': grading['percentage']
-        }
-        
-    except Exception as e:
-        return {
-            'filename': filename,
-            'success': False,
-            'error': str(e)
-        }
+    Reconnecting clients send Last-Event-ID and only get the sheets after it.
+    """
+    if not GradingJob.objects.filter(id=job_id, created_by=request.user).exists():
+        return JsonResponse({"error": "Grading job not found"}, status=404)
+
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_event_id = 0
+
+    # WSGI buffers an async iterator until it ends, so it gets the blocking one
+    events = grading_job_events if isinstance(request, ASGIRequest) else iter_grading_job_events
+    response = StreamingHttpResponse(events(job_id, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @login_required
 @teacher_required
 def get_test_submissions(request, test_id):
-    """Get all submissions for a test"""
+    """
+    Get a page of a test's submissions
+
+    Rows are read as projected values in one query per page and paged by
+    cursor. The response carries an ETag and Last-Modified from the test's
+    statistics watermark (TestStats.version, bumped by every submission
+    change), so polling clients get 304 Not Modified until something changes.
+
+    Query parameters:
+        sort: One of SUBMISSION_SORTS (default percentage-desc)
+        q: Only students whose name contains this text
+        fields: Comma-separated subset of SUBMISSION_FIELDS (default all)
+        limit: Rows per page (at most SUBMISSIONS_MAX_PAGE_SIZE)
+        after: next_cursor of the previous page
+    """
     try:
-        test = Test.objects.get(id=test_id, created_by=request.user)
-        submissions = test.submissions.all()
-        
-        submissions_data = [{
-            'id': sub.id,
-            'student_name': sub.full_name,
-            'score': sub.score,
-            'total': sub.total_questions,
-            'percentage': sub.percentage,
-            'submitted_at': sub.submitted_at.strftime('%Y-%m-%d %H:%M'),
-            'image_url': sub.image.url if sub.image else None
-        } for sub in submissions]
-        
-        return JsonResponse({
-            'submissions': submissions_data,
-            'count': len(submissions_data)
-        }, status=200)
-        
+        test = Test.objects.only('id').get(id=test_id, created_by=request.user)
     except Test.DoesNotExist:
         return JsonResponse({"error": "Test not found"}, status=404)
-    except Exception as e:
-        return JsonResponse({"error": str(e)}, status=500)
+
+    sort = request.GET.get('sort', 'percentage-desc')
+    if sort not in SUBMISSION_SORTS:
+        return JsonResponse({"error": f"sort must be one of: {', '.join(SUBMISSION_SORTS)}"}, status=400)
+    fields = [field for field in request.GET.get('fields', '').split(',') if field] or list(SUBMISSION_FIELDS)
+    unknown = [field for field in fields if field not in SUBMISSION_FIELDS]
+    if unknown:
+        return JsonResponse({"error": f"Unknown fields: {', '.join(unknown)}"}, status=400)
+    try:
+        limit = min(int(request.GET.get('limit', SUBMISSIONS_PAGE_SIZE)), SUBMISSIONS_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({"error": "limit must be a number"}, status=400)
+    if limit < 1:
+        return JsonResponse({"error": "limit must be positive"}, status=400)
+
+    # The same URL gives the same page until the watermark moves
+    stats = current_stats(test)
+    etag = '"submissions-{}-{}-{}"'.format(
+        test.id, stats.version, hashlib.sha1(request.get_full_path().encode()).hexdigest()[:12]
+    )
+    last_modified = stats.updated_at.timestamp()
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    columns = {'id'}
+    for field in fields:
+        columns.update(SUBMISSION_FIELDS[field][0])
+    submissions = Submission.objects.filter(test=test).annotate(sort_name=submission_sort_name())
+    search = request.GET.get('q', '').strip()
+    if search:
+        submissions = submissions.filter(sort_name__contains=search.lower())
+
+    sort_field, descending = SUBMISSION_SORTS[sort]
+    columns.add(sort_field)
+    try:
+        page, next_cursor = keyset_page(
+            submissions.values(*columns), [sort_field, 'id'], descending, request.GET.get('after'), limit
+        )
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+    submissions_data = [{field: SUBMISSION_FIELDS[field][1](row) for field in fields} for row in page]
+
+    response = JsonResponse({
+        'submissions': submissions_data,
+        'count': len(submissions_data),
+        'next_cursor': next_cursor,
+        'stats_version': stats.version,
+    }, status=200)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Cached by the browser, but revalidated on every request
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 @login_required
@@ -950,140 +1072,197 @@ def update_test_name(request, test_id):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@csrf_exempt
+@login_required
+@teacher_required
+def rescore_test_api(request, test_id):
+    """
+    Re-derive every submission's answers and score from its stored bubble
+    fill ratios, with adjustable mark rules (see accounts.rescoring)
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    try:
+        test = Test.objects.get(id=test_id, created_by=request.user)
+
+        data = json.loads(request.body or '{}')
+        min_fill = float(data.get('min_fill', 0.0))
+        double_mark_ratio = data.get('double_mark_ratio')
+        if double_mark_ratio is not None:
+            double_mark_ratio = float(double_mark_ratio)
+
+        if not 0 <= min_fill < 1:
+            return JsonResponse({'error': 'min_fill must be between 0 and 1'}, status=400)
+        if double_mark_ratio is not None and not 0 < double_mark_ratio <= 1:
+            return JsonResponse({'error': 'double_mark_ratio must be between 0 and 1'}, status=400)
+
+        summary = rescore_test(test, min_fill, double_mark_ratio, dry_run=bool(data.get('dry_run')))
+        return JsonResponse(dict(summary, success=True))
+
+    except Test.DoesNotExist:
+        return JsonResponse({'error': 'Test not found'}, status=404)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'Invalid rescoring parameters'}, status=400)
+
+
+@csrf_exempt
+@login_required
+@teacher_required
+def update_answer_key(request, test_id):
+    """
+    Correct the answer key of a test
+
+    Expects {"corrections": [{"question": 4, "correct_answer": 2}, ...]}
+    with 1-based question numbers. Saving the test regrades its
+    submissions (see accounts.signals).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    try:
+        test = Test.objects.get(id=test_id, created_by=request.user)
+
+        data = json.loads(request.body)
+        corrections = data.get('corrections', [])
+        if not corrections:
+            return JsonResponse({'error': 'No corrections given'}, status=400)
+
+        questions = [dict(q) for q in test.questions]
+        for correction in corrections:
+            number = int(correction['question'])
+            answer = int(correction['correct_answer'])
+            if not 1 <= number <= len(questions):
+                return JsonResponse({'error': f'Question {number} does not exist'}, status=400)
+            if not 0 <= answer < test.num_options:
+                return JsonResponse({'error': f'Invalid answer for question {number}'}, status=400)
+            questions[number - 1]['correct_answer'] = answer
+
+        test.questions = questions
+        test.save(update_fields=['questions', 'updated_at'])
+
+        return JsonResponse({
+            'success': True,
+            'answer_key_version': test.answer_key_version(),
+            'regraded': test.submissions.filter(processed=True).count(),
+        })
+
+    except Test.DoesNotExist:
+        return JsonResponse({'error': 'Test not found'}, status=404)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({'error': 'Invalid corrections'}, status=400)
+
+
 @login_required
 @teacher_required
 def test_analytics_api(request, test_id):
-    """Get analytics for a test"""
+    """Get analytics for a test (cached until the test or a submission changes)"""
     try:
         test = Test.objects.get(id=test_id, created_by=request.user)
-        submissions = test.submissions.filter(processed=True)
-        
-        if submissions.count() == 0:
-            return JsonResponse({
-                'count': 0,
-                'message': 'No submissions yet'
-            })
-        
-        # Calculate statistics
-        scores = [sub.score for sub in submissions]
-        percentages = [sub.percentage for sub in submissions]
-        
-        analytics = {
-            'total_submissions': submissions.count(),
-            'average_score': round(sum(scores) / len(scores), 2),
-            'average_percentage': round(sum(percentages) / len(percentages), 2),
-            'highest_score': max(scores),
-            'lowest_score': min(scores),
-            'pass_rate': round(len([p for p in percentages if p >= 60]) / len(percentages) * 100, 2),
-            'score_distribution': {
-                'excellent': len([p for p in percentages if p >= 80]),
-                'good': len([p for p in percentages if 60 <= p < 80]),
-                'needs_improvement': len([p for p in percentages if p < 60])
-            }
-        }
-        
-        # Question difficulty analysis
-        question_stats = []
-        for i in range(test.num_questions):
-            correct_count = sum(1 for sub in submissions if i < len(sub.answers) and sub.answers[i] == test.questions[i]['correct_answer'])
-            difficulty = round(correct_count / submissions.count() * 100, 2)
-            
-            question_stats.append({
-                'question_num': i + 1,
-                'correct_count': correct_count,
-                'difficulty_percentage': difficulty,
-                'question_text': test.questions[i]['question'][:50] + '...' if len(test.questions[i]['question']) > 50 else test.questions[i]['question']
-            })
-        
-        # Sort by difficulty (hardest first)
-        question_stats.sort(key=lambda x: x['difficulty_percentage'])
-        
-        analytics['question_difficulty'] = question_stats[:5]  # Top 5 hardest questions
-        
-        return JsonResponse(analytics)
-        
+        return JsonResponse(cached('test-analytics', [('test', test.id)], lambda: build_test_analytics(test)))
+
     except Test.DoesNotExist:
         return JsonResponse({"error": "Test not found"}, status=404)
 
 
-import csv
-from django.http import HttpResponse
+def build_test_analytics(test):
+    """Analytics of a test, from its materialized statistics (accounts.test_stats)"""
+    stats, question_counts = get_test_stats(test)
+
+    if stats.count == 0:
+        return {
+            'count': 0,
+            'message': 'No submissions yet'
+        }
+
+    analytics = class_summary(stats, test.num_questions)
+
+    # Question difficulty analysis
+    question_stats = [
+        {
+            'question_num': q.question + 1,
+            'correct_count': q.correct_count,
+            'difficulty_percentage': round(q.correct_count / stats.count * 100, 2),
+            'question_text': test.questions[q.question]['question'][:50] + '...' if len(test.questions[q.question]['question']) > 50 else test.questions[q.question]['question']
+        }
+        for q in question_counts
+    ]
+
+    # Sort by difficulty (hardest first)
+    question_stats.sort(key=lambda x: x['difficulty_percentage'])
+
+    analytics['question_difficulty'] = question_stats[:5]  # Top 5 hardest questions
+    return analytics
+
+
+@login_required
+@teacher_required
+def item_analysis_api(request, test_id):
+    """Item analysis of a test: difficulty, discrimination, distractors, reliability"""
+    try:
+        test = Test.objects.get(id=test_id, created_by=request.user)
+        return JsonResponse(analyze_test(test))
+
+    except Test.DoesNotExist:
+        return JsonResponse({"error": "Test not found"}, status=404)
+
 
 @login_required
 @teacher_required
 def export_results_csv(request, test_id):
-    """Export test results to CSV"""
+    """Export test results to CSV, streamed as the rows are read"""
     try:
         test = Test.objects.get(id=test_id, created_by=request.user)
-        submissions = test.submissions.filter(processed=True).order_by('-percentage')
-        
-        # Create CSV response
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="test_{test_id}_results.csv"'
-        
-        writer = csv.writer(response)
-        
-        # Write header
-        header = ['Rank', 'First Name', 'Last Name', 'Score', 'Total', 'Percentage', 'Grade', 'Submitted At']
-        
-        # Add question columns
-        for i in range(test.num_questions):
-            header.append(f'Q{i+1}')
-        
-        writer.writerow(header)
-        
-        # Write data
-        for rank, submission in enumerate(submissions, start=1):
-            grade = 'A' if submission.percentage >= 90 else \
-                   'B' if submission.percentage >= 80 else \
-                   'C' if submission.percentage >= 70 else \
-                   'D' if submission.percentage >= 60 else 'F'
-            
-            row = [
-                rank,
-                submission.first_name or '',
-                submission.last_name or '',
-                submission.score,
-                submission.total_questions,
-                f'{submission.percentage}%',
-                grade,
-                submission.submitted_at.strftime('%Y-%m-%d %H:%M')
-            ]
-            
-            # Add answers (show option letter)
-            option_letters = ['A', 'B', 'C', 'D', 'E']
-            for i in range(test.num_questions):
-                if i < len(submission.answers) and submission.answers[i] is not None:
-                    answer_idx = submission.answers[i]
-                    if answer_idx < len(option_letters):
-                        row.append(option_letters[answer_idx])
-                    else:
-                        row.append(str(answer_idx))
-                else:
-                    row.append('-')
-            
-            writer.writerow(row)
-        
-        # Write summary statistics
-        writer.writerow([])
-        writer.writerow(['SUMMARY STATISTICS'])
-        writer.writerow(['Total Submissions', submissions.count()])
-        
-        if submissions.count() > 0:
-            avg_score = sum(s.score for s in submissions) / submissions.count()
-            avg_pct = sum(s.percentage for s in submissions) / submissions.count()
-            writer.writerow(['Average Score', f'{avg_score:.2f}/{test.num_questions}'])
-            writer.writerow(['Average Percentage', f'{avg_pct:.2f}%'])
-            writer.writerow(['Highest Score', max(s.score for s in submissions)])
-            writer.writerow(['Lowest Score', min(s.score for s in submissions)])
-            pass_count = len([s for s in submissions if s.percentage >= 60])
-            writer.writerow(['Pass Rate (≥60%)', f'{pass_count}/{submissions.count()} ({pass_count/submissions.count()*100:.1f}%)'])
-        
-        return response
-        
     except Test.DoesNotExist:
         return HttpResponse("Test not found", status=404)
 
+    response = StreamingHttpResponse(iter_results_csv(test), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="test_{test_id}_results.csv"'
+    return response
+
+
+@login_required
+@teacher_required
+def export_gradebook(request):
+    """
+    Export the gradebook of several tests as one zip, streamed as it is
+    written: a student-by-test matrix, each test's results CSV and, with
+    ?images=1, the graded sheet images
+
+    Query parameters:
+        tests: Comma-separated test ids (default: all of the teacher's tests)
+        images: 1 to include the graded sheet images
+    """
+    tests = Test.objects.filter(created_by=request.user).order_by('created_at', 'id')
+    selected = request.GET.get('tests')
+    if selected:
+        try:
+            test_ids = [int(test_id) for test_id in selected.split(',') if test_id.strip()]
+        except ValueError:
+            return JsonResponse({"error": "tests must be a comma-separated list of test ids"}, status=400)
+        tests = tests.filter(id__in=test_ids)
+    tests = list(tests.only('id', 'title', 'num_questions', 'created_at'))
+    if not tests:
+        return JsonResponse({"error": "No tests to export"}, status=404)
+
+    include_images = request.GET.get('images') == '1'
+    response = StreamingHttpResponse(iter_gradebook_zip(tests, include_images), content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="gradebook.zip"'
+    return response
+
+
+@staff_member_required
+def cache_stats_api(request):
+    """Hits, misses and hit rate of each kind of cached value (accounts.caching)"""
+    return JsonResponse({
+        'backend': settings.CACHES['default']['BACKEND'],
+        'kinds': cache_stats(),
+    })
+
 
 # ============================================
 # STUDENT PORTAL VIEWS
@@ -1093,20 +1272,29 @@ def export_results_csv(request, test_id):
 @student_required
 def student_dashboard(request):
     """Student dashboard showing enrolled tests and results"""
-    # Get enrolled tests with their submissions
-    enrollments = TestEnrollment.objects.filter(student=request.user).select_related('test')
-    
+    # Get enrolled tests (without their questions) and the student's
+    # submissions for all of them, in two queries
+    enrollments = (
+        TestEnrollment.objects.filter(student=request.user)
+        .select_related('test')
+        .defer('test__questions', 'test__sheet_layouts')
+    )
+    enrollments = list(enrollments)
+
+    # Newest submission per test, like .first() on the default ordering
+    submissions = {}
+    student_submissions = Submission.objects.filter(
+        student_user=request.user,
+        test_id__in=[enrollment.test_id for enrollment in enrollments]
+    ).only('id', 'test_id', 'score', 'percentage', 'processed', 'submitted_at')
+    for submission in student_submissions:
+        submissions.setdefault(submission.test_id, submission)
+
     tests_data = []
     for enrollment in enrollments:
-        test = enrollment.test
-        # Get student's submission for this test
-        submission = Submission.objects.filter(
-            test=test,
-            student_user=request.user
-        ).first()
-        
+        submission = submissions.get(enrollment.test_id)
         tests_data.append({
-            'test': test,
+            'test': enrollment.test,
             'enrollment': enrollment,
             'submission': submission,
             'has_result': submission is not None and submission.processed
@@ -1164,31 +1352,47 @@ def enroll_in_test(request):
 @login_required
 @student_required
 def student_test_result(request, test_id):
-    """View detailed results for a specific test"""
+    """
+    View detailed results for a specific test
+
+    The page context is cached until the test, one of its submissions or
+    the student's enrollments change (accounts.caching).
+    """
+    context, error, status = cached(
+        'student-result', [('test', test_id), ('student', request.user.id)],
+        lambda: build_student_result(request.user, test_id),
+    )
+    if error:
+        return render(request, 'accounts/error.html', {'error': error}, status=status)
+    return render(request, 'accounts/student_result.html', context)
+
+
+def build_student_result(student, test_id):
+    """
+    Context of a student's result page
+
+    Returns:
+        (context, error, status): context None and an error message and
+        HTTP status if the page cannot be shown
+    """
     try:
         test = Test.objects.get(id=test_id)
         
         # Check if student is enrolled
-        if not TestEnrollment.objects.filter(student=request.user, test=test).exists():
-            return render(request, 'accounts/error.html', {
-                'error': 'You are not enrolled in this test'
-            }, status=403)
+        if not TestEnrollment.objects.filter(student=student, test=test).exists():
+            return None, 'You are not enrolled in this test', 403
         
         # Get student's submission
         submission = Submission.objects.filter(
             test=test,
-            student_user=request.user
-        ).first()
+            student_user=student
+        ).defer('fill_matrix').first()
         
         if not submission:
-            return render(request, 'accounts/error.html', {
-                'error': 'No results available yet. Your answer sheet may not have been uploaded.'
-            }, status=404)
+            return None, 'No results available yet. Your answer sheet may not have been uploaded.', 404
         
         if not submission.processed:
-            return render(request, 'accounts/error.html', {
-                'error': 'Your submission is still being processed. Please check back later.'
-            }, status=404)
+            return None, 'Your submission is still being processed. Please check back later.', 404
         
         # Prepare answer details
         answer_details = []
@@ -1206,18 +1410,13 @@ def student_test_result(request, test_id):
                 'is_correct': is_correct
             })
 
-        # Calculate performance analysis
-        all_submissions = Submission.objects.filter(test=test, processed=True)
+        # Calculate performance analysis from the class statistics
+        # (accounts.ranking), without loading the other submissions
+        standing = class_standing(test, submission)
         analysis = None
 
-        if all_submissions.count() > 0:
-            # Class statistics
-            class_percentages = [s.percentage for s in all_submissions]
-            class_average = sum(class_percentages) / len(class_percentages)
-
-            # Student ranking
-            submissions_sorted = sorted(all_submissions, key=lambda s: s.percentage, reverse=True)
-            student_rank = next((i + 1 for i, s in enumerate(submissions_sorted) if s.id == submission.id), None)
+        if standing:
+            class_average = standing['class_average']
 
             # Performance vs class average
             performance_diff = submission.percentage - class_average
@@ -1245,9 +1444,11 @@ def student_test_result(request, test_id):
 
             analysis = {
                 'class_average': round(class_average, 1),
-                'student_rank': student_rank,
-                'total_students': all_submissions.count(),
+                'student_rank': standing['rank'],
+                'percentile': standing['percentile'],
+                'total_students': standing['total_students'],
                 'performance_diff': round(performance_diff, 1),
+                'performance_gap': round(abs(performance_diff), 1),
                 'performance_level': performance_level,
                 'performance_message': performance_message,
                 'correct_count': correct_count,
@@ -1262,9 +1463,7 @@ def student_test_result(request, test_id):
             'analysis': analysis
         }
 
-        return render(request, 'accounts/student_result.html', context)
+        return context, None, 200
         
     except Test.DoesNotExist:
-        return render(request, 'accounts/error.html', {
-            'error': 'Test not found'
-        }, status=404)
+        return None, 'Test not found', 404
@@ -3,6 +3,10 @@ ASGI config for smartgrader_app project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``uvicorn smartgrader_app.asgi:application``)
+so the live grading progress streams (/grading-jobs/<id>/events/) wait
+asynchronously instead of holding a worker thread each.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
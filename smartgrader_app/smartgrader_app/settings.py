@@ -50,6 +50,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.middleware.ProfileRoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -162,3 +163,56 @@ MEDIA_ROOT = BASE_DIR / 'media'
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/tests/'
 LOGOUT_REDIRECT_URL = '/'
+
+# OMR batch grading
+# OMR_WORKERS: size of the grading pool (0 = one worker per CPU core, 1 = no pool)
+# OMR_POOL_MODE: 'process' or 'thread' (OpenCV releases the GIL, so threads also scale)
+# OMR_CV_THREADS: OpenCV threads per worker, keep workers x threads <= cores
+# OMR_DECODE_REDUCTION: decode uploads at 1/N resolution (1, 2, 4 or 8), e.g. 2 for 12+ MP photos
+# OMR_MAX_SHEET_BYTES: zip members larger than this (uncompressed) are skipped without decompressing
+OMR_WORKERS = config('OMR_WORKERS', default=0, cast=int)
+OMR_POOL_MODE = config('OMR_POOL_MODE', default='process')
+OMR_CV_THREADS = config('OMR_CV_THREADS', default=1, cast=int)
+OMR_DECODE_REDUCTION = config('OMR_DECODE_REDUCTION', default=1, cast=int)
+OMR_MAX_SHEET_BYTES = config('OMR_MAX_SHEET_BYTES', default=50 * 1024 * 1024, cast=int)
+
+# OCR service (shared pool of Tesseract recognizers, see accounts/ocr_service.py)
+# OCR_BACKEND: 'tesserocr' (optional, requirements-ocr.txt, keeps recognizers warm), 'tesseract' (CLI fallback,
+#   one process per batch, uncached) or empty to pick the best available
+# OCR_WORKERS: recognizer threads per process
+# OCR_QUEUE_SIZE: maximum OCR requests queued at once before callers block
+OCR_BACKEND = config('OCR_BACKEND', default='')
+OCR_WORKERS = config('OCR_WORKERS', default=2, cast=int)
+OCR_QUEUE_SIZE = config('OCR_QUEUE_SIZE', default=64, cast=int)
+
+# Grading job queue (uploads are graded by `manage.py run_grading_workers`, see accounts/grading_jobs.py)
+# GRADING_JOB_LEASE_SECONDS: a job whose worker has not checkpointed for this long is picked up by another worker
+# GRADING_JOB_MAX_ATTEMPTS: claims after which an interrupted job is marked failed
+# GRADING_JOBS_INLINE: grade jobs inside the upload request (development without a worker)
+GRADING_JOB_LEASE_SECONDS = config('GRADING_JOB_LEASE_SECONDS', default=120, cast=int)
+GRADING_JOB_MAX_ATTEMPTS = config('GRADING_JOB_MAX_ATTEMPTS', default=3, cast=int)
+GRADING_JOBS_INLINE = config('GRADING_JOBS_INLINE', default=False, cast=bool)
+
+# Cache (versioned keys for analytics, test lists, student results and test PDFs, see accounts/caching.py)
+# CACHE_BACKEND: 'locmem' (per process), 'file' (shared by the processes of one machine) or
+#   'redis' (any Redis-protocol server, shared by every machine; needs `pip install redis`)
+# CACHE_LOCATION: directory for 'file', server URL for 'redis' (e.g. redis://localhost:6379/0)
+# CACHE_TIMEOUT: seconds cached values are kept
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+CACHE_LOCATION = config('CACHE_LOCATION', default='')
+CACHE_TIMEOUT = config('CACHE_TIMEOUT', default=24 * 60 * 60, cast=int)
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'smartgrader'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://localhost:6379/0'),
+}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': CACHE_LOCATION or CACHE_BACKENDS[CACHE_BACKEND][1],
+        'TIMEOUT': CACHE_TIMEOUT,
+        'KEY_PREFIX': 'smartgrader',
+    }
+}
+if CACHE_BACKEND != 'redis':
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 5000}
@@ -133,12 +133,17 @@ document.addEventListener('DOMContentLoaded', function() {
     const searchInput = document.getElementById('search-submissions');
     const sortSelect = document.getElementById('sort-submissions');
 
+    // Search and sort are applied on the server (the list is paged)
+    let searchTimer = null;
     if (searchInput) {
-        searchInput.addEventListener('input', filterAndSortSubmissions);
+        searchInput.addEventListener('input', function() {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(loadSubmissions, SEARCH_DELAY_MS);
+        });
     }
 
     if (sortSelect) {
-        sortSelect.addEventListener('change', filterAndSortSubmissions);
+        sortSelect.addEventListener('change', loadSubmissions);
     }
 });
 
@@ -166,64 +171,255 @@ function uploadFiles(files, isZip) {
         if (data.error) {
             statusDiv.innerHTML = '';
             Toast.error('Upload Failed', data.error);
+            return;
+        }
+
+        // Skipped zip members
+        (data.errors || []).forEach(error => {
+            Toast.error('Upload Warning', error, 7000);
+        });
+
+        // Reset file inputs
+        document.getElementById('image-uploads').value = '';
+        document.getElementById('zip-upload').value = '';
+
+        if (window.EventSource) {
+            watchGradingJob(data.events_url, data.status_url, statusDiv);
         } else {
+            pollGradingJob(data.status_url, statusDiv);
+        }
+    })
+    .catch(error => {
+        statusDiv.innerHTML = '';
+        Toast.error('Upload Error', 'An error occurred while uploading submissions');
+        console.error('Error:', error);
+    });
+}
+
+function describeClassStats(stats) {
+    if (!stats || !stats.total_submissions) {
+        return '';
+    }
+    return `Class: ${stats.total_submissions} graded, average ${stats.average_percentage}%, ` +
+        `pass rate ${stats.pass_rate}%`;
+}
+
+function showGradingResults(results) {
+    // Show results
+    if (results.length > 0) {
+        let successCount = results.filter(r => r.success).length;
+        let failedResults = results.filter(r => !r.success);
+
+        // Show success toast
+        Toast.success('Upload Complete', `Successfully processed ${successCount}/${results.length} submissions`);
+
+        // Show error details for failed submissions
+        if (failedResults.length > 0) {
+            failedResults.forEach(result => {
+                Toast.error('Processing Failed', `${result.filename}: ${result.error}`, 7000);
+            });
+        }
+
+        // Graded as new submissions, but may be rescans of earlier sheets
+        results.filter(r => r.possible_rescan_of).forEach(result => {
+            Toast.warning('Possible Rescan',
+                `${result.filename} has the same answers and handwriting as submission #${result.possible_rescan_of}`,
+                7000);
+        });
+    }
+}
+
+function watchGradingJob(eventsUrl, statusUrl, statusDiv) {
+    // Each graded sheet arrives as its own event; the browser reconnects
+    // with Last-Event-ID and only receives sheets it has not seen
+    const source = new EventSource(eventsUrl);
+    const results = [];
+    let progress = {processed: 0, total: 0};
+    let classStats = '';
+
+    const render = () => {
+        const lines = [progress.status === 'queued'
+            ? 'Waiting for a grading worker...'
+            : `Grading submissions... ${progress.processed}/${progress.total}`];
+        const last = results[results.length - 1];
+        if (last) {
+            lines.push(last.success
+                ? `${last.filename}: ${last.score}/${last.total} (${last.percentage}%)`
+                : `${last.filename}: ${last.error}`);
+        }
+        if (classStats) {
+            lines.push(classStats);
+        }
+        // Filenames come from the upload, so no innerHTML here
+        statusDiv.style.whiteSpace = 'pre-line';
+        statusDiv.textContent = lines.join('\n');
+    };
+
+    source.addEventListener('progress', event => {
+        progress = JSON.parse(event.data);
+        render();
+    });
+
+    source.addEventListener('sheet', event => {
+        const result = JSON.parse(event.data);
+        results.push(result);
+        progress.processed = Math.max(progress.processed, results.length);
+        render();
+    });
+
+    source.addEventListener('stats', event => {
+        classStats = describeClassStats(JSON.parse(event.data));
+        render();
+    });
+
+    source.addEventListener('done', event => {
+        source.close();
+        const job = JSON.parse(event.data);
+        statusDiv.innerHTML = '';
+
+        showGradingResults(results);
+        if (job.status === 'failed') {
+            job.errors.forEach(error => {
+                Toast.error('Grading Failed', error, 7000);
+            });
+        } else if (results.length === 0) {
+            Toast.success('Upload Complete', 'No answer sheets found in the upload');
+        }
+
+        // Reload submissions
+        loadSubmissions();
+    });
+
+    source.onerror = () => {
+        // The browser retries dropped streams by itself; a refused one is
+        // closed, so fall back to polling
+        if (source.readyState === EventSource.CLOSED) {
+            pollGradingJob(statusUrl, statusDiv);
+        }
+    };
+}
+
+function pollGradingJob(statusUrl, statusDiv, lastSeq = 0, results = []) {
+    fetch(`${statusUrl}?after=${lastSeq}`)
+    .then(response => response.json())
+    .then(data => {
+        if (data.error) {
             statusDiv.innerHTML = '';
+            Toast.error('Grading Failed', data.error);
+            return;
+        }
 
-            // Show results
-            if (data.results && data.results.length > 0) {
-                let successCount = data.results.filter(r => r.success).length;
-                let failedResults = data.results.filter(r => !r.success);
-
-                // Show success toast
-                Toast.success('Upload Complete', `Successfully processed ${successCount}/${data.results.length} submissions`);
-
-                // Show error details for failed submissions
-                if (failedResults.length > 0) {
-                    failedResults.forEach(result => {
-                        Toast.error('Processing Failed', `${result.filename}: ${result.error}`, 7000);
-                    });
-                }
-            } else {
-                Toast.success('Upload Complete', data.message);
-            }
+        // Only sheets finished since the last poll are returned
+        data.results.forEach(result => {
+            results.push(result);
+            lastSeq = Math.max(lastSeq, result.seq);
+        });
 
-            // Reload submissions
-            loadSubmissions();
+        if (data.status === 'queued' || data.status === 'running') {
+            statusDiv.innerHTML = data.status === 'queued'
+                ? 'Waiting for a grading worker...'
+                : `Grading submissions... ${data.processed}/${data.total}`;
+            setTimeout(() => pollGradingJob(statusUrl, statusDiv, lastSeq, results), 1500);
+            return;
+        }
+
+        statusDiv.innerHTML = '';
 
-            // Reset file inputs
-            document.getElementById('image-uploads').value = '';
-            document.getElementById('zip-upload').value = '';
+        showGradingResults(results);
+
+        if (data.status === 'failed') {
+            data.errors.forEach(error => {
+                Toast.error('Grading Failed', error, 7000);
+            });
+        } else if (results.length === 0) {
+            Toast.success('Upload Complete', 'No answer sheets found in the upload');
         }
+
+        // Reload submissions
+        loadSubmissions();
     })
     .catch(error => {
         statusDiv.innerHTML = '';
-        Toast.error('Upload Error', 'An error occurred while uploading submissions');
+        Toast.error('Upload Error', 'Lost track of the grading progress, reload the page to see new submissions');
         console.error('Error:', error);
     });
 }
 
-// Global submissions data
+// Submissions shown, and the cursor and ETag of the pages loaded
+const SEARCH_DELAY_MS = 400;
+const SUBMISSIONS_POLL_MS = 15000;
 let allSubmissions = [];
+let submissionsCursor = null;
+let submissionsEtag = null;
+
+function submissionsUrl(after) {
+    const params = new URLSearchParams({
+        sort: document.getElementById('sort-submissions').value,
+        q: document.getElementById('search-submissions').value.trim(),
+    });
+    if (after) {
+        params.set('after', after);
+    }
+    return `/tests/${window.testId}/submissions/?${params}`;
+}
 
 function loadSubmissions() {
     const submissionsDiv = document.getElementById('submissions-list');
 
-    fetch(`/tests/${window.testId}/submissions/`)
+    fetch(submissionsUrl(null), {cache: 'no-store'})
+    .then(response => {
+        submissionsEtag = response.headers.get('ETag');
+        return response.json();
+    })
+    .then(showFirstSubmissionsPage)
+    .catch(error => {
+        submissionsDiv.innerHTML = '<p style="color: #ff4444;">Error loading submissions</p>';
+        console.error('Error:', error);
+    });
+}
+
+function showFirstSubmissionsPage(data) {
+    const submissionsDiv = document.getElementById('submissions-list');
+
+    allSubmissions = data.submissions || [];
+    submissionsCursor = data.next_cursor;
+    if (allSubmissions.length > 0 || document.getElementById('search-submissions').value.trim()) {
+        displaySubmissions(allSubmissions);
+    } else {
+        submissionsDiv.innerHTML = '<p style="color: #aaa;">No submissions yet. Upload student answer sheets to grade them automatically.</p>';
+    }
+}
+
+function loadMoreSubmissions() {
+    if (!submissionsCursor) return;
+
+    fetch(submissionsUrl(submissionsCursor))
     .then(response => response.json())
     .then(data => {
-        if (data.submissions && data.submissions.length > 0) {
-            allSubmissions = data.submissions;
-            displaySubmissions(allSubmissions);
-        } else {
-            submissionsDiv.innerHTML = '<p style="color: #aaa;">No submissions yet. Upload student answer sheets to grade them automatically.</p>';
-        }
+        allSubmissions = allSubmissions.concat(data.submissions || []);
+        submissionsCursor = data.next_cursor;
+        displaySubmissions(allSubmissions);
     })
     .catch(error => {
-        submissionsDiv.innerHTML = '<p style="color: #ff4444;">Error loading submissions</p>';
+        Toast.error('Error', 'Could not load more submissions');
         console.error('Error:', error);
     });
 }
 
+function pollSubmissions() {
+    // The first page is revalidated with its ETag: the server answers 304
+    // (no body) until a submission changes
+    if (document.hidden || !submissionsEtag) return;
+
+    fetch(submissionsUrl(null), {cache: 'no-store', headers: {'If-None-Match': submissionsEtag}})
+    .then(response => {
+        if (response.status !== 200) return;
+        submissionsEtag = response.headers.get('ETag');
+        return response.json().then(showFirstSubmissionsPage);
+    })
+    .catch(error => console.error('Error:', error));
+}
+
 function displaySubmissions(submissions) {
     const submissionsDiv = document.getElementById('submissions-list');
 
@@ -253,43 +449,15 @@ function displaySubmissions(submissions) {
             </a>
         `;
     });
+    if (submissionsCursor) {
+        html += '<button onclick="loadMoreSubmissions()" class="action-btn btn-secondary" style="margin-top: 15px;">Load more</button>';
+    }
     submissionsDiv.innerHTML = html;
 }
 
-function filterAndSortSubmissions() {
-    const searchTerm = document.getElementById('search-submissions').value.toLowerCase();
-    const sortOption = document.getElementById('sort-submissions').value;
-
-    // Filter
-    let filtered = allSubmissions.filter(sub =>
-        sub.student_name.toLowerCase().includes(searchTerm)
-    );
-
-    // Sort
-    filtered.sort((a, b) => {
-        switch(sortOption) {
-            case 'percentage-desc':
-                return b.percentage - a.percentage;
-            case 'percentage-asc':
-                return a.percentage - b.percentage;
-            case 'name-asc':
-                return a.student_name.localeCompare(b.student_name);
-            case 'name-desc':
-                return b.student_name.localeCompare(a.student_name);
-            case 'date-desc':
-                return new Date(b.submitted_at) - new Date(a.submitted_at);
-            case 'date-asc':
-                return new Date(a.submitted_at) - new Date(b.submitted_at);
-            default:
-                return 0;
-        }
-    });
-
-    displaySubmissions(filtered);
-}
-
-// Load submissions on page load
+// Load submissions on page load, and pick up changes while the page is open
 loadSubmissions();
+setInterval(pollSubmissions, SUBMISSIONS_POLL_MS);
 
 function showAnalytics() {
     const section = document.getElementById('analytics-section');
@@ -0,0 +1,70 @@
+"""
+Benchmark the parallel batch OMR engine.
+
+Grades the same set of synthetic answer sheets with a growing number of
+workers and prints sheets/sec and speedup for each pool size.
+
+Usage:
+    python utils/benchmark_batch_grading.py [--sheets 96] [--mode process|thread] [--legacy]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'smartgrader_app'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'pdf_generator'))
+
+from accounts.batch_grader import process_omr_batch, default_worker_count
+from pdf_generator import answer_sheet_layout
+from synthetic_sheets import write_sheet_set
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sheets', type=int, default=96)
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--options', type=int, default=5)
+    parser.add_argument('--mode', choices=['process', 'thread'], default='process')
+    parser.add_argument('--max-workers', type=int, default=default_worker_count())
+    parser.add_argument('--legacy', action='store_true', help='decode without a layout template')
+    args = parser.parse_args()
+
+    worker_counts = [1]
+    while worker_counts[-1] * 2 <= args.max_workers:
+        worker_counts.append(worker_counts[-1] * 2)
+    if worker_counts[-1] != args.max_workers:
+        worker_counts.append(args.max_workers)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sheets = write_sheet_set(tmp, args.sheets, args.questions, args.options)
+        paths = [path for path, _ in sheets]
+        layout = None if args.legacy else answer_sheet_layout(args.questions, args.options)
+
+        print("=" * 60)
+        print(f"BATCH GRADING BENCHMARK ({args.sheets} sheets, {args.mode} pool)")
+        print("=" * 60)
+        print(f"{'workers':>8} {'seconds':>10} {'sheets/sec':>12} {'speedup':>9}")
+
+        baseline = None
+        for workers in worker_counts:
+            start = time.perf_counter()
+            results = process_omr_batch(
+                paths, args.questions, args.options, layout=layout,
+                workers=workers, mode=args.mode, cv_threads=1
+            )
+            elapsed = time.perf_counter() - start
+
+            failed = sum(1 for r in results if not r['success'])
+            rate = len(paths) / elapsed
+            baseline = baseline or rate
+            note = f"  ({failed} failed)" if failed else ""
+            print(f"{workers:>8} {elapsed:>10.2f} {rate:>12.1f} {rate / baseline:>8.2f}x{note}")
+
+        print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark the vectorized bubble scoring kernel.
+
+Compares the previous per-cell loop (vsplit/hsplit + countNonZero) with
+score_bubbles, one sheet at a time as the OMR pipeline calls it.
+
+Usage:
+    python utils/benchmark_bubble_kernel.py [--sheets 300]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'smartgrader_app'))
+
+from accounts.omr_processor import score_bubbles
+
+
+def loop_detect(img, num_questions, num_options):
+    """Reference implementation: one countNonZero per cell"""
+    height, width = img.shape
+    target_height = (height // num_questions) * num_questions
+    target_width = (width // num_options) * num_options
+    if height != target_height or width != target_width:
+        img = cv2.resize(img, (target_width, target_height))
+
+    answers = []
+    for row in np.vsplit(img, num_questions):
+        counts = [cv2.countNonZero(col) for col in np.hsplit(row, num_options)]
+        answers.append(int(np.argmax(counts)) if max(counts) else -1)
+    return answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sheets', type=int, default=300)
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--options', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    sheets = np.where(rng.random((args.sheets, 700, 550)) > 0.8, 255, 0).astype(np.uint8)
+
+    start = time.perf_counter()
+    expected = [loop_detect(sheet, args.questions, args.options) for sheet in sheets]
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    kernel = [score_bubbles(sheet, args.questions, args.options)[1].tolist() for sheet in sheets]
+    kernel_time = time.perf_counter() - start
+
+    assert kernel == expected
+
+    print("=" * 60)
+    print(f"BUBBLE KERNEL BENCHMARK ({args.sheets} sheets, {args.questions}x{args.options})")
+    print("=" * 60)
+    print(f"per-cell loop        {loop_time * 1000:>10.1f} ms")
+    print(f"kernel               {kernel_time * 1000:>10.1f} ms  ({loop_time / kernel_time:.1f}x)")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
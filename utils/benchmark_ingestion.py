@@ -0,0 +1,136 @@
+"""
+Benchmark upload ingestion: temp-file round trip vs in-memory decoding.
+
+For simulated phone photos held in memory (like Django's upload buffers),
+compares the previous ingestion path (write a temp file, cv2.imread it in
+color, convert to gray, read the file again to store it) with decoding the
+buffer in place straight to grayscale and storing the bytes once.
+
+Prints ms/sheet, peak Python-visible memory (NumPy/OpenCV arrays included)
+and bytes read/written through the OS per sheet.
+
+Usage:
+    python utils/benchmark_ingestion.py [--sheets 10] [--dpi 300] [--reduction 2]
+"""
+
+import argparse
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'smartgrader_app'))
+
+from accounts.omr_processor import decode_sheet_image
+from synthetic_sheets import render_answer_page, render_photo
+
+
+def io_counters():
+    """(bytes read, bytes written) by this process so far, (0, 0) if unavailable"""
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except OSError:
+        return 0, 0
+
+
+def copy_chunks(source, destination, chunk_size=64 * 1024):
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        destination.write(chunk)
+
+
+def ingest_temp_file(upload, tmp, storage):
+    """Previous path: temp file, color imread, second read for storage"""
+    temp_path = os.path.join(tmp, 'upload.jpg')
+    upload.seek(0)
+    with open(temp_path, 'wb') as f:
+        copy_chunks(upload, f)
+
+    img = cv2.imread(temp_path)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    with open(temp_path, 'rb') as f:
+        content = f.read()
+    with open(os.path.join(storage, 'stored.jpg'), 'wb') as f:
+        f.write(content)
+    os.remove(temp_path)
+    return gray
+
+
+def ingest_in_memory(upload, storage, reduction):
+    """New path: decode the buffer in place, store the bytes once"""
+    buffer = upload.getbuffer()
+    gray = decode_sheet_image(buffer, reduction)
+    buffer.release()
+
+    upload.seek(0)
+    with open(os.path.join(storage, 'stored.jpg'), 'wb') as f:
+        copy_chunks(upload, f)
+    return gray
+
+
+def measure(fn, uploads):
+    tracemalloc.start()
+    read_before, written_before = io_counters()
+    start = time.perf_counter()
+    for upload in uploads:
+        fn(upload)
+    elapsed = time.perf_counter() - start
+    read_after, written_after = io_counters()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = len(uploads)
+    return (elapsed * 1000 / count, peak / 2**20,
+            (read_after - read_before) / count / 2**20, (written_after - written_before) / count / 2**20)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sheets', type=int, default=10)
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--reduction', type=int, choices=[1, 2, 4, 8], default=2)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    uploads = []
+    for _ in range(args.sheets):
+        page = render_answer_page([rng.randrange(5) for _ in range(20)], 5, args.dpi)
+        _, encoded = cv2.imencode('.jpg', render_photo(page, rng), [cv2.IMWRITE_JPEG_QUALITY, 90])
+        uploads.append(io.BytesIO(encoded.tobytes()))
+
+    tmp = tempfile.mkdtemp()
+    storage = tempfile.mkdtemp()
+    try:
+        rows = [
+            ('temp file + imread', measure(lambda u: ingest_temp_file(u, tmp, storage), uploads)),
+            ('in-memory, full res', measure(lambda u: ingest_in_memory(u, storage, 1), uploads)),
+            (f'in-memory, 1/{args.reduction} res',
+             measure(lambda u: ingest_in_memory(u, storage, args.reduction), uploads)),
+        ]
+    finally:
+        shutil.rmtree(tmp)
+        shutil.rmtree(storage)
+
+    size_mb = sum(len(u.getvalue()) for u in uploads) / len(uploads) / 2**20
+    print("=" * 72)
+    print(f"INGESTION BENCHMARK ({args.sheets} photos, {size_mb:.1f} MB JPEG each)")
+    print("=" * 72)
+    print(f"{'path':<24} {'ms/sheet':>10} {'peak MB':>10} {'read MB':>10} {'written MB':>12}")
+    for name, (ms, peak, read, written) in rows:
+        print(f"{name:<24} {ms:>10.1f} {peak:>10.1f} {read:>10.2f} {written:>12.2f}")
+    print("=" * 72)
+
+
+if __name__ == '__main__':
+    main()
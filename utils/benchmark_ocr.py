@@ -0,0 +1,102 @@
+"""
+Benchmark the shared OCR service.
+
+Renders answer sheets with names in the Name/Surname boxes, crops the boxes
+the way the upload path does, and reads them once with one pytesseract call
+per box (a fresh tesseract process each time) and once through OCRService
+batches. Prints throughput, accuracy and the service latency metrics.
+
+Usage:
+    python utils/benchmark_ocr.py [--sheets 50] [--batch 16] [--workers 2] [--backend tesserocr|tesseract]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'smartgrader_app'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'pdf_generator'))
+
+from accounts import omr_processor
+from accounts.ocr_service import OCRService, available_backend, has_tesseract_binary
+from pdf_generator import answer_sheet_layout
+from synthetic_sheets import render_answer_page
+
+NAMES = ['Alice', 'Bruno', 'Chiara', 'David', 'Elena', 'Filip', 'Greta', 'Hugo', 'Ivana', 'Jonas']
+SURNAMES = ['Novak', 'Rossi', 'Keller', 'Moreau', 'Horvat', 'Silva', 'Berg', 'Kowalski']
+
+
+def name_boxes(count, num_questions, num_options, seed=0):
+    """Render `count` sheets and return (box images, expected texts)"""
+    rng = random.Random(seed)
+    layout = answer_sheet_layout(num_questions, num_options)
+    boxes, expected = [], []
+    for _ in range(count):
+        first, last = rng.choice(NAMES), rng.choice(SURNAMES)
+        answers = [rng.randrange(num_options) for _ in range(num_questions)]
+        page = render_answer_page(answers, num_options, dpi=150, first_name=first, last_name=last)
+        _, transform, _ = omr_processor.locate_answer_sheet(page, layout)
+        for field, text in [('first_name', first), ('last_name', last)]:
+            roi = omr_processor.crop_layout_roi(page, transform, layout, layout['name_boxes'][field])
+            boxes.append(omr_processor.NAME_OCR_VARIANTS[0][1](roi))
+            expected.append(text)
+    return boxes, expected
+
+
+def accuracy(results, expected):
+    texts = [omr_processor.clean_name_words(r['words'])[0] for r in results]
+    return sum(1 for text, want in zip(texts, expected) if text == want) / len(expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sheets', type=int, default=50)
+    parser.add_argument('--batch', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--backend', choices=['tesserocr', 'tesseract'], default=None)
+    args = parser.parse_args()
+
+    backend = args.backend or available_backend()
+    if backend is None:
+        print("No OCR backend available (install tesserocr or the tesseract binary)")
+        sys.exit(1)
+
+    boxes, expected = name_boxes(args.sheets, 20, 5)
+
+    print("=" * 60)
+    print(f"OCR SERVICE BENCHMARK ({len(boxes)} name boxes, backend {backend})")
+    print("=" * 60)
+
+    # Baseline: one pytesseract call (one tesseract process) per box
+    if has_tesseract_binary():
+        per_call = OCRService(workers=1, backend='tesseract')
+        start = time.perf_counter()
+        results = [per_call.recognize(box, psm=7, whitelist=omr_processor.OCR_NAME_WHITELIST) for box in boxes]
+        elapsed = time.perf_counter() - start
+        per_call.close()
+        print(f"per-call tesseract   {len(boxes) / elapsed:>8.1f} boxes/sec  "
+              f"accuracy {accuracy(results, expected):.0%}")
+
+    service = OCRService(workers=args.workers, backend=backend)
+    start = time.perf_counter()
+    futures = [
+        service.submit(boxes[i:i + args.batch], psm=7, whitelist=omr_processor.OCR_NAME_WHITELIST)
+        for i in range(0, len(boxes), args.batch)
+    ]
+    results = [result for future in futures for result in future.result()]
+    elapsed = time.perf_counter() - start
+    metrics = service.metrics()
+    service.close()
+
+    print(f"OCR service          {len(boxes) / elapsed:>8.1f} boxes/sec  "
+          f"accuracy {accuracy(results, expected):.0%}")
+    print("-" * 60)
+    for key, value in metrics.items():
+        print(f"{key:<14} {value}")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark the database queries role checks add to each page.
+
+Renders a few teacher and student pages with the Django test client against
+a throwaway SQLite database, counting the queries of each request and how
+many of them read the Profile table:
+
+- uncached: the role stamp is dropped before every request, so the role is
+  looked up in the database each time (what every request did before
+  accounts.middleware; the decorator and the context processor then each
+  ran their own Profile query)
+- cached: the role kept in the session is reused
+
+Usage:
+    python utils/benchmark_role_queries.py [--requests 20]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'smartgrader_app'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartgrader_app.settings')
+
+import django
+from django.conf import settings
+
+
+def setup_database(path):
+    settings.DATABASES['default']['NAME'] = path
+    settings.ALLOWED_HOSTS = ['*']
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def make_user(email, role):
+    from django.contrib.auth import get_user_model
+    from django.test import Client
+    from accounts.models import Profile
+
+    user = get_user_model().objects.create_user(email=email, password='benchmark', first_name='Bench', last_name='Mark')
+    Profile.objects.create(user=user, role=role)
+    client = Client()
+    client.force_login(user)
+    return user, client
+
+
+def count_queries(client, url, requests, drop_stamp):
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from accounts.middleware import role_stamp_key
+
+    total = profile = 0
+    for _ in range(requests):
+        if drop_stamp:
+            cache.delete(role_stamp_key(client.session['_auth_user_id']))
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+        total += len(queries)
+        profile += sum('"accounts_profile"' in query['sql'] for query in queries.captured_queries)
+    return total / requests, profile / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_database(os.path.join(tmp, 'benchmark.sqlite3'))
+        from django.urls import reverse
+
+        _, teacher = make_user('teacher@example.com', 'teacher')
+        _, student = make_user('student@example.com', 'student')
+        pages = [
+            ('landing (teacher)', teacher, reverse('landing')),
+            ('test list', teacher, reverse('test-list')),
+            ('student dashboard', student, reverse('student-dashboard')),
+        ]
+
+        print("=" * 72)
+        print(f"ROLE QUERY BENCHMARK ({args.requests} requests per page)")
+        print("=" * 72)
+        print(f"{'page':<20} {'uncached q/req':>15} {'profile':>8} {'cached q/req':>14} {'profile':>8}")
+        for name, client, url in pages:
+            uncached = count_queries(client, url, args.requests, drop_stamp=True)
+            client.get(url)
+            cached = count_queries(client, url, args.requests, drop_stamp=False)
+            print(f"{name:<20} {uncached[0]:>15.1f} {uncached[1]:>8.1f} {cached[0]:>14.1f} {cached[1]:>8.1f}")
+        print("=" * 72)
+
+
+if __name__ == '__main__':
+    main()
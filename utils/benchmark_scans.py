@@ -0,0 +1,100 @@
+"""
+Benchmark multi-page scan ingestion.
+
+Writes a synthetic class stack as one multi-page PDF (or TIFF) and grades
+it two ways, each in a fresh process:
+
+- rasterize-all: convert every page to a 300 DPI PNG first (kept in
+  memory here instead of on disk), then grade the images
+- streamed: split the scan into page references and let the grading pool
+  render each page at the layout template's DPI as it grades it
+
+Prints pages/sec, peak resident memory and correctly graded pages.
+
+Usage:
+    python utils/benchmark_scans.py [--pages 100] [--format pdf|tiff] [--workers 2] [--mode process]
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'smartgrader_app'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'pdf_generator'))
+
+from accounts.batch_grader import iter_omr_batch
+from accounts.scan_pages import iter_scan_pages, render_scan_page, template_dpi
+from pdf_generator import answer_sheet_layout
+from synthetic_sheets import write_scan_stack
+
+NAIVE_DPI = 300
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def grade_rasterize_all(path, layout, workers, mode):
+    pages = [
+        cv2.imencode('.png', render_scan_page(page._replace(dpi=NAIVE_DPI)))[1].tobytes()
+        for page in iter_scan_pages(path, path)
+    ]
+    return list(iter_omr_batch(pages, 20, 5, layout=layout, workers=workers, mode=mode))
+
+
+def grade_streamed(path, layout, workers, mode):
+    pages = iter_scan_pages(path, path)
+    return list(iter_omr_batch(pages, 20, 5, layout=layout, workers=workers, mode=mode))
+
+
+def run(name, path, stack, args, queue):
+    layout = answer_sheet_layout(20, 5)
+    fn = grade_rasterize_all if name == 'rasterize-all' else grade_streamed
+    start = time.perf_counter()
+    results = fn(path, layout, args.workers, args.mode)
+    elapsed = time.perf_counter() - start
+    correct = sum(1 for result, answers in zip(results, stack) if result['success'] and result['answers'] == answers)
+    queue.put((len(results) / elapsed, peak_rss_mb(), correct))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--format', choices=['pdf', 'tiff'], default='pdf')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--mode', choices=['process', 'thread'], default='process')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, f'stack.{args.format}')
+        stack = write_scan_stack(path, args.pages)
+        size_mb = os.path.getsize(path) / 2**20
+
+        print("=" * 64)
+        print(f"SCAN INGESTION BENCHMARK ({args.pages} pages, {args.format.upper()} {size_mb:.1f} MB, "
+              f"template {template_dpi(answer_sheet_layout(20, 5))} DPI)")
+        print("=" * 64)
+        print(f"{'path':<16} {'pages/sec':>10} {'peak RSS MB':>12} {'correct':>10}")
+        for name in ('rasterize-all', 'streamed'):
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=run, args=(name, path, stack, args, queue))
+            process.start()
+            rate, peak, correct = queue.get()
+            process.join()
+            print(f"{name:<16} {rate:>10.1f} {peak:>12.0f} {correct:>7}/{args.pages}")
+        print("=" * 64)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -101,6 +101,10 @@ try:
             print("   - My Tests (student dashboard)")
             print("   - Enrollment form")
 
+        # Roles are kept in sessions (accounts/middleware.py); this direct
+        # update does not reach them
+        print("\nℹ️  Signed-in sessions pick up the new role within 5 minutes (or on next login)")
+
 except ValueError:
     print("Invalid input.")
 except KeyboardInterrupt:
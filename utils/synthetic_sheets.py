@@ -0,0 +1,173 @@
+"""
+Render synthetic answer sheets for benchmarks.
+
+Draws the answer page from pdf_generator.answer_sheet_geometry (the same
+geometry the printed PDF uses) and fills in the requested bubbles, so the
+OMR pipeline can be exercised without a printer, a scanner or a PDF
+rasterizer.
+"""
+
+import os
+import random
+import sys
+
+import cv2
+import numpy as np
+import qrcode
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'pdf_generator'))
+
+from pdf_generator import answer_sheet_geometry
+
+
+def render_answer_page(answers, num_options=5, dpi=100, first_name=None, last_name=None, qr_data=None):
+    """
+    Render an answer page as a grayscale image.
+
+    Args:
+        answers: List of selected option indices (None leaves a row blank)
+        num_options: Number of options per question
+        dpi: Output resolution
+        first_name: Optional text written in the Name box
+        last_name: Optional text written in the Surname box
+        qr_data: Optional QR payload (see pdf_generator.sheet_qr_payload)
+
+    Returns:
+        uint8 grayscale image of the full A4 page
+    """
+    geometry = answer_sheet_geometry(len(answers), num_options)
+    scale = dpi / 72.0  # pixels per PDF point
+    page_width, page_height = geometry['page']
+    page = np.full((int(round(page_height * scale)), int(round(page_width * scale))), 255, dtype=np.uint8)
+
+    def pt(x, y):
+        # PDF points (origin bottom-left) to image pixels (origin top-left)
+        return int(round(x * scale)), int(round((page_height - y) * scale))
+
+    def rect(box):
+        x, y, w, h = box
+        cv2.rectangle(page, pt(x, y + h), pt(x + w, y), 0, thickness)
+
+    thickness = max(1, int(round(scale)))
+
+    marker = geometry['fiducial_size'] / 2
+    for x, y in geometry['fiducials']:
+        cv2.rectangle(page, pt(x - marker, y + marker), pt(x + marker, y - marker), 0, -1)
+
+    rect(geometry['name_box'])
+    rect(geometry['surname_box'])
+    rect(geometry['grid_box'])
+
+    if qr_data is not None:
+        x, y, w, h = geometry['qr_box']
+        (left, top), (right, bottom) = pt(x, y + h), pt(x + w, y)
+        qr = np.array(qrcode.make(qr_data).convert('L'))
+        page[top:bottom, left:right] = cv2.resize(qr, (right - left, bottom - top), interpolation=cv2.INTER_NEAREST)
+
+    for text, (x, y, w, h) in [(first_name, geometry['name_box']), (last_name, geometry['surname_box'])]:
+        if text:
+            cv2.putText(page, text, pt(x + 0.1 * w, y + 0.3 * h), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.5 * h * scale / 25, 0, thickness + 1)
+
+    radius = int(round(geometry['bubble_radius'] * scale))
+    for answer, y in zip(answers, geometry['question_y']):
+        for o, x in enumerate(geometry['option_x']):
+            center = pt(x, y)
+            cv2.circle(page, center, radius, 0, thickness)
+            if answer == o:
+                cv2.circle(page, center, int(radius * 0.8), 0, -1)
+
+    return page
+
+
+def render_photo(page, rng, clutter=20):
+    """
+    Simulate a phone photo of a printed page.
+
+    The page is placed with a random perspective tilt on a darker, noisy
+    background scattered with `clutter` random rectangles and lines.
+
+    Args:
+        page: Grayscale page image from render_answer_page
+        rng: random.Random instance
+        clutter: Number of clutter shapes drawn on the background
+
+    Returns:
+        uint8 BGR image
+    """
+    page_h, page_w = page.shape
+    out_w, out_h = int(page_w * 1.5), int(page_h * 1.4)
+
+    background = np.full((out_h, out_w), rng.randrange(60, 140), dtype=np.uint8)
+    for _ in range(clutter):
+        x0, y0 = rng.randrange(out_w), rng.randrange(out_h)
+        x1, y1 = x0 + rng.randrange(-300, 300), y0 + rng.randrange(-300, 300)
+        color = rng.randrange(0, 256)
+        if rng.random() < 0.5:
+            cv2.rectangle(background, (x0, y0), (x1, y1), color, rng.choice([-1, 3, 8]))
+        else:
+            cv2.line(background, (x0, y0), (x1, y1), color, rng.randrange(2, 12))
+
+    # Random perspective: jitter the page corners around a centered position
+    ox, oy = (out_w - page_w) / 2, (out_h - page_h) / 2
+    jitter = 0.08 * page_w
+    src = np.float32([[0, 0], [page_w, 0], [page_w, page_h], [0, page_h]])
+    dst = np.float32([
+        [ox + rng.uniform(-jitter, jitter), oy + rng.uniform(-jitter, jitter)]
+        for ox, oy in [(ox, oy), (ox + page_w, oy), (ox + page_w, oy + page_h), (ox, oy + page_h)]
+    ])
+    M = cv2.getPerspectiveTransform(src, dst)
+    warped = cv2.warpPerspective(page, M, (out_w, out_h), borderValue=0)
+    mask = cv2.warpPerspective(np.full_like(page, 255), M, (out_w, out_h))
+
+    photo = np.where(mask > 0, warped, background)
+    noise = np.random.default_rng(rng.randrange(1 << 30)).normal(0, 6, photo.shape)
+    photo = np.clip(photo + noise, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(photo, cv2.COLOR_GRAY2BGR)
+
+
+def write_sheet_set(directory, count, num_questions=20, num_options=5, dpi=100, seed=0, photo=False,
+                    qr_data=None):
+    """
+    Write `count` random answer sheets as PNG files.
+
+    With photo=True the sheets are written as simulated phone photos
+    (see render_photo) instead of flat scans. qr_data is printed in the QR
+    box of every sheet.
+
+    Returns:
+        List of (path, answers) tuples
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    sheets = []
+    for i in range(count):
+        answers = [rng.randrange(num_options) for _ in range(num_questions)]
+        path = os.path.join(directory, f"sheet_{i:04d}.png")
+        page = render_answer_page(answers, num_options, dpi, qr_data=qr_data)
+        cv2.imwrite(path, render_photo(page, rng) if photo else page)
+        sheets.append((path, answers))
+    return sheets
+
+
+def write_scan_stack(path, count, num_questions=20, num_options=5, dpi=200, seed=0, qr_data=None):
+    """
+    Write `count` random answer sheets as one multi-page PDF or TIFF,
+    like a document scanner does for a class stack (the extension of
+    `path` picks the format). Pages are rendered one at a time.
+
+    Returns:
+        List of the answers on each page
+    """
+    from PIL import Image
+
+    rng = random.Random(seed)
+    stack = [[rng.randrange(num_options) for _ in range(num_questions)] for _ in range(count)]
+    pages = (Image.fromarray(render_answer_page(answers, num_options, dpi, qr_data=qr_data)) for answers in stack)
+
+    first = next(pages)
+    if path.lower().endswith('.pdf'):
+        first.save(path, 'PDF', save_all=True, append_images=pages, resolution=dpi)
+    else:
+        first.save(path, 'TIFF', save_all=True, append_images=pages, compression='tiff_deflate', dpi=(dpi, dpi))
+    return stack